@@ -0,0 +1,28 @@
+"""
+Deletion of a user's account and everything that belongs to it.
+
+The rows are removed with bulk statements, children before parents, so no
+statement leaves a row pointing at a deleted one: foreign keys are enforced
+by MySQL (InnoDB) and by SQLite with foreign_keys=ON. Bulk deletes bypass the
+ORM cascades and session hooks, so every table referencing the user, their
+conversations or their documents has to be handled here, the search index
+included.
+"""
+from sqlalchemy import delete, select
+
+import search
+from models import Answer, Conversation, Document, DocumentVersion, Job, User
+
+
+def delete_user(session, user_id):
+    """Delete a user with every row they own and their search entries; the caller commits"""
+    search.remove_user(session, user_id)
+    conversation_ids = select(Conversation.id).where(Conversation.user_id == user_id)
+    session.execute(delete(Answer).where(Answer.conversation_id.in_(conversation_ids)))
+    session.execute(delete(Conversation).where(Conversation.user_id == user_id))
+    document_ids = select(Document.id).where(Document.user_id == user_id)
+    session.execute(delete(DocumentVersion).where(DocumentVersion.document_id.in_(document_ids)))
+    session.execute(delete(Document).where(Document.user_id == user_id))
+    # Queued and finished jobs carry the user's questions in their payload
+    session.execute(delete(Job).where(Job.user_id == user_id))
+    session.execute(delete(User).where(User.id == user_id))
@@ -1,10 +1,13 @@
+import time
+_import_started = time.perf_counter()
+
 try:
     import pymysql
     pymysql.install_as_MySQLdb()
 except ImportError:
     print("Warning: PyMySQL not available")
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory, url_for
+from flask import Flask, render_template, request, jsonify, session, send_from_directory, url_for, Response, stream_with_context
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
@@ -13,26 +16,48 @@ import os
 import json
 import re
 import warnings
-import faiss
-import pickle
-import markdown
-from langchain.chains import RetrievalQA
-from sentence_transformers import CrossEncoder
-from openai import OpenAI
-from langchain_core.runnables import Runnable
 from datetime import datetime, timedelta
 import uuid
 from email_service import EmailService
 from config import get_config
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import logging
-from logging.handlers import RotatingFileHandler
+from logging_setup import configure_logging
 import hashlib
+import hmac
+import click
 from models import db
 from sqlalchemy.dialects import mysql
+from coalescing import SingleFlight
+from llm_backends import benchmark_backends, print_benchmark
+from jobs import job_queue, job_to_dict
+from session_store import SqlAlchemySessionInterface
+from questionnaire import parse_questions, answer_questionnaire, render_document, QuestionnaireError
+from resources import warmup, get_reranker, describe_memory
+from warmup import log_import_profile
+from health import check_database, readiness_report
+from static_assets import StaticAssets
+from metrics import REGISTRY, CONTENT_TYPE, track_commits
+from sqlalchemy.orm import Session as OrmSession
+from tracing import TracingMiddleware, trace_commits
+from profiling import profiler, admin_required, is_admin
+from autosave_buffer import autosave_buffer, PatchError, VersionConflict
+import document_versions
+import query_audit
+import sqlite_profile
+import search
+import export
+from write_behind import chat_writer, release_connection
+from accounts import delete_user
+from queries import list_conversations, page_size, window_args, message_window, window_meta, compact_turns
+from rag import (llm_router, get_llm_response, request_llm_response, process_company_description, select_vectorstore,
+                 build_answer_prompt, answer_question, load_conversation_history)
 
 app = Flask(__name__, static_folder='./build', template_folder='./build')
+# Every request gets a trace id (X-Trace-Id response header) and timed spans
+app.wsgi_app = TracingMiddleware(app.wsgi_app)
+# Log records are queued and written by a background thread (see logging_setup.py)
+configure_logging(app)
 
 # Apply configuration 
 config_class = get_config()
@@ -52,7 +77,11 @@ if app.config.get('FLASK_ENV') == 'production':
         'pool_pre_ping': True,
         'pool_recycle': 300,
         'pool_timeout': 20,
-        'max_overflow': 20,
+        # Every request thread of a gthread worker may hold a connection at once, so the pool
+        # defaults to GUNICORN_THREADS, plus overflow for the background threads (jobs, autosave,
+        # write-behind); see gunicorn.conf.py
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 64))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
         'connect_args': {
             'ssl_disabled': False,
             'ssl_verify_cert': False,
@@ -63,30 +92,30 @@ if app.config.get('FLASK_ENV') == 'production':
     }
     app.logger.info("Applied production database configuration")
 
+# Single-node deployments on a SQLite file: WAL, pragmas and pooling (see sqlite_profile.py)
+sqlite_profile.init_app(app)
+
 # Initialize the database with the app
 db.init_app(app)
+job_queue.init_app(app)
+autosave_buffer.init_app(app)
+chat_writer.init_app(app)
+track_commits(OrmSession)
+trace_commits(OrmSession)
+document_versions.track_history(OrmSession)
+search.track_search(OrmSession)
+query_audit.init_app(app)
 # Añadir función para verificar conexión
 def verify_db_connection():
     """Verificar que la conexión a la base de datos funciona"""
-    try:
-        with app.app_context():
-            db.engine.execute('SELECT 1')
+    with app.app_context():
+        result = check_database(db)
+    if result['status'] == 'ready':
         app.logger.info("✅ Conexión a base de datos verificada")
         return True
-    except Exception as e:
-        app.logger.error(f"❌ Error de conexión a base de datos: {str(e)}")
-        return False
-
-if not os.path.exists('logs'):
-    os.mkdir('logs')
-
-file_handler = RotatingFileHandler('logs/esrs_generator.log', maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
+    app.logger.error(f"❌ Error de conexión a base de datos: {result['error']}")
+    return False
+
 app.logger.info('ESGenerator startup')
 
 limiter = Limiter(
@@ -114,119 +143,27 @@ login_manager.login_view = 'login'
 
 email_service = EmailService(app)
 
+# Admin-only request profiling and memory snapshots; a no-op unless PROFILING_ENABLED=1.
+# Set up before warm-up so tracemalloc (PROFILING_TRACEMALLOC=1) sees models being loaded.
+profiler.init_app(app, memory_report=describe_memory)
+
 warnings.filterwarnings("ignore")
 
-from models import User, Conversation, Answer, Document
+from models import User, Conversation, Answer, Document, DocumentVersion, Job
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-api_key = os.environ.get('NVIDIA_API_KEY')
-if not api_key:
-    app.logger.error("NVIDIA_API_KEY environment variable not set")
-    raise ValueError("NVIDIA_API_KEY environment variable is required")
-
-
-client = OpenAI(
-    base_url="https://integrate.api.nvidia.com/v1",
-    api_key=api_key
-)
-
-def load_vectorstore(db_folder):
-    db_path = os.path.join("vectorstores", db_folder)
-    
-    if not os.path.exists(db_path):
-        app.logger.error(f"Vectorstore path not found: {db_path}")
-        raise FileNotFoundError(f"Vectorstore path not found: {db_path}")
-
-    try:
-        index = faiss.read_index(os.path.join(db_path, "index.faiss"))
-
-        with open(os.path.join(db_path, "vectorstore.pkl"), "rb") as f:
-            vectorstore = pickle.load(f)
-
-        vectorstore.index = index
-        return vectorstore
-    except Exception as e:
-        app.logger.error(f"Error loading vectorstore: {str(e)}")
-        raise
-
-
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L6-v2")
-
-def get_llm_response(prompt):
-    try:
-        completion = client.chat.completions.create(
-            model="nvidia/llama-3.3-nemotron-super-49b-v1",
-            messages=[{"role": "system", "content": "Be brief."
-            "Only return the most COMPLETE and accurate answer. "
-            "Avoid introductions, and additional context. "
-            "No need to introduce a summary at the end. "},
-                    {"role": "user", "content": prompt}],
-            temperature=0,
-            top_p=0.1,
-            max_tokens=112000,
-            frequency_penalty=0.1,
-            presence_penalty=0,
-            stream=False
-        )
-        return completion.choices[0].message.content.strip()
-    except Exception as e:
-        app.logger.error(f"Error getting LLM response: {str(e)}")
-        return "I'm sorry, I encountered an error processing your request. Please try again later."
-
-class NvidiaLLM(Runnable):
-    def invoke(self, input):
-        return get_llm_response(input["query"])
-
-def load_chain(vectorstore):
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})
-    return RetrievalQA.from_chain_type(
-        llm=NvidiaLLM(),
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True
-    )
-
-try:
-    nace_vs = load_vectorstore("nace_db")
-    default_vs = load_vectorstore("default_db")
-
-    sector_vectorstores = {}
-    merged_vectorstores = {}
-
-    sector_db_map = {
-        "Oil & Gas Company": "oil_gas_db",
-        "Mining, Quarrying and Coal": "mining_db",
-        "Road Transport": "road_db"
-    }
-
-    for sector, db_name in sector_db_map.items():
-        sector_vectorstores[sector] = load_vectorstore(db_name)
-
-        sector_vs = sector_vectorstores[sector]
-
-        default_docs = default_vs.similarity_search("", k=100000)  
-        
-        sector_docs = sector_vs.similarity_search("", k=100000) 
-        
-        all_docs = default_docs + sector_docs
-        
-        merged_vectorstores[sector] = {
-            'vectorstore': sector_vs,
-            'docs': all_docs
-        }
-except Exception as e:
-    app.logger.error(f"Error loading vector stores: {str(e)}")
-
-try:
-    with open("sector_classification.json", "r", encoding="utf-8") as f:
-        special_sectors = json.load(f)
-except Exception as e:
-    app.logger.error(f"Error loading sector classification: {str(e)}")
-
-nace_chain = load_chain(nace_vs)
+# Models and indexes load in parallel threads so the process can start serving
+# right away: in the background (default), before the import finishes
+# (WARMUP_MODE=blocking, used when gunicorn preloads the app) or only when
+# first needed (lazy).
+WARMUP_MODE = os.environ.get('WARMUP_MODE', 'background')
+if WARMUP_MODE == 'blocking':
+    warmup.start(wait=True)
+elif WARMUP_MODE == 'background':
+    warmup.start()
 
 
 def generate_csrf_token():
@@ -239,24 +176,31 @@ def validate_csrf_token(token):
 
 app.jinja_env.globals['csrf_token'] = generate_csrf_token
 
+# The built frontend is read once and served from memory with precompressed
+# variants and cache headers
+static_assets = StaticAssets(app.static_folder)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(app.static_folder + '/' + path):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.template_folder, 'index.html')
+    static_file = static_assets.lookup(path) if path else None
+    if static_file is None:
+        static_file = static_assets.index_file()
+        if static_file is None:
+            return send_from_directory(app.template_folder, 'index.html')
+    return static_assets.respond(static_file, request)
 
 @app.route('/chat', methods=['POST'])
 @limiter.limit("30 per minute")
 def chat():
     user_message = request.form['message']
-    app.logger.info(f"Chat message received. Session data: {dict(session)}")
-    
     conversation_id = session.get('conversation_id')
+    app.logger.info(f"Chat message received for conversation {conversation_id}")
     
     if 'initialized' not in session:
         company_desc = user_message
+        current_user_id = current_user.id if current_user.is_authenticated else None
+        release_connection()
         result = process_company_description(company_desc)
         
         session['initialized'] = True
@@ -264,10 +208,12 @@ def chat():
         session['nace_sector'] = result['nace_sector']
         session['esrs_sector'] = result['esrs_sector']
         
+        welcome = f"Thank you for your company description. Based on my analysis, your company falls under NACE sector {result['nace_sector']}. How can I help you with your ESRS reporting requirements?"
+        
+        # The new conversation and its first answer are saved in one commit
+        conversation = None
         if not conversation_id:
-            current_user_id = current_user.id if current_user.is_authenticated else None
             app.logger.info(f"Creating new conversation for user_id: {current_user_id}")
-            
             conversation = Conversation(
                 user_id=current_user_id,
                 nace_sector=result['nace_sector'],
@@ -275,53 +221,93 @@ def chat():
                 esrs_sector=result['esrs_sector'],
                 company_description=company_desc
             )
-            db.session.add(conversation)
-            db.session.commit()
-            
+        chat_writer.save_turn(conversation_id, user_message, welcome, conversation=conversation)
+        
+        if conversation is not None:
             session['conversation_id'] = conversation.id
             conversation_id = conversation.id
         
-        if 'conversation_history' not in session:
-            session['conversation_history'] = []
-        
         session.modified = True
         
-        answer = Answer(
-            conversation_id=conversation_id,
-            question=user_message,
-            answer=f"Thank you for your company description. Based on my analysis, your company falls under NACE sector {result['nace_sector']}. How can I help you with your ESRS reporting requirements?"
-        )
-        db.session.add(answer)
-        db.session.commit()
-        
         return jsonify({
-            'answer': f"Thank you for your company description. Based on my analysis, your company falls under NACE sector {result['nace_sector']}. How can I help you with your ESRS reporting requirements?",
+            'answer': welcome,
             'context': '',
             'is_first_message': True,
             'nace_sector': result['nace_sector'],
             'esrs_sector': result['esrs_sector']
         })
+    elif wants_async():
+        job = job_queue.enqueue('chat', {
+            'question': user_message,
+            'esrs_sector': session.get('esrs_sector', 'Agnostic'),
+            'conversation_history': load_conversation_history(conversation_id),
+            'conversation_id': conversation_id
+        }, user_id=current_user.id if current_user.is_authenticated else None)
+        remember_job(job.id)
+        
+        return jsonify({'job_id': job.id, 'status': job.status}), 202
     else:
-        response = process_question(user_message)
-        response_data = response.get_json()
-        
-        conversation_history = session.get('conversation_history', [])
-        conversation_history.append(f"Q: {user_message}")
-        conversation_history.append(f"A: {response_data['answer']}")
-        session['conversation_history'] = conversation_history
-        session.modified = True
+        result = process_question(user_message)
         
         if conversation_id:
-            answer = Answer(
-                conversation_id=conversation_id,
-                question=user_message,
-                answer=response_data['answer']
-            )
-            db.session.add(answer)
-            db.session.commit()
+            chat_writer.save_turn(conversation_id, user_message, result['markdown'], html=result['answer'])
         
-        return response
+        return jsonify({
+            'answer': result['markdown'] if answer_format() == 'markdown' else result['answer'],
+            'context': result['context'],
+            'is_first_message': False
+        })
+
+
+def answer_format():
+    """Representation of answers requested by the client: 'html' (default) or 'markdown'"""
+    return 'markdown' if request.args.get('format') == 'markdown' else 'html'
+
+def chat_messages(conversation_id):
+    """Message window of a conversation as chat messages, plus its paging fields"""
+    limit, before_id, compact = window_args(request.args)
+    answers, has_more = message_window(conversation_id, limit, before_id)
+    fmt = answer_format()
+    if compact:
+        messages = compact_turns(answers, fmt)
+    else:
+        messages = []
+        for answer in answers:
+            messages.append({'type': 'user', 'content': answer.question})
+            messages.append({'type': 'bot', 'content': answer.content(fmt)})
+    return messages, window_meta(answers, has_more)
+
+def wants_async():
+    """Whether the client asked for work to be queued instead of answered inline"""
+    flag = request.args.get('async') or request.form.get('async')
+    return flag in ('1', 'true', 'yes')
+
+def remember_job(job_id):
+    # Anonymous users can only poll jobs started from their own session
+    job_ids = session.get('job_ids', [])[-19:]
+    job_ids.append(job_id)
+    session['job_ids'] = job_ids
+    session.modified = True
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status; pass ?wait=<seconds> to block until the job finishes (max 30s)"""
+    job = db.session.get(Job, job_id)
+    
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    
+    if job.user_id is not None:
+        if not current_user.is_authenticated or current_user.id != job.user_id:
+            return jsonify({'message': 'Job not found'}), 404
+    elif job_id not in session.get('job_ids', []):
+        return jsonify({'message': 'Job not found'}), 404
+    
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    if wait > 0:
+        job = job_queue.wait(job_id, wait)
+    
+    return jsonify(job_to_dict(job)), 200
 
 @app.route('/chat/get_conversation', methods=['GET'])
 def get_conversation():
@@ -336,34 +322,20 @@ def get_conversation():
         })
     
     messages = []
+    paging = {'has_more': False, 'oldest_id': None}
     conversation_id = session.get('conversation_id')
     
     if conversation_id:
         conversation = Conversation.query.filter_by(id=conversation_id).first()
         if conversation:
-            answers = Answer.query.filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
-            for answer in answers:
-                messages.append({'type': 'user', 'content': answer.question})
-                messages.append({'type': 'bot', 'content': answer.answer})
-    else:
-        conversation_history = session.get('conversation_history', [])
-        for i in range(0, len(conversation_history), 2):
-            if i < len(conversation_history) and conversation_history[i].startswith('Q: '):
-                messages.append({
-                    'type': 'user', 
-                    'content': conversation_history[i][3:]
-                })
-            if i + 1 < len(conversation_history) and conversation_history[i+1].startswith('A: '):
-                messages.append({
-                    'type': 'bot', 
-                    'content': conversation_history[i+1][3:]
-                })
+            messages, paging = chat_messages(conversation_id)
     
     return jsonify({
         'initialized': True,
         'nace_sector': session.get('nace_sector', ''),
         'esrs_sector': session.get('esrs_sector', ''),
         'messages': messages,
+        **paging,
         'company_desc': session.get('company_desc', '')
     })
 
@@ -373,7 +345,6 @@ def debug_conversation():
     data = {
         'session_keys': list(session.keys()),
         'conversation_id': conversation_id,
-        'session_conversation_history': session.get('conversation_history', []),
         'session_initialized': session.get('initialized', False)
     }
     
@@ -386,7 +357,7 @@ def debug_conversation():
                 'nace_sector': conversation.nace_sector,
                 'created_at': conversation.created_at.isoformat()
             }
-            answers = Answer.query.filter_by(conversation_id=conversation_id).all()
+            answers = Answer.query.options(db.undefer_group('body')).filter_by(conversation_id=conversation_id).all()
             data['db_answers'] = [
                 {
                     'id': a.id,
@@ -402,6 +373,12 @@ def debug_conversation():
     return jsonify(data)
 
 app.config['SESSION_COOKIE_NAME'] = 'session'
+
+# Keep session data server-side; the cookie only holds a signed session id.
+# SESSION_BACKEND=cookie restores Flask's default signed-cookie sessions.
+if os.environ.get('SESSION_BACKEND', 'sqlalchemy') == 'sqlalchemy':
+    app.session_interface = SqlAlchemySessionInterface(
+        db, skip=lambda request: static_assets.lookup(request.path.lstrip('/')) is not None)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SECURE'] = False  
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
@@ -431,15 +408,16 @@ def save_content():
             # Update existing document
             document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
             if document:
-                document.content = content
-                document.updated_at = datetime.utcnow()
+                autosave_buffer.discard(document.id)
+                document.replace_content(content)
                 db.session.commit()
                 
                 app.logger.info(f"Document updated by user {current_user.id}: {document_id}")
                 return jsonify({
                     'status': 'success', 
                     'message': 'Content updated successfully',
-                    'document_id': document.id
+                    'document_id': document.id,
+                    'version': document.version
                 })
             else:
                 return jsonify({'status': 'error', 'message': 'Document not found'}), 404
@@ -457,7 +435,8 @@ def save_content():
             return jsonify({
                 'status': 'success', 
                 'message': 'Content saved successfully',
-                'document_id': document.id
+                'document_id': document.id,
+                'version': document.version
             })
             
     except Exception as e:
@@ -465,6 +444,47 @@ def save_content():
         db.session.rollback()
         return jsonify({'status': 'error', 'message': 'Error saving content'}), 500
 
+# Backend URLs, models and health are internal: administrators only (see profiling.is_admin)
+@app.route('/stats/coalescing', methods=['GET'])
+@admin_required
+def coalescing_stats():
+    return jsonify(SingleFlight.all_stats())
+
+@app.route('/stats/llm', methods=['GET'])
+@admin_required
+def llm_stats():
+    return jsonify(llm_router.stats())
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Prometheus metrics of this worker, for a bearer METRICS_TOKEN or, without one, administrators only"""
+    # Per-sector volumes, backend names and error rates are as sensitive as /stats/*
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return jsonify({'message': 'Unauthorized'}), 401
+    elif not is_admin():
+        return jsonify({'message': 'Administrator access required'}), 403
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/warmup/status', methods=['GET'])
+def warmup_status():
+    return jsonify(warmup.progress())
+
+@app.route('/health/live', methods=['GET'])
+@limiter.exempt
+def health_live():
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/health', methods=['GET'])
+@app.route('/health/ready', methods=['GET'])
+@limiter.exempt
+def health_ready():
+    """Per-component readiness: models and indexes, database and LLM gateway"""
+    report, ready = readiness_report(warmup, db, llm_router, lazy=WARMUP_MODE == 'lazy')
+    return jsonify(report), 200 if ready else 503
+
 @app.route('/reset', methods=['POST'])
 def reset_session():
     try:
@@ -482,7 +502,7 @@ def reset_session():
 def load_conversation(conversation_id):
     try:
         # Verificar que la conversación pertenece al usuario actual
-        conversation = Conversation.query.filter_by(
+        conversation = Conversation.query.options(db.undefer(Conversation.company_description)).filter_by(
             id=conversation_id, 
             user_id=current_user.id
         ).first()
@@ -509,12 +529,8 @@ def load_conversation(conversation_id):
         session['nace_sector'] = conversation.nace_sector
         session['esrs_sector'] = conversation.esrs_sector
         
-        # Cargar mensajes de la conversación
-        answers = Answer.query.filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
-        messages = []
-        for answer in answers:
-            messages.append({'type': 'user', 'content': answer.question})
-            messages.append({'type': 'bot', 'content': answer.answer})
+        # Cargar los últimos mensajes de la conversación (?limit=0 para ninguno)
+        messages, paging = chat_messages(conversation_id)
         
         session.modified = True
         
@@ -526,7 +542,8 @@ def load_conversation(conversation_id):
                 'nace_sector': conversation.nace_sector,
                 'esrs_sector': conversation.esrs_sector,
                 'company_description': conversation.company_description,
-                'messages': messages
+                'messages': messages,
+                **paging
             }
         })
     except Exception as e:
@@ -696,17 +713,10 @@ def delete_account():
         
         logout_user()
         
-        conversations = Conversation.query.filter_by(user_id=user_id).all()
-        for conversation in conversations:
-            Answer.query.filter_by(conversation_id=conversation.id).delete()
-        
-        Conversation.query.filter_by(user_id=user_id).delete()
-        
-        Document.query.filter_by(user_id=user_id).delete()
-        
-        user = User.query.get(user_id)
-        db.session.delete(user)
+        conversation_ids = [row.id for row in db.session.query(Conversation.id).filter_by(user_id=user_id)]
+        delete_user(db.session, user_id)
         db.session.commit()
+        chat_writer.discard(*conversation_ids)
         
         session.clear()
         
@@ -851,43 +861,83 @@ def get_csrf_token():
 @app.route('/user/conversations', methods=['GET'])
 @login_required
 def get_user_conversations():
-    conversations = Conversation.query.filter_by(user_id=current_user.id).order_by(Conversation.created_at.desc()).all()
-    
-    result = []
-    for conversation in conversations:
-        # Contar respuestas para esta conversación
-        answer_count = Answer.query.filter_by(conversation_id=conversation.id).count() // 2
-        
-        result.append({
-            'id': conversation.id,
-            'title': conversation.title,
-            'nace_sector': conversation.nace_sector,
-            'esrs_sector': conversation.esrs_sector,
-            'created_at': conversation.created_at.isoformat(),
-            'answer_count': answer_count,
-            'company_description': conversation.company_description[:150] + '...' if conversation.company_description and len(conversation.company_description) > 150 else conversation.company_description
-        })
+    try:
+        conversations, next_cursor = list_conversations(
+            current_user.id,
+            limit=page_size(request.args.get('limit')),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify(result), 200
+    return jsonify({'conversations': conversations, 'next_cursor': next_cursor}), 200
+
+@app.route('/user/search', methods=['GET'])
+@login_required
+@limiter.limit("60 per minute")
+def search_content():
+    """Ranked matches of ?q= in the user's conversations, answers and documents, paged with ?offset="""
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in search.KINDS:
+        return jsonify({'message': f"kind must be one of {', '.join(search.KINDS)}"}), 400
+    try:
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'message': 'Invalid offset'}), 400
+    
+    results, next_offset = search.search(
+        db.session,
+        current_user.id,
+        request.args.get('q', ''),
+        kind=kind,
+        limit=page_size(request.args.get('limit')),
+        offset=offset
+    )
+    return jsonify({'results': results, 'next_offset': next_offset}), 200
+
+@app.route('/user/export', methods=['GET'])
+@login_required
+@limiter.limit("10 per hour")
+def export_content():
+    """Stream all of the user's conversations, answers and documents as ?format=ndjson (default) or zip"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    
+    mimetype, extension = export.FORMATS[fmt]
+    user_id = current_user.id
+    filename = f"esgenerator-export-{datetime.utcnow().strftime('%Y%m%d')}.{extension}"
+    app.logger.info(f"Export ({fmt}) started by user {user_id}")
+    return Response(
+        stream_with_context(export.export_chunks(db.session, user_id, fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @app.route('/user/conversation/<int:conversation_id>', methods=['GET'])
 @login_required
 def get_conversation_details(conversation_id):
-    conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first()
+    conversation = Conversation.query.options(db.undefer(Conversation.company_description)).filter_by(
+        id=conversation_id, user_id=current_user.id).first()
     
     if not conversation:
         return jsonify({'message': 'Conversation not found'}), 404
     
-    answers = Answer.query.filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
+    limit, before_id, compact = window_args(request.args)
+    answers, has_more = message_window(conversation_id, limit, before_id)
     
-    answers_data = []
-    for answer in answers:
-        answers_data.append({
-            'id': answer.id,
-            'question': answer.question,
-            'answer': answer.answer,
-            'created_at': answer.created_at.isoformat()
-        })
+    fmt = answer_format()
+    if compact:
+        answers_data = compact_turns(answers, fmt)
+    else:
+        answers_data = []
+        for answer in answers:
+            answers_data.append({
+                'id': answer.id,
+                'question': answer.question,
+                'answer': answer.content(fmt),
+                'created_at': answer.created_at.isoformat()
+            })
     
     return jsonify({
         'id': conversation.id,
@@ -896,7 +946,8 @@ def get_conversation_details(conversation_id):
         'esrs_sector': conversation.esrs_sector,
         'company_description': conversation.company_description,
         'created_at': conversation.created_at.isoformat(),
-        'answers': answers_data
+        'answers': answers_data,
+        **window_meta(answers, has_more)
     }), 200
 
 @app.route('/user/conversation/<int:conversation_id>', methods=['DELETE'])
@@ -911,6 +962,7 @@ def delete_conversation(conversation_id):
     
     db.session.delete(conversation)
     db.session.commit()
+    chat_writer.discard(conversation_id)
     
     app.logger.info(f"Conversation deleted by user {current_user.id}: {conversation_id}")
     return jsonify({'message': 'Conversation deleted successfully'}), 200
@@ -933,7 +985,10 @@ def get_user_documents():
 @app.route('/user/document/<int:document_id>', methods=['GET'])
 @login_required
 def get_document_content(document_id):
-    document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
+    # Write out edits this process is still holding so the read sees them
+    autosave_buffer.flush(document_id)
+    document = Document.query.options(db.undefer(Document.content)).filter_by(
+        id=document_id, user_id=current_user.id).first()
     
     if not document:
         return jsonify({'message': 'Document not found'}), 404
@@ -942,14 +997,17 @@ def get_document_content(document_id):
         'id': document.id,
         'name': document.name,
         'content': document.content,
-        'created_at': document.created_at.isoformat()
+        'version': document.version,
+        'created_at': document.created_at.isoformat(),
+        'updated_at': document.updated_at.isoformat()
     }), 200
 
 @app.route('/user/load_document/<int:document_id>', methods=['POST'])
 @login_required
 def load_document_for_editing(document_id):
     try:
-        document = Document.query.filter_by(
+        autosave_buffer.flush(document_id)
+        document = Document.query.options(db.undefer(Document.content)).filter_by(
             id=document_id, 
             user_id=current_user.id
         ).first()
@@ -963,6 +1021,7 @@ def load_document_for_editing(document_id):
                 'id': document.id,
                 'name': document.name,
                 'content': document.content,
+                'version': document.version,
                 'created_at': document.created_at.isoformat()
             }
         })
@@ -986,10 +1045,10 @@ def update_document(document_id):
     name = request.form.get('name')
     
     try:
-        document.content = content
+        autosave_buffer.discard(document.id)
+        document.replace_content(content)
         if name:
             document.name = name
-        document.updated_at = datetime.utcnow()
         
         db.session.commit()
         
@@ -1000,6 +1059,7 @@ def update_document(document_id):
             'document': {
                 'id': document.id,
                 'name': document.name,
+                'version': document.version,
                 'updated_at': document.updated_at.isoformat()
             }
         }), 200
@@ -1102,14 +1162,15 @@ def autosave_document():
         if document_id:
             document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
             if document:
-                document.content = content
-                document.updated_at = datetime.utcnow()
+                autosave_buffer.discard(document.id)
+                document.replace_content(content)
                 db.session.commit()
                 
                 return jsonify({
                     'status': 'success',
                     'message': 'Content autosaved',
                     'document_id': document.id,
+                    'version': document.version,
                     'last_saved': document.updated_at.isoformat()
                 })
             else:
@@ -1127,6 +1188,7 @@ def autosave_document():
                 'status': 'success',
                 'message': 'Content autosaved as new document',
                 'document_id': document.id,
+                'version': document.version,
                 'last_saved': document.created_at.isoformat()
             })
             
@@ -1135,128 +1197,296 @@ def autosave_document():
         db.session.rollback()
         return jsonify({'status': 'error', 'message': 'Error saving content'}), 500
 
+@app.route('/user/document/<int:document_id>', methods=['PATCH'])
+@login_required
+@limiter.limit("60 per minute")
+def patch_document(document_id):
+    """Autosave a patch: {"base_version": n, "ops": [{"at", "delete", "insert"}], "length": optional}"""
+    data = request.get_json(silent=True) or {}
+    base_version = data.get('base_version')
+    
+    if not isinstance(base_version, int):
+        return jsonify({'status': 'error', 'message': 'base_version is required'}), 400
+    
+    try:
+        version = autosave_buffer.apply(document_id, current_user.id, base_version,
+                                        data.get('ops', []), data.get('length'))
+    except PatchError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except VersionConflict as e:
+        if e.retry_after is not None:
+            return jsonify({'status': 'retry', 'version': e.version, 'retry_after': e.retry_after}), 409
+        return jsonify({'status': 'conflict', 'version': e.version, 'content': e.content}), 409
+    except Exception as e:
+        app.logger.error(f"Error patching document {document_id} for user {current_user.id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'Error saving content'}), 500
+    
+    if version is None:
+        return jsonify({'status': 'error', 'message': 'Document not found'}), 404
+    
+    return jsonify({
+        'status': 'success',
+        'document_id': document_id,
+        'version': version,
+        'last_saved': datetime.utcnow().isoformat()
+    })
+
 
 
-@app.route('/user/document/<int:document_id>', methods=['DELETE'])
+@app.route('/user/document/<int:document_id>/versions', methods=['GET'])
 @login_required
-def delete_document(document_id):
+def list_document_versions(document_id):
+    """Stored versions, newest first; page back with ?before=<version>"""
+    autosave_buffer.flush(document_id)
     document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
     
     if not document:
         return jsonify({'message': 'Document not found'}), 404
     
-    db.session.delete(document)
-    db.session.commit()
-    
-    app.logger.info(f"Document deleted by user {current_user.id}: {document_id}")
-    return jsonify({'message': 'Document deleted successfully'}), 200
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    versions = document_versions.list_versions(db.session, document_id, limit, request.args.get('before', type=int))
+    return jsonify({'document_id': document_id, 'current_version': document.version, 'versions': versions}), 200
 
-def process_company_description(company_desc):
-    retrieved_docs = nace_vs.similarity_search(company_desc, k=3)
+@app.route('/user/document/<int:document_id>/versions/<int:version>', methods=['GET'])
+@login_required
+def get_document_version(document_id, version):
+    document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
     
-    ranked_docs = sorted(
-        retrieved_docs,
-        key=lambda doc: reranker.predict([(company_desc, doc.page_content)]),
-        reverse=True
-    )[:3]
+    if not document:
+        return jsonify({'message': 'Document not found'}), 404
     
-    context = "\n".join([doc.page_content for doc in ranked_docs])
+    content = document_versions.get_content(db.session, document_id, version)
+    if content is None:
+        return jsonify({'message': 'Version not found'}), 404
     
-    contextual_query = f"""
-    You are a NACE classification assistant.
-    Your job is to identify and return the exact NACE code.
-
-    Instructions:
-    - Analyze the company description.
-    - Use the context provided for reference.
-    - Respond with ONLY the NACE code (e.g., 'A01.1' or 'B05').
-    - Don't forget to include the letter
+    return jsonify({'document_id': document_id, 'version': version, 'content': content}), 200
 
-    Company description:
-    {company_desc}
+@app.route('/user/document/<int:document_id>/versions/<int:version>/restore', methods=['POST'])
+@login_required
+def restore_document_version(document_id, version):
+    """Make an old version the current content again, as a new version"""
+    autosave_buffer.flush(document_id)
+    autosave_buffer.discard(document_id)
+    document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
+    
+    if not document:
+        return jsonify({'message': 'Document not found'}), 404
+    
+    content = document_versions.get_content(db.session, document_id, version)
+    if content is None:
+        return jsonify({'message': 'Version not found'}), 404
+    
+    try:
+        document.replace_content(content)
+        db.session.commit()
+    except Exception as e:
+        app.logger.error(f"Error restoring version {version} of document {document_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': 'Error restoring version'}), 500
+    
+    app.logger.info(f"Document {document_id} restored to version {version} by user {current_user.id}")
+    return jsonify({
+        'status': 'success',
+        'document_id': document_id,
+        'restored_version': version,
+        'version': document.version,
+        'content': content
+    }), 200
 
-    Context:
-    {context}
-    """
+@app.route('/user/conversation/<int:conversation_id>/questionnaire', methods=['POST'])
+@login_required
+@limiter.limit("5 per minute")
+def answer_questionnaire_batch(conversation_id):
+    """Answer a list of questions (JSON body or uploaded JSON/CSV file) into a new document,
+    streaming progress as NDJSON"""
+    conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first()
     
-    nace_result = get_llm_response(contextual_query)
+    if not conversation:
+        return jsonify({'message': 'Conversation not found'}), 404
     
-    nace_result = re.sub(r'(\b[a-u]\b)', lambda m: m.group(1).upper(), nace_result)
-    nace_result = re.sub(r'\.\s+', '.', nace_result)
+    try:
+        if 'file' in request.files:
+            upload = request.files['file']
+            questions = parse_questions(upload.read(), upload.filename)
+        else:
+            questions = parse_questions(request.get_json(silent=True) or request.get_data(as_text=True))
+    except QuestionnaireError as e:
+        return jsonify({'message': str(e)}), 400
     
-    match = re.search(r'([A-U](\d{1,2})(\.\d{1,2}){0,2})', nace_result)
+    data = request.get_json(silent=True)
+    name = request.form.get('name') or (data.get('name') if isinstance(data, dict) else None)
+    user_id = current_user.id
     
-    if match:
-        nace_sector = match.group(1)
-        print(f"Company sector according to NACE: {nace_sector}") 
-        esrs_sector = special_sectors.get(nace_sector, "Agnostic")
-    else:
-        nace_sector = "Agnostic"
-        print("Could not determine exact NACE code. Using agnostic standards.") 
-        esrs_sector = "Agnostic"
+    def generate():
+        try:
+            for event in run_questionnaire(conversation, questions, user_id, name):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error answering questionnaire for conversation {conversation_id}: {str(e)}")
+            yield json.dumps({'stage': 'error', 'message': 'Error answering questionnaire'}) + "\n"
+    
+    if wants_async():
+        job = job_queue.enqueue('questionnaire', {
+            'conversation_id': conversation_id,
+            'questions': questions,
+            'user_id': user_id,
+            'name': name
+        }, user_id=user_id)
+        return jsonify({'job_id': job.id, 'status': job.status}), 202
+    
+    app.logger.info(f"Questionnaire with {len(questions)} questions started by user {user_id} for conversation {conversation_id}")
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/user/document/<int:document_id>', methods=['DELETE'])
+@login_required
+def delete_document(document_id):
+    document = Document.query.filter_by(id=document_id, user_id=current_user.id).first()
     
-    return {
-        'nace_sector': nace_sector,
-        'esrs_sector': esrs_sector
-    }
+    if not document:
+        return jsonify({'message': 'Document not found'}), 404
+    
+    autosave_buffer.discard(document.id)
+    DocumentVersion.query.filter_by(document_id=document.id).delete()
+    db.session.delete(document)
+    db.session.commit()
+    
+    app.logger.info(f"Document deleted by user {current_user.id}: {document_id}")
+    return jsonify({'message': 'Document deleted successfully'}), 200
 
 def process_question(question):
-    company_desc = session.get('company_desc', '')
-    nace_sector = session.get('nace_sector', 'agnostic')
     esrs_sector = session.get('esrs_sector', 'Agnostic')
-    conversation_history = session.get('conversation_history', [])
+    conversation_history = load_conversation_history(session.get('conversation_id'))
+    release_connection()
     
-    qa_vs = default_vs
-    
-    if esrs_sector in sector_db_map:
-        merged_data = merged_vectorstores.get(esrs_sector)
-        
-        if merged_data:
-            qa_vs = merged_data['vectorstore']
-    
-    retrieved_docs = qa_vs.similarity_search(question, k=10)
-    
-    ranked_docs = sorted(
-        retrieved_docs,
-        key=lambda doc: reranker.predict([(question, doc.page_content)]),
-        reverse=True
-    )[:5]
-    
-    context = "\n".join([doc.page_content for doc in ranked_docs])
-    
-    contextual_query = f"""
-    Instructions:
-    - Follow the ESRS standards.
-    - Use the context provided for reference.
-    - No need to include summary tables
-    - Answer must be complete and accurate
-    - Explain the answer in detail
-    - Give brief and concise answers
-    - Prioritize information quality over aesthetics
-    - Don't show tables, only plain text
-    - Don't say what was provided in context
-    - Give answer in markdown format
-    - Don't include numeric lists, only bullet points
-    Question: {question}
-    Context:
-    {context}
-    Take into account the previous conversation:
-    {conversation_history}
+    return answer_question(question, esrs_sector, conversation_history)
+
+QUESTIONNAIRE_CONCURRENCY = int(os.environ.get('QUESTIONNAIRE_CONCURRENCY', 4))
+
+def run_questionnaire(conversation, questions, user_id, name=None, concurrency=QUESTIONNAIRE_CONCURRENCY):
+    """Answer questions for a conversation and save them, in order, as a new document.
+
+    Yields progress events; the final one carries the id of the created document.
     """
+    qa_vs, _ = select_vectorstore(conversation.esrs_sector)
+    conversation_history = [
+        f"Company description: {conversation.company_description}",
+        f"NACE sector code: {conversation.nace_sector}",
+        f"ESRS standards to follow: Agnostic Standards + {conversation.esrs_sector}"
+    ]
+    
+    # Failures are reported per question and left out of the document, not saved as answers
+    def answer_fn(question, context):
+        return request_llm_response(build_answer_prompt(question, context, conversation_history))
+    
+    for event in answer_questionnaire(questions, qa_vs, get_reranker(), answer_fn, concurrency=concurrency):
+        if event['stage'] != 'complete':
+            yield event
+            continue
+        
+        document = Document(
+            user_id=user_id,
+            name=name or f"ESRS Questionnaire {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            content=render_document(questions, event['answers'])
+        )
+        db.session.add(document)
+        db.session.commit()
+        
+        app.logger.info(f"Questionnaire document created for user {user_id}: {document.id}")
+        yield {'stage': 'complete', 'done': event['done'], 'total': event['total'],
+               'document_id': document.id, 'name': document.name}
+
+@app.cli.command('questionnaire')
+@click.argument('conversation_id', type=int)
+@click.argument('questions_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--name', default=None, help='Name of the document to create')
+@click.option('--concurrency', default=QUESTIONNAIRE_CONCURRENCY, show_default=True, help='Parallel LLM calls')
+def questionnaire_command(conversation_id, questions_file, name, concurrency):
+    """Answer a JSON/CSV list of questions for a conversation and save them as a document"""
+    conversation = db.session.get(Conversation, conversation_id)
+    if not conversation or conversation.user_id is None:
+        raise click.ClickException(f"Conversation {conversation_id} not found or not owned by a user")
+    
+    with open(questions_file, 'rb') as f:
+        try:
+            questions = parse_questions(f.read(), questions_file)
+        except QuestionnaireError as e:
+            raise click.ClickException(str(e))
     
-    answer = get_llm_response(contextual_query)
-    answer = markdown.markdown(answer, extensions=['tables', 'md_in_html'])
+    for event in run_questionnaire(conversation, questions, conversation.user_id, name, concurrency):
+        if event['stage'] == 'complete':
+            click.echo(f"Document {event['document_id']} created: {event['name']}")
+        else:
+            suffix = f" (question {event['index'] + 1} failed: {event['error']})" if event.get('error') else ''
+            click.echo(f"[{event['stage']}] {event['done']}/{event['total']}{suffix}")
+
+@job_queue.handler('chat')
+def chat_job(payload, report_progress):
+    result = answer_question(payload['question'], payload['esrs_sector'], payload['conversation_history'])
     
-    conversation_history.append(f"Q: {question}")
-    conversation_history.append(f"A: {answer}")
-    session['conversation_history'] = conversation_history
-    session.modified = True
+    if payload.get('conversation_id'):
+        chat_writer.save_turn(payload['conversation_id'], payload['question'], result['markdown'],
+                              html=result['answer'])
     
-    return jsonify({
-        'answer': answer,
-        'context': context,
+    return {
+        'question': payload['question'],
+        'answer': result['answer'],
+        'markdown': result['markdown'],
+        'context': result['context'],
         'is_first_message': False
-    })
+    }
+
+@job_queue.handler('questionnaire')
+def questionnaire_job(payload, report_progress):
+    conversation = db.session.get(Conversation, payload['conversation_id'])
+    if conversation is None:
+        raise ValueError(f"Conversation {payload['conversation_id']} not found")
+    
+    event = None
+    for event in run_questionnaire(conversation, payload['questions'], payload['user_id'], payload.get('name')):
+        report_progress(event)
+    return event
+
+@app.cli.command('llm-benchmark')
+@click.option('--runs', default=5, show_default=True, help='Requests per backend')
+@click.option('--concurrency', default=1, show_default=True, help='Parallel requests per backend')
+@click.option('--max-tokens', default=256, show_default=True)
+def llm_benchmark_command(runs, concurrency, max_tokens):
+    """Compare latency and tokens/sec across the configured LLM backends"""
+    print_benchmark(benchmark_backends(llm_router, runs=runs, concurrency=concurrency, max_tokens=max_tokens))
+
+@app.cli.command('search-reindex')
+def search_reindex_command():
+    """Rebuild the full-text search index from the conversations, answers and documents"""
+    total = search.rebuild(db.session)
+    db.session.commit()
+    click.echo(f"Indexed {total} entries")
+
+@app.cli.command('warmup')
+def warmup_command():
+    """Load every model and index in parallel and report how long each took"""
+    warmup.start(wait=True)
+    progress = warmup.progress()
+    for name, component in progress['components'].items():
+        error = f" ({component['error']})" if component['error'] else ''
+        click.echo(f"{name:<24} {component['status']:<8} {component['load_seconds'] or 0:7.2f}s{error}")
+    click.echo(f"Total: {progress['elapsed_seconds']:.2f}s")
+    log_import_profile(app.logger)
+
+@app.cli.command('jobs-worker')
+@click.option('--workers', default=2, show_default=True, help='Number of worker threads')
+def jobs_worker_command(workers):
+    """Run background job workers in this process until interrupted"""
+    job_queue.ensure_started(workers)
+    click.echo(f"Processing jobs with {workers} workers, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        job_queue.stop(timeout=5)
+
+app.logger.info(f"App imported in {time.perf_counter() - _import_started:.2f}s (warm-up mode: {WARMUP_MODE})")
 
 if __name__ == '__main__':
     app.run(debug=True, use_reloader=False)
\ No newline at end of file
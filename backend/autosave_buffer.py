@@ -0,0 +1,276 @@
+"""
+Patch-based document autosave with coalesced database writes.
+
+The editor sends patches instead of the whole document: a list of splice
+operations {"at", "delete", "insert"} against the version it last saw.
+Positions count UTF-16 code units, like JavaScript string indexes. Patches
+are applied to an in-memory copy of the document and every patch bumps its
+version, but the document is written at most once per
+AUTOSAVE_FLUSH_SECONDS (5) by a background thread, with a conditional
+UPDATE on the version it was read at. AUTOSAVE_FLUSH_SECONDS=0 writes
+every patch through.
+
+The copy lives in the process that received the patches. A patch whose
+base version is behind the current one is a real conflict and is rejected
+with the current content; a base version ahead of what this process knows
+means another worker still holds unflushed edits, and the client is asked
+to retry after the flush interval. Full saves of a document discard its
+buffered copy. An unflushed copy that finds the row changed underneath it
+is kept, marked as conflicted, until the next patch to the document (or
+until it goes idle): that patch is rejected with the current database content, so the client sees
+that its edits were not saved instead of losing them silently.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from document_versions import record_version
+from search import reindex_document
+from models import db, Document
+
+logger = logging.getLogger(__name__)
+
+
+class PatchError(ValueError):
+    pass
+
+
+class VersionConflict(Exception):
+    """The patch was made against another version; `content` is set when the client must resync"""
+
+    def __init__(self, version, content=None, retry_after=None):
+        super().__init__(f"Document is at version {version}")
+        self.version = version
+        self.content = content
+        self.retry_after = retry_after
+
+
+def apply_ops(text, ops):
+    """Apply splice operations, each relative to the result of the previous one"""
+    if not isinstance(ops, list):
+        raise PatchError('ops must be a list')
+    units = bytearray((text or '').encode('utf-16-le'))
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError('Each op must be an object')
+        at, delete, insert = op.get('at'), op.get('delete', 0), op.get('insert', '')
+        if (not isinstance(at, int) or not isinstance(delete, int) or not isinstance(insert, str)
+                or at < 0 or delete < 0 or 2 * (at + delete) > len(units)):
+            raise PatchError(f"Invalid op {op}")
+        units[2 * at:2 * (at + delete)] = insert.encode('utf-16-le', 'surrogatepass')
+    try:
+        return units.decode('utf-16-le')
+    except UnicodeDecodeError as e:
+        raise PatchError('Patch splits a surrogate pair') from e
+
+
+def utf16_length(text):
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+class _Entry:
+    __slots__ = ('document_id', 'user_id', 'content', 'version', 'stored_version', 'dirty_since', 'touched',
+                 'conflicted', 'flush_lock')
+
+    def __init__(self, document_id, user_id, content, version):
+        self.document_id = document_id
+        self.user_id = user_id
+        self.content = content or ''
+        self.version = version
+        self.stored_version = version
+        self.dirty_since = None
+        self.touched = time.monotonic()
+        self.conflicted = False
+        self.flush_lock = threading.Lock()
+
+
+class AutosaveBuffer:
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 5.0
+        self.idle_seconds = 300
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._pid = None
+        self.flushes = 0
+        self.patches = 0
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(app.config.get('AUTOSAVE_FLUSH_SECONDS', os.environ.get('AUTOSAVE_FLUSH_SECONDS', 5)))
+        app.extensions['autosave_buffer'] = self
+        atexit.register(self.flush_all)
+
+    def ensure_started(self):
+        """Start the flusher thread in this process (once per process, so it is fork-safe)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Entries copied from the parent belong to the parent
+            self._entries = {}
+            self._stop.clear()
+            threading.Thread(target=self._run, name='autosave-flusher', daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(max(self.interval / 2, 0.1)):
+            try:
+                with self.app.app_context():
+                    self.flush_due()
+            except Exception as e:
+                logger.error(f"Autosave flush error: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _load(self, document_id, user_id):
+        row = db.session.execute(
+            select(Document.content, Document.version)
+            .where(Document.id == document_id, Document.user_id == user_id)
+        ).first()
+        db.session.rollback()
+        if row is None:
+            return None
+        return _Entry(document_id, user_id, row.content, row.version)
+
+    def apply(self, document_id, user_id, base_version, ops, length=None):
+        """Apply a patch; returns the new version, or None when the user has no such document"""
+        self.ensure_started()
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None or (base_version > entry.version and entry.dirty_since is None
+                                 and not entry.conflicted):
+                # Not buffered here, or another process has written a newer version since
+                entry = self._load(document_id, user_id)
+                if entry is None:
+                    return None
+                self._entries[document_id] = entry
+            if entry.user_id != user_id:
+                return None
+            if entry.conflicted:
+                return self._reject(entry)
+
+            if base_version < entry.version:
+                raise VersionConflict(entry.version, content=entry.content)
+            if base_version > entry.version:
+                raise VersionConflict(entry.version, retry_after=self.interval)
+
+            content = apply_ops(entry.content, ops)
+            if length is not None and utf16_length(content) != length:
+                raise VersionConflict(entry.version, content=entry.content)
+
+            entry.content = content
+            entry.version += 1
+            entry.touched = time.monotonic()
+            if entry.dirty_since is None:
+                entry.dirty_since = entry.touched
+            self.patches += 1
+            version = entry.version
+
+        if self.interval <= 0 and not self.flush(document_id) and entry.conflicted:
+            with self._lock:
+                return self._reject(entry)
+        return version
+
+    def _reject(self, entry):
+        """Drop a conflicted copy, telling the client what the database holds instead"""
+        if self._entries.get(entry.document_id) is entry:
+            del self._entries[entry.document_id]
+        current = self._load(entry.document_id, entry.user_id)
+        if current is None:
+            return None
+        raise VersionConflict(current.version, content=current.content)
+
+    def discard(self, document_id):
+        """Forget the buffered copy, e.g. because the whole document is being replaced"""
+        with self._lock:
+            self._entries.pop(document_id, None)
+
+    def flush(self, document_id):
+        with self._lock:
+            entry = self._entries.get(document_id)
+        if entry is None:
+            return False
+        # The flusher thread and request threads flush the same entries; two flushes
+        # from the same stored_version would see the second one fail
+        with entry.flush_lock:
+            return self._flush(entry)
+
+    def _flush(self, entry):
+        document_id = entry.document_id
+        with self._lock:
+            if entry.dirty_since is None:
+                return False
+            content, version, stored_version = entry.content, entry.version, entry.stored_version
+
+        written = db.session.execute(
+            update(Document)
+            .where(Document.id == document_id, Document.version == stored_version)
+            .values(content=content, version=version, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if written == 1:
+            record_version(db.session, document_id, version, content)
+            reindex_document(db.session, document_id)
+            db.session.commit()
+        else:
+            # Already written, e.g. by a flush that did not get to update the entry
+            row = db.session.execute(
+                select(Document.content, Document.version).where(Document.id == document_id)
+            ).first()
+            written = int(row is not None and (row.content, row.version) == (content, version))
+            db.session.rollback()
+
+        with self._lock:
+            self.flushes += 1
+            if written != 1:
+                logger.warning(f"Document {document_id} changed since version {stored_version}; "
+                               f"buffered edits up to version {version} were not saved")
+                # Kept until the next patch, which is answered with the stored content
+                entry.conflicted = True
+                entry.dirty_since = None
+                return False
+            entry.stored_version = version
+            if entry.version == version:
+                entry.dirty_since = None
+        return True
+
+    def flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [e.document_id for e in self._entries.values()
+                   if e.dirty_since is not None and now - e.dirty_since >= self.interval]
+            idle = [e.document_id for e in self._entries.values()
+                    if e.dirty_since is None and now - e.touched >= self.idle_seconds]
+            for document_id in idle:
+                del self._entries[document_id]
+        for document_id in due:
+            self.flush(document_id)
+        return len(due)
+
+    def flush_all(self):
+        if self.app is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            dirty = [e.document_id for e in self._entries.values() if e.dirty_since is not None]
+        if not dirty:
+            return
+        with self.app.app_context():
+            for document_id in dirty:
+                try:
+                    self.flush(document_id)
+                except Exception as e:
+                    logger.error(f"Could not flush document {document_id}: {str(e)}")
+
+
+autosave_buffer = AutosaveBuffer()
@@ -0,0 +1,161 @@
+"""
+Concurrency benchmark of the SQLite profile (see sqlite_profile.py).
+
+Writer threads autosave documents (an UPDATE of the whole content) and save
+chat turns (an Answer INSERT plus the conversation's updated_at), while
+reader threads run the conversation and document listings. The same load is
+run against a fresh database file with the default SQLite settings and with
+the profile, reporting the read latency and failed operations of each:
+
+    python bench_sqlite.py
+    python bench_sqlite.py --seconds 10 --readers 8 --writers 4
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.pool import QueuePool
+
+import sqlite_profile
+from models import db, User, Conversation, Answer, Document
+
+
+def seed(engine, users, conversations, documents):
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password': 'x', 'created_at': now}
+            for i in range(users)])
+        connection.execute(insert(Conversation.__table__), [
+            {'user_id': i % users + 1, 'title': f'Conversation {i}', 'company_description': 'A company. ' * 40,
+             'created_at': now, 'updated_at': now}
+            for i in range(conversations)])
+        connection.execute(insert(Document.__table__), [
+            {'user_id': i % users + 1, 'name': f'Report {i}', 'content': '<p>Disclosure text.</p>' * 200,
+             'version': 1, 'created_at': now, 'updated_at': now}
+            for i in range(documents)])
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(engine, seconds, readers, writers, users, conversations, documents):
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {'read_seconds': [], 'writes': 0, 'write_errors': 0, 'read_errors': 0}
+
+    def reader(n):
+        user_id = n % users + 1
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(
+                        select(Conversation.id, Conversation.title, Conversation.updated_at)
+                        .where(Conversation.user_id == user_id)
+                        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+                        .limit(20)).all()
+                    connection.execute(
+                        select(Document.id, Document.name, Document.updated_at)
+                        .where(Document.user_id == user_id)
+                        .order_by(Document.updated_at.desc())).all()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    stats['read_seconds'].append(elapsed)
+            except Exception:
+                with lock:
+                    stats['read_errors'] += 1
+
+    def writer(n):
+        i = 0
+        while not stop.is_set():
+            i += 1
+            now = datetime.utcnow()
+            try:
+                with engine.begin() as connection:
+                    if i % 2:
+                        document_id = (n * 7 + i) % documents + 1
+                        connection.execute(
+                            update(Document.__table__).where(Document.id == document_id)
+                            .values(content=f'<p>Autosave {i} of writer {n}.</p>' * 200,
+                                    version=Document.version + 1, updated_at=now))
+                    else:
+                        conversation_id = (n * 13 + i) % conversations + 1
+                        connection.execute(insert(Answer.__table__).values(
+                            conversation_id=conversation_id, question=f'Question {i}',
+                            answer='<p>Answer</p>' * 50, answer_markdown='Answer ' * 50, created_at=now))
+                        connection.execute(
+                            update(Conversation.__table__).where(Conversation.id == conversation_id)
+                            .values(updated_at=now))
+                with lock:
+                    stats['writes'] += 1
+            except Exception:
+                with lock:
+                    stats['write_errors'] += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    reads = stats['read_seconds']
+    return {
+        'reads_per_second': len(reads) / seconds,
+        'read_p50_ms': percentile(reads, 0.5) * 1000 if reads else None,
+        'read_p99_ms': percentile(reads, 0.99) * 1000 if reads else None,
+        'read_max_ms': max(reads) * 1000 if reads else None,
+        'writes_per_second': stats['writes'] / seconds,
+        'errors': stats['read_errors'] + stats['write_errors']
+    }
+
+
+def benchmark(seconds=5, readers=4, writers=2, users=10, conversations=2000, documents=500):
+    """Run the same load with the default settings and with the profile"""
+    report = {}
+    for name in ('default', 'profile'):
+        with tempfile.TemporaryDirectory() as directory:
+            uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            if name == 'profile':
+                engine = create_engine(uri, **sqlite_profile.engine_options(uri))
+            else:
+                engine = create_engine(uri, poolclass=QueuePool, pool_size=readers + writers,
+                                       connect_args={'check_same_thread': False})
+            seed(engine, users, conversations, documents)
+            report[name] = run(engine, seconds, readers, writers, users, conversations, documents)
+            engine.dispose()
+    return report
+
+
+def print_report(report):
+    print(f"{'settings':<10} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'writes/s':>9} {'errors':>7}")
+    for name, row in report.items():
+        cells = [f"{row[key]:.1f}" if row[key] is not None else '-'
+                 for key in ('read_p50_ms', 'read_p99_ms', 'read_max_ms')]
+        print(f"{name:<10} {row['reads_per_second']:>9.1f} {cells[0]:>8} {cells[1]:>8} {cells[2]:>8} "
+              f"{row['writes_per_second']:>9.1f} {row['errors']:>7}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare SQLite read latency under concurrent writes')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--documents', type=int, default=500)
+    args = parser.parse_args()
+
+    print_report(benchmark(seconds=args.seconds, readers=args.readers, writers=args.writers,
+                           conversations=args.conversations, documents=args.documents))
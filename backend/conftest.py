@@ -0,0 +1,48 @@
+"""
+Shared test fixtures.
+
+`app` is a Flask app on a fresh SQLite database in the test's tmp_path, with
+the tables created and an app context pushed for the duration of the test.
+Extra config is passed with the app_config marker, on a test or for a whole
+module (`pytestmark = pytest.mark.app_config(JOB_WORKERS=2)`); the marker
+closest to the test wins. A test module adds its own routes, extensions and
+rows by overriding the fixture and requesting it:
+
+    @pytest.fixture
+    def app(app):
+        app.register_blueprint(documents)
+        db.session.add(User(...))
+        db.session.commit()
+        return app
+"""
+import pytest
+from flask import Flask
+
+from models import db
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'app_config(**settings): extra config of the `app` fixture')
+
+
+def make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'test'
+    app.config.update(config)
+    db.init_app(app)
+    return app
+
+
+@pytest.fixture
+def app(request, tmp_path):
+    config = {}
+    for marker in reversed(list(request.node.iter_markers('app_config'))):
+        config.update(marker.kwargs)
+    app = make_app(tmp_path, **config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
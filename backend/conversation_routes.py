@@ -1,8 +1,10 @@
 # backend/conversation_routes.py
 from flask import Blueprint, request, jsonify, session
-from models import db, Conversation, Answer, User
-from app import client, merged_vectorstores, default_vs, nace_vs, load_chain, sector_db_map
-import re
+from datetime import datetime
+from models import db, Conversation, Answer, User, render_markdown
+from rag import create_completion, retrieve_documents, select_vectorstore, load_conversation_history, process_company_description
+from queries import window_args, message_window, window_meta, compact_turns
+from write_behind import chat_writer, release_connection
 
 conversations = Blueprint('conversations', __name__)
 
@@ -35,22 +37,28 @@ def get_conversation(conversation_id):
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    conversation = Conversation.query.filter_by(id=conversation_id, user_id=user_id).first()
+    conversation = Conversation.query.options(db.undefer(Conversation.company_description)).filter_by(
+        id=conversation_id, user_id=user_id).first()
     
     if not conversation:
         return jsonify({'error': 'Conversation not found'}), 404
     
-    # Get all answers for this conversation
-    answers = Answer.query.filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
+    # Latest answers first; older ones with ?before_id=<oldest_id>
+    limit, before_id, compact = window_args(request.args)
+    answers, has_more = message_window(conversation_id, limit, before_id)
     
-    messages = []
-    for answer in answers:
-        messages.append({
-            'id': answer.id,
-            'question': answer.question,
-            'answer': answer.answer,
-            'created_at': answer.created_at.isoformat()
-        })
+    fmt = 'markdown' if request.args.get('format') == 'markdown' else 'html'
+    if compact:
+        messages = compact_turns(answers, fmt)
+    else:
+        messages = []
+        for answer in answers:
+            messages.append({
+                'id': answer.id,
+                'question': answer.question,
+                'answer': answer.content(fmt),
+                'created_at': answer.created_at.isoformat()
+            })
     
     return jsonify({
         'id': conversation.id,
@@ -60,7 +68,8 @@ def get_conversation(conversation_id):
         'company_description': conversation.company_description,
         'created_at': conversation.created_at.isoformat(),
         'updated_at': conversation.updated_at.isoformat(),
-        'messages': messages
+        'messages': messages,
+        **window_meta(answers, has_more)
     }), 200
 
 @conversations.route('/conversations', methods=['POST'])
@@ -117,6 +126,7 @@ def delete_conversation(conversation_id):
     
     db.session.delete(conversation)
     db.session.commit()
+    chat_writer.discard(conversation_id)
     
     return jsonify({'message': 'Conversation deleted successfully'}), 200
 
@@ -139,31 +149,17 @@ def add_message(conversation_id):
         return jsonify({'error': 'Question is required'}), 400
     
     # Get previous messages for context
-    previous_answers = Answer.query.filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
-    conversation_history = []
+    conversation_history = load_conversation_history(conversation_id)
+    esrs_sector = conversation.esrs_sector
     
-    for ans in previous_answers:
-        conversation_history.append(f"Q: {ans.question}")
-        conversation_history.append(f"A: {ans.answer}")
+    # Nothing else is read until the answer is saved: free the connection for the LLM call
+    release_connection()
     
     # Process question to get response
-    qa_vs = default_vs
-    
-    if conversation.esrs_sector in sector_db_map:
-        merged_data = merged_vectorstores.get(conversation.esrs_sector)
-        
-        if merged_data:
-            qa_vs = merged_data['vectorstore']
+    qa_vs, store_name = select_vectorstore(esrs_sector)
     
     # Get relevant documents for the question
-    from app import reranker
-    retrieved_docs = qa_vs.similarity_search(question, k=10)
-    
-    ranked_docs = sorted(
-        retrieved_docs,
-        key=lambda doc: reranker.predict([(question, doc.page_content)]),
-        reverse=True
-    )[:5]
+    ranked_docs = retrieve_documents(qa_vs, store_name, question, k=10, top_n=5)
     
     context = "\n".join([doc.page_content for doc in ranked_docs])
     
@@ -187,92 +183,31 @@ def add_message(conversation_id):
     {conversation_history}
     """
     
-    answer_text = client.chat.completions.create(
-        model="nvidia/llama-3.3-nemotron-super-49b-v1",
-        messages=[{"role": "system", "content": "Be brief."
+    answer_text = create_completion(
+        'answer',
+        [{"role": "system", "content": "Be brief."
         "Only return the most COMPLETE and accurate answer. "
         "Avoid explanations, introductions, and additional context. "
         "No need to introduce a summary at the end. "},
-                  {"role": "user", "content": contextual_query}],
+         {"role": "user", "content": contextual_query}],
         temperature=0,
         top_p=0.1,
         max_tokens=112000,
         frequency_penalty=0.1,
-        presence_penalty=0,
-        stream=False
-    ).choices[0].message.content.strip()
-    
-    # Save the question and answer
-    answer = Answer(
-        conversation_id=conversation_id,
-        question=question,
-        answer=answer_text
+        presence_penalty=0
     )
     
-    db.session.add(answer)
-    
-    # Update the conversation's updated_at timestamp
-    conversation.updated_at = db.func.current_timestamp()
-    
-    db.session.commit()
+    # Save the question and answer, with the conversation's updated_at, in one commit
+    html = render_markdown(answer_text)
+    answer = chat_writer.save_turn(conversation_id, question, answer_text, html=html)
     
     return jsonify({
-        'id': answer.id,
-        'question': answer.question,
-        'answer': answer.answer,
-        'created_at': answer.created_at.isoformat()
+        'id': answer.id if answer is not None else None,
+        'question': question,
+        'answer': answer_text if request.args.get('format') == 'markdown' else html,
+        'created_at': (answer.created_at if answer is not None else datetime.utcnow()).isoformat()
     }), 201
 
-def process_company_description(company_desc):
-    # Import necessary functions from app.py
-    from app import nace_vs, reranker, get_llm_response, special_sectors
-    
-    retrieved_docs = nace_vs.similarity_search(company_desc, k=3)
-    
-    ranked_docs = sorted(
-        retrieved_docs,
-        key=lambda doc: reranker.predict([(company_desc, doc.page_content)]),
-        reverse=True
-    )[:3]
-    
-    context = "\n".join([doc.page_content for doc in ranked_docs])
-    
-    contextual_query = f"""
-    You are a NACE classification assistant.
-    Your job is to identify and return the exact NACE code.
-
-    Instructions:
-    - Analyze the company description.
-    - Use the context provided for reference.
-    - Respond with ONLY the NACE code (e.g., 'A01.1' or 'B05').
-    - Don't forget to include the letter
-
-    Company description:
-    {company_desc}
-
-    Context:
-    {context}
-    """
-    
-    nace_result = get_llm_response(contextual_query)
-    
-    nace_result = re.sub(r'(\b[a-u]\b)', lambda m: m.group(1).upper(), nace_result)
-    nace_result = re.sub(r'\.\s+', '.', nace_result)
-    
-    match = re.search(r'([A-U](\d{1,2})(\.\d{1,2}){0,2})', nace_result)
-    
-    if match:
-        nace_sector = match.group(1)
-        esrs_sector = special_sectors.get(nace_sector, "Agnostic")
-    else:
-        nace_sector = "Agnostic"
-        esrs_sector = "Agnostic"
-    
-    return {
-        'nace_sector': nace_sector,
-        'esrs_sector': esrs_sector
-    }
-
 def generate_conversation_title(company_desc):
     # Generate a title for the conversation using the model
     title_prompt = f"""
@@ -283,14 +218,13 @@ def generate_conversation_title(company_desc):
     The title should be descriptive of the company's sector or main activity. Return only the title without quotes or additional text.
     """
     
-    title = client.chat.completions.create(
-        model="nvidia/llama-3.3-nemotron-super-49b-v1",
-        messages=[{"role": "system", "content": "Generate a concise title."},
-                  {"role": "user", "content": title_prompt}],
+    title = create_completion(
+        'title',
+        [{"role": "system", "content": "Generate a concise title."},
+         {"role": "user", "content": title_prompt}],
         temperature=0.7,
-        max_tokens=20,
-        stream=False
-    ).choices[0].message.content.strip()
+        max_tokens=20
+    )
     
     # Remove any quotes that might be in the response
     title = title.replace('"', '').replace("'", "")
@@ -15,7 +15,7 @@ with app.app_context():
     print("=== VERIFICANDO CONVERSACIONES ===")
     
     # Verificar todas las conversaciones
-    conversations = Conversation.query.all()
+    conversations = Conversation.query.options(db.undefer(Conversation.company_description)).all()
     print(f"\nTotal de conversaciones: {len(conversations)}")
     
     for conv in conversations:
@@ -1,7 +1,8 @@
 # backend/document_routes.py
 from flask import Blueprint, request, jsonify, session
-from models import db, Document, User
+from models import db, Document, DocumentVersion, User
 from datetime import datetime
+from autosave_buffer import autosave_buffer
 
 documents = Blueprint('documents', __name__)
 
@@ -32,7 +33,8 @@ def get_document(document_id):
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    document = Document.query.filter_by(id=document_id, user_id=user_id).first()
+    autosave_buffer.flush(document_id)
+    document = Document.query.options(db.undefer(Document.content)).filter_by(id=document_id, user_id=user_id).first()
     
     if not document:
         return jsonify({'error': 'Document not found'}), 404
@@ -41,6 +43,7 @@ def get_document(document_id):
         'id': document.id,
         'name': document.name,
         'content': document.content,
+        'version': document.version,
         'created_at': document.created_at.isoformat(),
         'updated_at': document.updated_at.isoformat()
     }), 200
@@ -96,7 +99,8 @@ def update_document(document_id):
         document.name = name
     
     if content:
-        document.content = content
+        autosave_buffer.discard(document.id)
+        document.replace_content(content)
     
     document.updated_at = datetime.utcnow()
     db.session.commit()
@@ -104,6 +108,7 @@ def update_document(document_id):
     return jsonify({
         'id': document.id,
         'name': document.name,
+        'version': document.version,
         'created_at': document.created_at.isoformat(),
         'updated_at': document.updated_at.isoformat()
     }), 200
@@ -120,6 +125,8 @@ def delete_document(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
+    autosave_buffer.discard(document.id)
+    DocumentVersion.query.filter_by(document_id=document.id).delete()
     db.session.delete(document)
     db.session.commit()
     
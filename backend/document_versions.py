@@ -0,0 +1,198 @@
+"""
+Compact version history of documents.
+
+Every stored version of a document's content gets a DocumentVersion row.
+Most rows are deltas against the latest full snapshot of the document: the
+content is split after each HTML tag, difflib matches the token sequences
+and the delta keeps copied ranges as [start, end] token indexes and new text
+as strings. A new snapshot is taken every HISTORY_SNAPSHOT_EVERY (20)
+versions, or sooner when a delta stops being small, so rebuilding any
+version costs one snapshot plus at most one delta. Both are stored zlib
+compressed.
+
+Retention (applied whenever a snapshot is written): the newest
+HISTORY_KEEP_VERSIONS (50) versions are kept; older ones are thinned to
+their snapshots, and snapshots older than HISTORY_KEEP_DAYS (90) are
+dropped together with their deltas. The current version is never dropped.
+
+ORM writes to Document.content are recorded by a before_flush hook
+(track_history); writes that bypass the ORM call record_version themselves.
+"""
+import difflib
+import json
+import os
+import re
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, inspect, select
+
+from models import Document, DocumentVersion
+
+SNAPSHOT_EVERY = int(os.environ.get('HISTORY_SNAPSHOT_EVERY', 20))
+KEEP_VERSIONS = int(os.environ.get('HISTORY_KEEP_VERSIONS', 50))
+KEEP_DAYS = int(os.environ.get('HISTORY_KEEP_DAYS', 90))
+# A delta larger than this fraction of the compressed content is replaced by a snapshot
+MAX_DELTA_RATIO = 0.5
+COMPRESSION_LEVEL = 6
+
+TOKEN_PATTERN = re.compile(r'[^>]*>|[^>]+$')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text or '')
+
+
+def compress(value):
+    return zlib.compress(value.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def make_delta(base, content):
+    """Ops turning `base` into `content`: [start, end] copies base tokens, strings are inserted"""
+    base_tokens, tokens = tokenize(base), tokenize(content)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_tokens, tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(tokens[j1:j2]))
+    return json.dumps(ops, separators=(',', ':'))
+
+
+def apply_delta(base, delta):
+    base_tokens = tokenize(base)
+    return ''.join(op if isinstance(op, str) else ''.join(base_tokens[op[0]:op[1]])
+                   for op in json.loads(delta))
+
+
+def _latest_snapshot(session, document_id):
+    return session.execute(
+        select(DocumentVersion)
+        .where(DocumentVersion.document_id == document_id, DocumentVersion.kind == 'snapshot')
+        .order_by(DocumentVersion.version.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def build_version(session, document_id, version, content, created_at=None):
+    """The DocumentVersion row storing `content` as `version`, as a delta when that is cheaper"""
+    row = DocumentVersion(version=version, size=len(content or ''), created_at=created_at or datetime.utcnow())
+    if document_id is not None:
+        row.document_id = document_id
+    full = compress(content or '')
+
+    snapshot = _latest_snapshot(session, document_id) if document_id is not None else None
+    if snapshot is not None and version - snapshot.version < SNAPSHOT_EVERY:
+        delta = compress(make_delta(decompress(snapshot.data), content))
+        if len(delta) <= len(full) * MAX_DELTA_RATIO:
+            row.kind, row.base_version, row.data = 'delta', snapshot.version, delta
+            return row
+    row.kind, row.base_version, row.data = 'snapshot', None, full
+    return row
+
+
+def record_version(session, document_id, version, content):
+    """Add the history row of a content write made outside the ORM (e.g. a bulk UPDATE)"""
+    row = build_version(session, document_id, version, content)
+    session.add(row)
+    if row.kind == 'snapshot':
+        prune(session, document_id, keep_version=version)
+    return row
+
+
+def get_content(session, document_id, version):
+    """Rebuild the content of a version, or None when it is not in the history"""
+    row = session.execute(
+        select(DocumentVersion)
+        .where(DocumentVersion.document_id == document_id, DocumentVersion.version == version)
+    ).scalar_one_or_none()
+    if row is None:
+        return None
+    if row.kind == 'snapshot':
+        return decompress(row.data)
+    base = session.execute(
+        select(DocumentVersion.data)
+        .where(DocumentVersion.document_id == document_id, DocumentVersion.version == row.base_version)
+    ).scalar_one()
+    return apply_delta(decompress(base), decompress(row.data))
+
+
+def list_versions(session, document_id, limit=50, before=None):
+    statement = (
+        select(DocumentVersion.version, DocumentVersion.kind, DocumentVersion.size, DocumentVersion.created_at)
+        .where(DocumentVersion.document_id == document_id)
+        .order_by(DocumentVersion.version.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        statement = statement.where(DocumentVersion.version < before)
+    return [{'version': row.version, 'kind': row.kind, 'size': row.size, 'created_at': row.created_at.isoformat()}
+            for row in session.execute(statement)]
+
+
+def prune(session, document_id, keep_version=None, now=None):
+    """Apply the retention policy to one document's history; returns the number of rows removed"""
+    rows = session.execute(
+        select(DocumentVersion.version, DocumentVersion.kind, DocumentVersion.base_version,
+               DocumentVersion.created_at)
+        .where(DocumentVersion.document_id == document_id)
+        .order_by(DocumentVersion.version.desc())
+    ).all()
+    if not rows:
+        return 0
+    keep_version = keep_version if keep_version is not None else rows[0].version
+    recent = {row.version for row in rows[:KEEP_VERSIONS]} | {keep_version}
+    cutoff = (now or datetime.utcnow()) - timedelta(days=KEEP_DAYS)
+
+    # Group each snapshot with the deltas built on it
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.version if row.kind == 'snapshot' else row.base_version, []).append(row)
+
+    doomed = set()
+    for snapshot_version, members in groups.items():
+        versions = {row.version for row in members}
+        newest = max(row.created_at for row in members)
+        if newest < cutoff and not versions & recent:
+            doomed |= versions
+        else:
+            doomed |= {row.version for row in members if row.kind == 'delta' and row.version not in recent}
+
+    if doomed:
+        session.execute(
+            delete(DocumentVersion)
+            .where(DocumentVersion.document_id == document_id, DocumentVersion.version.in_(doomed))
+            .execution_options(synchronize_session=False)
+        )
+    return len(doomed)
+
+
+def _record_document_changes(session, flush_context, instances):
+    for document in list(session.new) + list(session.dirty):
+        if not isinstance(document, Document):
+            continue
+        state = inspect(document)
+        if not state.pending:
+            if not state.attrs.content.history.has_changes():
+                continue
+            if not state.attrs.version.history.has_changes():
+                document.version = (document.version or 0) + 1
+        row = build_version(session, document.id, document.version or 1, document.content)
+        if document.id is None:
+            row.document = document
+        session.add(row)
+        if row.kind == 'snapshot' and document.id is not None:
+            prune(session, document.id, keep_version=row.version)
+
+
+def track_history(session_class):
+    """Record a DocumentVersion whenever a Document's content is written through the ORM"""
+    from sqlalchemy import event
+
+    if not event.contains(session_class, 'before_flush', _record_document_changes):
+        event.listen(session_class, 'before_flush', _record_document_changes)
@@ -0,0 +1,206 @@
+"""
+Streaming export of a user's conversations and documents.
+
+Two formats:
+
+- ndjson: one JSON object per line. Each conversation line ("type":
+  "conversation") is followed by its answers ("type": "answer"), oldest
+  first, and the documents ("type": "document") come last.
+- zip: conversations/<id>-<title>.md with the transcript in markdown and
+  documents/<id>-<name>.html with the editor content.
+
+Rows are read in batches of EXPORT_BATCH_SIZE (200; documents, the large
+rows, EXPORT_DOCUMENT_BATCH_SIZE, 20): conversations by keyset, answers and
+documents through a server-side cursor (yield_per), on the session's
+connection and as plain columns so nothing accumulates in the session. The
+ZIP is written entry by entry to a stream that hands its bytes to the
+response as they are produced (entries use data descriptors, so no seeking
+is needed). Memory therefore stays flat whatever the size of the account.
+"""
+import json
+import os
+import re
+import zipfile
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import Answer, Conversation, Document
+
+BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 200))
+DOCUMENT_BATCH_SIZE = int(os.environ.get('EXPORT_DOCUMENT_BATCH_SIZE', 20))
+# Bytes buffered before the ZIP stream hands a chunk to the response
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'zip': ('application/zip', 'zip'),
+}
+
+SLUG_PATTERN = re.compile(r'[^A-Za-z0-9]+')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def conversation_batches(session, user_id, batch_size=BATCH_SIZE):
+    """Lists of a user's conversations, by id, each list read with one keyset query"""
+    last_id = 0
+    while True:
+        batch = session.connection().execute(
+            select(Conversation.id, Conversation.title, Conversation.nace_sector, Conversation.esrs_sector,
+                   Conversation.company_description, Conversation.created_at, Conversation.updated_at)
+            .where(Conversation.user_id == user_id, Conversation.id > last_id)
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def iter_answers(session, conversation_ids, batch_size=BATCH_SIZE):
+    """Answers of the conversations, grouped by conversation and oldest first"""
+    return session.connection().execute(
+        select(Answer.id, Answer.conversation_id, Answer.question, Answer.answer_markdown, Answer.answer,
+               Answer.created_at)
+        .where(Answer.conversation_id.in_(conversation_ids))
+        .order_by(Answer.conversation_id, Answer.created_at, Answer.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+
+def iter_documents(session, user_id, batch_size=DOCUMENT_BATCH_SIZE):
+    return session.connection().execute(
+        select(Document.id, Document.name, Document.version, Document.content, Document.created_at,
+               Document.updated_at)
+        .where(Document.user_id == user_id)
+        .order_by(Document.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+
+def iter_conversations(session, user_id, batch_size=BATCH_SIZE):
+    """(conversation, answers) pairs, where answers is an iterator that must be consumed in order"""
+    for batch in conversation_batches(session, user_id, batch_size):
+        answers = iter_answers(session, [conversation.id for conversation in batch], batch_size)
+        pending = next(answers, None)
+        for conversation in batch:
+            def own_answers(conversation_id=conversation.id):
+                nonlocal pending
+                # Answers of earlier conversations the caller did not read
+                while pending is not None and pending.conversation_id < conversation_id:
+                    pending = next(answers, None)
+                while pending is not None and pending.conversation_id == conversation_id:
+                    yield pending
+                    pending = next(answers, None)
+            yield conversation, own_answers()
+        answers.close()
+
+
+def ndjson_lines(session, user_id, batch_size=BATCH_SIZE):
+    for conversation, answers in iter_conversations(session, user_id, batch_size):
+        yield json.dumps({
+            'type': 'conversation',
+            'id': conversation.id,
+            'title': conversation.title,
+            'nace_sector': conversation.nace_sector,
+            'esrs_sector': conversation.esrs_sector,
+            'company_description': conversation.company_description,
+            'created_at': _isoformat(conversation.created_at),
+            'updated_at': _isoformat(conversation.updated_at)
+        }) + "\n"
+        for answer in answers:
+            yield json.dumps({
+                'type': 'answer',
+                'id': answer.id,
+                'conversation_id': answer.conversation_id,
+                'question': answer.question,
+                'markdown': answer.answer_markdown if answer.answer_markdown is not None else answer.answer,
+                'html': answer.answer,
+                'created_at': _isoformat(answer.created_at)
+            }) + "\n"
+
+    for document in iter_documents(session, user_id):
+        yield json.dumps({
+            'type': 'document',
+            'id': document.id,
+            'name': document.name,
+            'version': document.version,
+            'content': document.content,
+            'created_at': _isoformat(document.created_at),
+            'updated_at': _isoformat(document.updated_at)
+        }) + "\n"
+
+
+class _ChunkStream:
+    """Write-only, unseekable file object whose bytes are collected until the generator takes them"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _file_name(folder, item_id, title, extension):
+    slug = SLUG_PATTERN.sub('-', title or '').strip('-')[:60] or 'untitled'
+    return f"{folder}/{item_id}-{slug}.{extension}"
+
+
+def _zip_info(name, modified):
+    info = zipfile.ZipInfo(name, date_time=(modified or datetime.utcnow()).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def zip_chunks(session, user_id, batch_size=BATCH_SIZE):
+    """Bytes of a ZIP archive of the user's content, produced as the rows are read"""
+    stream = _ChunkStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for conversation, answers in iter_conversations(session, user_id, batch_size):
+            name = _file_name('conversations', conversation.id, conversation.title, 'md')
+            with archive.open(_zip_info(name, conversation.updated_at), 'w', force_zip64=True) as entry:
+                header = f"# {conversation.title}\n\n"
+                if conversation.nace_sector:
+                    header += f"NACE sector: {conversation.nace_sector}\n\n"
+                if conversation.company_description:
+                    header += f"{conversation.company_description}\n\n"
+                entry.write(header.encode('utf-8'))
+                for answer in answers:
+                    markdown = answer.answer_markdown if answer.answer_markdown is not None else answer.answer
+                    entry.write(f"## {answer.question}\n\n{markdown or ''}\n\n".encode('utf-8'))
+                    if len(stream.buffer) >= CHUNK_SIZE:
+                        yield stream.take()
+            if len(stream.buffer) >= CHUNK_SIZE:
+                yield stream.take()
+
+        for document in iter_documents(session, user_id):
+            name = _file_name('documents', document.id, document.name, 'html')
+            with archive.open(_zip_info(name, document.updated_at), 'w', force_zip64=True) as entry:
+                entry.write((document.content or '').encode('utf-8'))
+            if len(stream.buffer) >= CHUNK_SIZE:
+                yield stream.take()
+    yield stream.take()
+
+
+def export_chunks(session, user_id, fmt):
+    if fmt == 'zip':
+        return zip_chunks(session, user_id)
+    return ndjson_lines(session, user_id)
@@ -0,0 +1,39 @@
+# Gunicorn configuration: gunicorn -c gunicorn.conf.py app:app
+#
+# The default "gthread" worker runs many request threads per process, so
+# requests waiting on the LLM (network I/O) no longer occupy a whole worker,
+# while models and vectorstores are still loaded once per process. CPU-bound
+# inference is bounded separately by INFERENCE_THREADS (see inference.py).
+#
+# GUNICORN_WORKER_CLASS=gevent is also supported (requires `pip install gevent`);
+# it cannot preload the app because monkey patching must happen first.
+#
+# Each worker's database pool is sized from GUNICORN_THREADS (DB_POOL_SIZE
+# defaults to it, plus DB_MAX_OVERFLOW, 10, for background threads), so no
+# request thread waits on the pool. A worker can then open DB_POOL_SIZE +
+# DB_MAX_OVERFLOW connections: WEB_CONCURRENCY times that must stay under the
+# database's max_connections. Lower GUNICORN_THREADS to fit, not the pool.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+# Models and indexes are loaded in the background in each worker by default,
+# so workers start answering (health checks, static files) within seconds.
+# WARMUP_MODE=blocking loads them once in the master before forking instead,
+# trading a slower start for memory shared between workers.
+warmup_mode = os.environ.setdefault('WARMUP_MODE', 'background')
+preload_app = worker_class != 'gevent' and warmup_mode == 'blocking'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
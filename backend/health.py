@@ -0,0 +1,67 @@
+"""
+Liveness and readiness checks.
+
+Liveness only says the process is serving requests. Readiness reports each
+warm-up component (vectorstores, reranker, embedder), database connectivity
+and whether the LLM gateway has a healthy backend, and is only true once
+all of them are usable. Optional components (the per-sector vectorstores,
+whose sectors fall back to the default store) do not block readiness: when
+one of them fails the status is "degraded" but the process still takes
+traffic.
+"""
+import time
+
+from sqlalchemy import text
+
+
+def check_database(db):
+    """Run a trivial query through the pool and report how long it took"""
+    start = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+        status, error = 'ready', None
+    except Exception as e:
+        db.session.rollback()
+        status, error = 'failed', str(e)
+    finally:
+        db.session.remove()
+    report = {'status': status, 'latency_seconds': round(time.perf_counter() - start, 4), 'error': error}
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        report['pool'] = {'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': pool.overflow()}
+    return report
+
+
+def check_llm(router, task='answer'):
+    """Passive check: the gateway is usable while at least one backend for the task is not ejected"""
+    backends = {b.name: b.is_healthy() for b in router.backends_for(task)}
+    return {
+        'status': 'ready' if any(backends.values()) else 'failed',
+        'backends': backends,
+        'error': None if any(backends.values()) else f"All LLM backends for '{task}' are ejected"
+    }
+
+
+def readiness_report(warmup, db, router, lazy=False):
+    """Readiness of every dependency; in lazy mode components that have not loaded yet do not count"""
+    progress = warmup.progress()
+    components = progress['components']
+
+    checks = dict(components)
+    checks['database'] = check_database(db)
+    checks['llm'] = check_llm(router)
+
+    def usable(name, check):
+        if check.get('optional'):
+            return True
+        if name in components and lazy:
+            return check['status'] != 'failed'
+        return check['status'] == 'ready'
+
+    ready = all(usable(name, check) for name, check in checks.items())
+    degraded = any(check.get('optional') and check['status'] == 'failed' for check in checks.values())
+    return {
+        'status': 'not_ready' if not ready else 'degraded' if degraded else 'ready',
+        'warmup_seconds': progress['elapsed_seconds'],
+        'checks': checks
+    }, ready
@@ -0,0 +1,58 @@
+"""
+Bounded thread pool for CPU-bound model work (embedding, FAISS search, reranking).
+
+Request threads spend most of their time waiting on the LLM, so a worker can
+run many of them at once (see gunicorn.conf.py). Model inference is the
+exception: it is CPU-bound, so it is funnelled through a small fixed pool
+sized to the available cores instead of running on every request thread.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', min(4, os.cpu_count() or 1)))
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def _gevent_threadpool():
+    """The gevent hub's native thread pool when running under a patched gevent worker"""
+    try:
+        from gevent import monkey, get_hub
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('threading'):
+        return None
+    return get_hub().threadpool
+
+
+def _get_executor():
+    # Created lazily and per process, since --preload forks after import
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix='inference')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def run_inference(fn, *args, **kwargs):
+    """Run fn on the inference pool and wait for its result"""
+    # Run in a copy of the caller's context so tracing spans nest under the request
+    context = contextvars.copy_context()
+    pool = _gevent_threadpool()
+    if pool is not None:
+        return pool.apply(context.run, (fn,) + args, kwargs)
+    return _get_executor().submit(context.run, fn, *args, **kwargs).result()
+
+
+def limit_torch_threads():
+    """Keep torch from spawning one intra-op thread per core in every inference thread"""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // INFERENCE_THREADS))
@@ -89,7 +89,7 @@ def main():
         print("✅ Flask app configured")
         
         # Import models and db - IMPORTANT: use the same db instance
-        from models import db, User, Conversation, Answer, Document
+        from models import db, User, Conversation, Answer, Document, create_indexes
         print("✅ Models and db imported")
         
         # Initialize db with our app
@@ -120,6 +120,10 @@ def main():
                 db.create_all()
                 print("✅ db.create_all() completed successfully")
                 
+                # Indexes added to tables that already existed
+                for name in create_indexes(db):
+                    print(f"  ✅ Created index {name}")
+                
             except Exception as create_error:
                 print(f"❌ Table creation failed: {create_error}")
                 import traceback
@@ -0,0 +1,234 @@
+"""
+Persistent background job queue backed by the `jobs` table.
+
+Long-running work (LLM answers, questionnaires) is enqueued as a Job row
+and picked up by a pool of worker threads, so web workers can return a job
+id immediately. Workers claim jobs with a conditional UPDATE, so several
+processes can share the same table. Set JOB_WORKERS=0 in the web processes
+and run `flask jobs-worker` to keep generation out of them entirely.
+
+While a job runs, its process refreshes the job's heartbeat_at every
+JOB_HEARTBEAT_SECONDS (30). A running job whose heartbeat is older than
+JOB_STALE_SECONDS (900) belongs to a worker that died: it is queued again,
+or failed once it has been claimed JOB_MAX_ATTEMPTS (3) times, so a job
+that crashes its worker is not retried forever.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from models import db, Job
+from tracing import trace
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.workers = 0
+        self.poll_interval = 1.0
+        self.stale_seconds = 900
+        self.heartbeat_seconds = 30
+        self.max_attempts = 3
+        self._threads = []
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._pid = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = int(app.config.get('JOB_WORKERS', os.environ.get('JOB_WORKERS', 2)))
+        self.poll_interval = float(app.config.get('JOB_POLL_INTERVAL', os.environ.get('JOB_POLL_INTERVAL', 1.0)))
+        self.stale_seconds = int(app.config.get('JOB_STALE_SECONDS', os.environ.get('JOB_STALE_SECONDS', 900)))
+        self.heartbeat_seconds = float(app.config.get('JOB_HEARTBEAT_SECONDS',
+                                                      os.environ.get('JOB_HEARTBEAT_SECONDS', 30)))
+        self.max_attempts = int(app.config.get('JOB_MAX_ATTEMPTS', os.environ.get('JOB_MAX_ATTEMPTS', 3)))
+        app.extensions['job_queue'] = self
+
+    def handler(self, kind):
+        """Register fn(payload, report_progress) as the handler for a job kind"""
+        def decorator(fn):
+            self.handlers[kind] = fn
+            return fn
+        return decorator
+
+    def enqueue(self, kind, payload, user_id=None):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job = Job(kind=kind, payload=json.dumps(payload), user_id=user_id)
+        db.session.add(job)
+        db.session.commit()
+        self.ensure_started()
+        self._wakeup.set()
+        return job
+
+    def ensure_started(self, workers=None):
+        """Start the worker threads in this process (once per process, so it is fork-safe)"""
+        workers = self.workers if workers is None else workers
+        if workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._running = set()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(workers)
+            ]
+            self._threads.append(threading.Thread(target=self._beat, name='job-heartbeat', daemon=True))
+            for thread in self._threads:
+                thread.start()
+        logger.info(f"Started {workers} job workers in process {self._pid}")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job = self._claim()
+                    if job is not None:
+                        self._execute(job)
+                        continue
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _beat(self):
+        """Refresh the heartbeat of the jobs running in this process"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self.app.app_context():
+                    Job.query.filter(Job.id.in_(running), Job.status == 'running').update(
+                        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+            except Exception as e:
+                logger.error(f"Job heartbeat error: {str(e)}")
+
+    def _claim(self):
+        self._requeue_stale()
+        candidate = (db.session.query(Job.id)
+                     .filter(Job.status == 'queued')
+                     .order_by(Job.created_at)
+                     .first())
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        now = datetime.utcnow()
+        claimed = (Job.query
+                   .filter(Job.id == candidate.id, Job.status == 'queued')
+                   .update({'status': 'running', 'started_at': now, 'heartbeat_at': now,
+                            'attempts': Job.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed != 1:
+            return None
+        return db.session.get(Job, candidate.id)
+
+    def _requeue_stale(self):
+        now = datetime.utcnow()
+        # Rows claimed before heartbeats existed only have started_at
+        stale = (Job.status == 'running',
+                 db.func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=self.stale_seconds))
+        failed = (Job.query
+                  .filter(*stale, Job.attempts >= self.max_attempts)
+                  .update({'status': 'failed', 'finished_at': now,
+                           'error': f"Worker stopped responding ({self.max_attempts} attempts)"},
+                          synchronize_session=False))
+        requeued = (Job.query
+                    .filter(*stale)
+                    .update({'status': 'queued'}, synchronize_session=False))
+        if failed or requeued:
+            db.session.commit()
+        if failed:
+            logger.error(f"Failed {failed} jobs whose workers stopped responding")
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale jobs")
+
+    @contextmanager
+    def _running_job(self, job_id):
+        """Mark a job as running in this process, for the heartbeat thread"""
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _execute(self, job):
+        handler = self.handlers.get(job.kind)
+        job_id, kind = job.id, job.kind
+
+        def report_progress(progress):
+            Job.query.filter_by(id=job_id).update({'progress': json.dumps(progress),
+                                                  'heartbeat_at': datetime.utcnow()},
+                                                 synchronize_session=False)
+            db.session.commit()
+
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{kind}'")
+            with self._running_job(job_id), trace(f"job {kind}", job_id=job_id):
+                result = handler(json.loads(job.payload or '{}'), report_progress)
+            outcome = {'status': 'done', 'result': json.dumps(result)}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Job {job_id} ({kind}) failed: {str(e)}\n{traceback.format_exc()}")
+            outcome = {'status': 'failed', 'error': str(e)}
+        outcome['finished_at'] = datetime.utcnow()
+        if not Job.query.filter_by(id=job_id).update(outcome, synchronize_session=False):
+            # Deleted while it ran, together with its owner's account
+            logger.info(f"Job {job_id} ({kind}) no longer exists, result dropped")
+        db.session.commit()
+
+    def wait(self, job_id, timeout):
+        """Block until a job finishes or timeout seconds pass, returning the latest row"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = db.session.get(Job, job_id)
+            if job is None or job.status in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            # Ending the read transaction expires the row so the next get sees updates
+            db.session.rollback()
+            time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': json.loads(job.progress) if job.progress else None,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,490 @@
+"""
+Registry of OpenAI-compatible LLM backends with per-task routing.
+
+Backends are configured with a JSON document, read from the file named by
+LLM_BACKENDS_FILE or from the LLM_BACKENDS environment variable:
+
+    {
+        "backends": {
+            "nvidia": {"base_url": "https://integrate.api.nvidia.com/v1",
+                       "model": "nvidia/llama-3.3-nemotron-super-49b-v1",
+                       "api_key_env": "NVIDIA_API_KEY", "weight": 3},
+            "ollama": {"base_url": "http://localhost:11434/v1",
+                       "model": "llama3.2:1b", "weight": 1}
+        },
+        "tasks": {
+            "nace": {"backends": ["nvidia", "ollama"]},
+            "title": {"backends": ["ollama"]},
+            "answer": {"backends": ["nvidia", "ollama"], "hedge_percentile": 95}
+        }
+    }
+
+Tasks without an entry use every backend. When nothing is configured the
+NVIDIA endpoint is used on its own, as before.
+
+Besides OpenAI-compatible servers (Ollama, vLLM, llama.cpp's /v1 API),
+"kind": "llamacpp" targets the native llama.cpp server /completion API.
+Each backend can set "max_concurrency" (requests sent at once) and
+"max_queue"/"queue_timeout" (callers allowed to wait for a slot), so a small
+CPU-bound local model is never oversubscribed.
+
+Streaming is opt-in: set "stream": true on a backend, or LLM_STREAM=1 for
+every backend that does not say, to stream completions and measure time to
+first token. Usage in the final chunk (stream_options.include_usage) is
+only requested from backends that also set "stream_usage": true; the others
+fall back to counting the words of the completion.
+
+Run `python llm_backends.py --benchmark` to compare the configured backends.
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import LLM_ERRORS, LLM_SECONDS, LLM_TOKENS, LLM_TTFT_SECONDS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKENDS = {
+    'nvidia': {
+        'base_url': 'https://integrate.api.nvidia.com/v1',
+        'model': 'nvidia/llama-3.3-nemotron-super-49b-v1',
+        'api_key_env': 'NVIDIA_API_KEY',
+        'stream_usage': True
+    }
+}
+
+# Used by the offline CLI when no configuration is given
+LOCAL_BACKENDS = {
+    'ollama': {
+        'base_url': 'http://localhost:11434/v1',
+        'model': 'llama3.2:1b',
+        'max_concurrency': 1
+    }
+}
+
+TASKS = ('nace', 'title', 'answer')
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class BackendBusy(Exception):
+    """The backend's concurrency limit and wait queue are both full"""
+    pass
+
+
+class LLMBackend:
+    """A single OpenAI-compatible endpoint and its health/latency record"""
+
+    kind = 'openai'
+
+    def __init__(self, name, base_url, model, api_key=None, api_key_env=None, weight=1,
+                 timeout=300, max_failures=3, ejection_seconds=30, latency_window=200,
+                 max_concurrency=None, max_queue=None, queue_timeout=None, stream=None,
+                 stream_usage=False):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key or (os.environ.get(api_key_env) if api_key_env else None) or 'not-needed'
+        self.weight = float(weight)
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+        if stream is None:
+            stream = os.environ.get('LLM_STREAM', '0').lower() in ('1', 'true', 'yes')
+        self.stream = stream
+        self.stream_usage = stream_usage
+
+        # Concurrency governor: at most max_concurrency requests in flight and
+        # at most max_queue callers waiting (up to queue_timeout) for a slot
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout if queue_timeout is not None else timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._queued = 0
+        self.rejected = 0
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._consecutive_failures = 0
+        self._ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key, timeout=self.timeout)
+        return self._client
+
+    def is_healthy(self):
+        return time.monotonic() >= self._ejected_until
+
+    def complete(self, messages, **params):
+        return self.generate(messages, **params)[0]
+
+    def generate(self, messages, **params):
+        """Run a completion, returning (content, completion_tokens)"""
+        self._acquire()
+        try:
+            start = time.monotonic()
+            with self._lock:
+                self.requests += 1
+            try:
+                with span('llm.request', backend=self.name, model=self.model) as request_span:
+                    content, tokens = self._request(messages, **params)
+                    if request_span is not None:
+                        request_span.set(completion_tokens=tokens)
+            except Exception:
+                self._record_failure()
+                LLM_ERRORS.inc(backend=self.name)
+                raise
+            elapsed = time.monotonic() - start
+            self._record_success(elapsed)
+            LLM_SECONDS.observe(elapsed, backend=self.name)
+            LLM_TOKENS.inc(tokens, backend=self.name, direction='out')
+            return content, tokens
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _request(self, messages, **params):
+        if not self.stream:
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=False,
+                **params
+            )
+            usage = getattr(completion, 'usage', None)
+            content = completion.choices[0].message.content.strip()
+            self._record_prompt_tokens(usage)
+            return content, getattr(usage, 'completion_tokens', None) or len(content.split())
+
+        if self.stream_usage:
+            params = dict(params, stream_options={'include_usage': True})
+        start = time.monotonic()
+        chunks = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **params
+        )
+        parts, usage = [], None
+        for chunk in chunks:
+            usage = getattr(chunk, 'usage', None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    LLM_TTFT_SECONDS.observe(time.monotonic() - start, backend=self.name)
+                parts.append(delta)
+        content = "".join(parts).strip()
+        self._record_prompt_tokens(usage)
+        return content, getattr(usage, 'completion_tokens', None) or len(content.split())
+
+    def _record_prompt_tokens(self, usage):
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, backend=self.name, direction='in')
+
+    def _acquire(self):
+        if self._slots is None:
+            return
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            if self.max_queue is not None and self._queued >= self.max_queue:
+                self.rejected += 1
+                raise BackendBusy(f"LLM backend '{self.name}' is saturated")
+            self._queued += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._queued -= 1
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise BackendBusy(f"Timed out waiting for LLM backend '{self.name}'")
+
+    def _record_success(self, elapsed):
+        with self._lock:
+            self._latencies.append(elapsed)
+            self._consecutive_failures = 0
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.max_failures:
+                self._ejected_until = time.monotonic() + self.ejection_seconds
+                self._consecutive_failures = 0
+                logger.warning(f"LLM backend '{self.name}' ejected for {self.ejection_seconds}s after repeated failures")
+
+    def latency_percentile(self, percentile, min_samples=1):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self):
+        return {
+            'kind': self.kind,
+            'model': self.model,
+            'base_url': self.base_url,
+            'weight': self.weight,
+            'healthy': self.is_healthy(),
+            'max_concurrency': self.max_concurrency,
+            'queued': self._queued,
+            'rejected': self.rejected,
+            'requests': self.requests,
+            'failures': self.failures,
+            'p50_seconds': self.latency_percentile(50),
+            'p95_seconds': self.latency_percentile(95)
+        }
+
+
+class LlamaCppBackend(LLMBackend):
+    """A llama.cpp server reached through its native /completion endpoint"""
+
+    kind = 'llamacpp'
+
+    def _request(self, messages, **params):
+        prompt = "".join(f"{m['role'].capitalize()}: {m['content']}\n" for m in messages) + "Assistant:"
+        body = {
+            'prompt': prompt,
+            'n_predict': params.get('max_tokens', -1),
+            'temperature': params.get('temperature', 0.2),
+            'top_p': params.get('top_p', 0.95),
+            'stream': False
+        }
+        request = urllib.request.Request(
+            f"{self.base_url}/completion",
+            data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.api_key}'}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.loads(response.read().decode('utf-8'))
+        content = data.get('content', '').strip()
+        if data.get('tokens_evaluated'):
+            LLM_TOKENS.inc(data['tokens_evaluated'], backend=self.name, direction='in')
+        return content, data.get('tokens_predicted') or len(content.split())
+
+
+BACKEND_KINDS = {
+    'openai': LLMBackend,
+    'llamacpp': LlamaCppBackend
+}
+
+
+class LLMRouter:
+    """Route chat completions for a task to one of its backends.
+
+    Selection is weighted-random among healthy backends. A backend that
+    fails repeatedly is ejected for a cool-down period. When a task has a
+    hedge percentile and the chosen backend has not answered within that
+    percentile of its own recent latency, the same request is sent to a
+    second backend and whichever answers first wins.
+    """
+
+    def __init__(self, backends, tasks=None, hedge_percentile=None, hedge_min_samples=20,
+                 hedge_workers=32):
+        if not backends:
+            raise NoBackendAvailable("No LLM backends configured")
+        self.backends = backends
+        self.tasks = tasks or {}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='llm-hedge')
+        # Guards the hedge counters, updated from request and hedge threads
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def backends_for(self, task):
+        names = self.tasks.get(task, {}).get('backends')
+        if not names:
+            return list(self.backends.values())
+        return [self.backends[name] for name in names if name in self.backends]
+
+    def choose(self, task, exclude=()):
+        candidates = [b for b in self.backends_for(task) if b.name not in exclude]
+        healthy = [b for b in candidates if b.is_healthy()]
+        pool = healthy or candidates
+        if not pool:
+            raise NoBackendAvailable(f"No LLM backend available for task '{task}'")
+        return random.choices(pool, weights=[max(b.weight, 0.0001) for b in pool])[0]
+
+    def complete(self, task, messages, **params):
+        primary = self.choose(task)
+        percentile = self.tasks.get(task, {}).get('hedge_percentile', self.hedge_percentile)
+        hedge_after = None
+        if percentile and len(self.backends_for(task)) > 1:
+            hedge_after = primary.latency_percentile(percentile, self.hedge_min_samples)
+
+        if hedge_after is None:
+            try:
+                return primary.complete(messages, **params)
+            except Exception as e:
+                fallback = self._fallback(task, primary)
+                if fallback is None:
+                    raise
+                logger.warning(f"LLM backend '{primary.name}' failed ({e}), retrying on '{fallback.name}'")
+                return fallback.complete(messages, **params)
+
+        return self._hedged(task, primary, hedge_after, messages, params)
+
+    def _fallback(self, task, failed):
+        try:
+            return self.choose(task, exclude=(failed.name,))
+        except NoBackendAvailable:
+            return None
+
+    def _hedged(self, task, primary, hedge_after, messages, params):
+        futures = {self._executor.submit(contextvars.copy_context().run, primary.complete, messages, **params): primary}
+        done, _ = wait(futures, timeout=hedge_after)
+
+        if not done or next(iter(done)).exception() is not None:
+            secondary = self._fallback(task, primary)
+            if secondary is not None:
+                with self._lock:
+                    self.hedges_sent += 1
+                futures[self._executor.submit(contextvars.copy_context().run, secondary.complete, messages,
+                                              **params)] = secondary
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] is not primary:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            hedges_sent, hedges_won = self.hedges_sent, self.hedges_won
+        return {
+            'backends': {name: backend.stats() for name, backend in self.backends.items()},
+            'hedges_sent': hedges_sent,
+            'hedges_won': hedges_won
+        }
+
+
+def load_backend_config(default_backends=None):
+    """Read the backend configuration from LLM_BACKENDS_FILE or LLM_BACKENDS"""
+    path = os.environ.get('LLM_BACKENDS_FILE')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    raw = os.environ.get('LLM_BACKENDS')
+    if raw:
+        return json.loads(raw)
+    return {'backends': default_backends or DEFAULT_BACKENDS}
+
+
+def create_router(config=None):
+    config = config or load_backend_config()
+    backends = {}
+    for name, options in config.get('backends', {}).items():
+        options = dict(options)
+        kind = options.pop('kind', 'openai')
+        if options.get('api_key_env') and not options.get('api_key') and not os.environ.get(options['api_key_env']):
+            logger.error(f"LLM backend '{name}' skipped: {options['api_key_env']} is not set")
+            continue
+        backend_class = BACKEND_KINDS.get(kind)
+        if backend_class is None:
+            raise ValueError(f"Unknown kind '{kind}' for LLM backend '{name}'")
+        backends[name] = backend_class(name, **options)
+    return LLMRouter(
+        backends,
+        tasks=config.get('tasks'),
+        hedge_percentile=config.get('hedge_percentile'),
+        hedge_min_samples=config.get('hedge_min_samples', 20)
+    )
+
+
+def benchmark_backends(router, prompt="Summarise the purpose of the ESRS E1 climate standard.",
+                       runs=5, concurrency=1, max_tokens=256):
+    """Send the same prompt to every backend and report latency and tokens/sec"""
+    messages = [{"role": "user", "content": prompt}]
+    report = {}
+
+    for name, backend in router.backends.items():
+        latencies, tokens, errors = [], 0, 0
+
+        def run_once(_):
+            start = time.monotonic()
+            _, produced = backend.generate(messages, temperature=0, max_tokens=max_tokens)
+            return time.monotonic() - start, produced
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = [executor.submit(run_once, i) for i in range(runs)]
+            for future in futures:
+                try:
+                    elapsed, produced = future.result()
+                    latencies.append(elapsed)
+                    tokens += produced
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Benchmark request to '{name}' failed: {e}")
+        wall = time.monotonic() - started
+
+        latencies.sort()
+        report[name] = {
+            'model': backend.model,
+            'runs': runs,
+            'errors': errors,
+            'p50_seconds': latencies[len(latencies) // 2] if latencies else None,
+            'max_seconds': latencies[-1] if latencies else None,
+            'tokens_per_second': tokens / wall if wall and tokens else 0.0
+        }
+    return report
+
+
+def print_benchmark(report):
+    print(f"{'backend':<20} {'model':<40} {'p50 s':>8} {'max s':>8} {'tok/s':>8} {'errors':>7}")
+    for name, row in report.items():
+        p50 = f"{row['p50_seconds']:.2f}" if row['p50_seconds'] is not None else '-'
+        worst = f"{row['max_seconds']:.2f}" if row['max_seconds'] is not None else '-'
+        print(f"{name:<20} {row['model']:<40} {p50:>8} {worst:>8} {row['tokens_per_second']:>8.1f} {row['errors']:>7}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect and benchmark the configured LLM backends')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark every configured backend')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--max-tokens', type=int, default=256)
+    parser.add_argument('--local', action='store_true', help='Use the local Ollama defaults when nothing is configured')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = load_backend_config(LOCAL_BACKENDS if args.local else None)
+    router = create_router(config)
+    if args.benchmark:
+        print_benchmark(benchmark_backends(router, runs=args.runs, concurrency=args.concurrency,
+                                           max_tokens=args.max_tokens))
+    else:
+        print(json.dumps(router.stats(), indent=2))
@@ -0,0 +1,196 @@
+"""
+Non-blocking, structured logging.
+
+Request threads only put records on an in-memory queue (QueueHandler); a
+background QueueListener thread formats them and writes them to stderr and
+to a size-rotated file. Records are JSON by default, carry the current
+trace id, have session/PII fields redacted before they leave the request
+thread, and DEBUG records can be sampled.
+
+Settings (environment):
+  LOG_LEVEL               INFO
+  LOG_FORMAT              json | text
+  LOG_DIR                 directory of esrs_generator.log ('' disables the file)
+  LOG_FILE_MAX_BYTES      10 MB per file, LOG_FILE_BACKUPS files kept (5)
+  LOG_QUEUE_SIZE          records buffered before new ones are dropped (10000)
+  LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept (0.1)
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from tracing import current_trace_id
+
+SENSITIVE_KEYS = ('password', 'csrf_token', 'reset_token', 'verification_token', 'token', 'secret', 'api_key',
+                  'authorization', 'cookie', 'session', 'company_desc', 'company_description', 'email')
+REDACTED = '[redacted]'
+KEY_VALUE_PATTERN = re.compile(
+    r"""(?i)(['"]?\b(?:%s)\b['"]?\s*[:=]\s*)('[^']*'|"[^"]*"|\{[^}]*\}|[^\s,;)}]+)""" % '|'.join(SENSITIVE_KEYS)
+)
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'trace_id'}
+
+
+def redact(text):
+    """Mask sensitive key/value pairs and e-mail addresses in a log message"""
+    text = KEY_VALUE_PATTERN.sub(lambda m: m.group(1) + REDACTED, text)
+    return EMAIL_PATTERN.sub('[email]', text)
+
+
+def _redact_value(key, value):
+    if key.lower() in SENSITIVE_KEYS:
+        return REDACTED
+    if isinstance(value, str):
+        return redact(value)
+    return value
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the request thread: stamps the trace id, redacts and samples"""
+
+    def __init__(self, debug_sample_rate=1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and random.random() >= self.debug_sample_rate:
+            return False
+        if not hasattr(record, 'trace_id'):
+            record.trace_id = current_trace_id()
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in list(vars(record).items()):
+            if key not in RECORD_ATTRIBUTES:
+                setattr(record, key, _redact_value(key, value))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'trace_id': getattr(record, 'trace_id', None),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s [in %(pathname)s:%(lineno)d]')
+
+    def format(self, record):
+        if not hasattr(record, 'trace_id'):
+            record.trace_id = None
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Render the exception on the calling thread; the traceback object is not kept
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state = {'listener': None, 'handler': None}
+_lock = threading.Lock()
+
+
+def _start_listener(log_queue, handlers):
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+
+
+def _after_fork():
+    # The listener thread does not survive a fork: start a new one in the child
+    if _state['listener'] is not None:
+        old = _state['listener']
+        _start_listener(old.queue, old.handlers)
+
+
+def configure_logging(app=None):
+    """Route the root logger (and app.logger) through the background queue; safe to call twice"""
+    with _lock:
+        if _state['handler'] is not None:
+            return _state['handler']
+
+        level = getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+        formatter = TextFormatter() if os.environ.get('LOG_FORMAT', 'json') == 'text' else JsonFormatter()
+
+        handlers = [logging.StreamHandler(sys.stderr)]
+        log_dir = os.environ.get('LOG_DIR', 'logs')
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            handlers.append(RotatingFileHandler(
+                os.path.join(log_dir, 'esrs_generator.log'),
+                maxBytes=int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+                backupCount=int(os.environ.get('LOG_FILE_BACKUPS', 5)),
+                encoding='utf-8'
+            ))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter(float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))))
+        _start_listener(log_queue, handlers)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        if app is not None:
+            from flask.logging import default_handler
+            app.logger.removeHandler(default_handler)
+            app.logger.setLevel(level)
+
+        import atexit
+        atexit.register(shutdown_logging)
+        _state['handler'] = queue_handler
+        return queue_handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    listener = _state['listener']
+    if listener is not None and listener._thread is not None:
+        listener.stop()
@@ -0,0 +1,188 @@
+"""
+Process-local metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are kept in memory and served at /metrics. Each
+gunicorn worker has its own registry, so scrape every worker (or run a
+single worker) to see the full picture. The metrics of the RAG pipeline are
+defined at the bottom of this module so every stage reports under the same
+names.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 45, 60, 90, 120, 180, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# RAG pipeline stages
+EMBEDDING_SECONDS = REGISTRY.histogram('esg_embedding_seconds', 'Time to embed queries', ['store'])
+SEARCH_SECONDS = REGISTRY.histogram('esg_faiss_search_seconds', 'Time spent in FAISS index search', ['store'])
+RERANK_SECONDS = REGISTRY.histogram('esg_rerank_seconds', 'Time spent in cross-encoder reranking')
+CONTEXT_BUILD_SECONDS = REGISTRY.histogram('esg_context_build_seconds', 'Time to assemble context and prompt')
+LLM_TTFT_SECONDS = REGISTRY.histogram('esg_llm_time_to_first_token_seconds', 'Time until the first streamed token',
+                                      ['backend'], LLM_BUCKETS)
+LLM_SECONDS = REGISTRY.histogram('esg_llm_seconds', 'Total time of an LLM completion', ['backend'], LLM_BUCKETS)
+MARKDOWN_RENDER_SECONDS = REGISTRY.histogram('esg_markdown_render_seconds', 'Time to render answer markdown to HTML')
+DB_COMMIT_SECONDS = REGISTRY.histogram('esg_db_commit_seconds', 'Time spent committing database sessions')
+
+CACHE_HITS = REGISTRY.counter('esg_cache_hits_total', 'Requests answered from a cache or a shared in-flight call',
+                              ['cache'])
+LLM_ERRORS = REGISTRY.counter('esg_llm_errors_total', 'Failed LLM completions', ['backend'])
+LLM_TOKENS = REGISTRY.counter('esg_llm_tokens_total', 'Tokens sent to and generated by LLM backends',
+                              ['backend', 'direction'])
+SECTOR_REQUESTS = REGISTRY.counter('esg_sector_requests_total', 'Questions answered per ESRS sector', ['sector'])
+
+
+def _before_commit(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _after_rollback(session):
+    session.info.pop('commit_started', None)
+
+
+def track_commits(session_class):
+    """Observe the duration of every commit made by sessions of the given class"""
+    from sqlalchemy import event
+
+    for name, listener in (('before_commit', _before_commit), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
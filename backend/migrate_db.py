@@ -1,9 +1,13 @@
-# Crear un archivo: backend/migration_update_user_id.py
+# Migraciones incrementales del esquema: python migrate_db.py
+# Cada paso es idempotente y se puede volver a ejecutar sin problemas.
 
 from flask import Flask
-from models import db, User, Conversation, Answer, Document
+from models import (db, User, Conversation, Answer, Document, DocumentVersion, Job, SearchEntry, ServerSession,
+                    create_indexes)
+import search
 from config import get_config
-from sqlalchemy import text
+from sqlalchemy import text, inspect
+from sqlalchemy.orm import Session
 
 # Create a minimal app for database migration
 app = Flask(__name__)
@@ -11,32 +15,68 @@ app.config.from_object(get_config())
 
 db.init_app(app)
 
-with app.app_context():
-    try:
-        # Ejecutar la alteración de la tabla
-        with db.engine.connect() as connection:
-            # Remover la restricción NOT NULL de user_id
-            if db.engine.dialect.name == 'mysql':
-                connection.execute(text("ALTER TABLE conversations MODIFY user_id INTEGER NULL"))
-            elif db.engine.dialect.name == 'postgresql':
-                connection.execute(text("ALTER TABLE conversations ALTER COLUMN user_id DROP NOT NULL"))
-            else:
-                print(f"Unsupported database dialect: {db.engine.dialect.name}")
-                exit(1)
-            
-            connection.commit()
-            
-        print("Successfully updated conversations table - user_id can now be null")
-        
-        # Verificar el cambio
-        from sqlalchemy import inspect
-        inspector = inspect(db.engine)
-        
-        for column in inspector.get_columns('conversations'):
-            if column['name'] == 'user_id':
-                print(f"Column user_id nullable: {column['nullable']}")
-                
-    except Exception as e:
-        print(f"Error during migration: {str(e)}")
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+def make_conversation_user_nullable(connection):
+    # Remover la restricción NOT NULL de user_id
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        connection.execute(text("ALTER TABLE conversations MODIFY user_id INTEGER NULL"))
+    elif dialect == 'postgresql':
+        connection.execute(text("ALTER TABLE conversations ALTER COLUMN user_id DROP NOT NULL"))
+    else:
+        print(f"Skipping user_id nullable migration on {dialect}")
+        return
+
+    print("Successfully updated conversations table - user_id can now be null")
+
+    # Verificar el cambio
+    for column in inspect(connection).get_columns('conversations'):
+        if column['name'] == 'user_id':
+            print(f"Column user_id nullable: {column['nullable']}")
+
+def add_column_if_missing(connection, table, column, ddl):
+    existing = [c['name'] for c in inspect(connection).get_columns(table)]
+    if column in existing:
+        print(f"Column {table}.{column} already exists")
+        return
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    print(f"Added column {table}.{column}")
+
+if __name__ == '__main__':
+    with app.app_context():
+        try:
+            # Ejecutar la alteración de las tablas
+            with db.engine.connect() as connection:
+                make_conversation_user_nullable(connection)
+
+                # Raw markdown next to the rendered HTML of each answer
+                add_column_if_missing(connection, 'answers', 'answer_markdown', 'TEXT')
+
+                # Version number checked by patch-based autosave
+                add_column_if_missing(connection, 'documents', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+                # Background job queue; tables created before heartbeats existed get the column
+                Job.__table__.create(connection, checkfirst=True)
+                add_column_if_missing(connection, 'jobs', 'heartbeat_at', 'DATETIME')
+
+                # Server-side sessions
+                ServerSession.__table__.create(connection, checkfirst=True)
+
+                # Compressed version history of documents
+                DocumentVersion.__table__.create(connection, checkfirst=True)
+
+                # Full-text search entries, filled from the existing rows
+                if not inspect(connection).has_table('search_entries'):
+                    SearchEntry.__table__.create(connection)
+                    with Session(bind=connection) as session:
+                        print(f"Indexed {search.rebuild(session)} rows for search")
+
+                # Composite indexes of the listing and message window queries
+                for name in create_indexes(db, connection):
+                    print(f"Created index {name}")
+
+                connection.commit()
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
@@ -2,11 +2,21 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import DDL, event, inspect
 import uuid
+import markdown
+from metrics import MARKDOWN_RENDER_SECONDS, CACHE_HITS
 
 # Initialize db object that will be imported by other modules
 db = SQLAlchemy()
 
+MARKDOWN_EXTENSIONS = ['tables', 'md_in_html']
+
+def render_markdown(text):
+    """Render answer markdown to the HTML shown in the chat and editor"""
+    with MARKDOWN_RENDER_SECONDS.time():
+        return markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -42,13 +52,20 @@ class User(UserMixin, db.Model):
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
-    
+    # A user's conversations, newest first: the keyset listing in queries.list_conversations
+    # orders by created_at, the blueprint listing by updated_at
+    __table_args__ = (
+        db.Index('ix_conversations_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_conversations_user_updated', 'user_id', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     nace_sector = db.Column(db.String(20), nullable=True)
     title = db.Column(db.Text, nullable=False)
     esrs_sector = db.Column(db.String(50), nullable=True)
-    company_description = db.Column(db.Text, nullable=True)
+    # Large text is deferred: loaded on access, or up front with db.undefer in detail queries
+    company_description = db.deferred(db.Column(db.Text, nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -60,43 +77,196 @@ class Conversation(db.Model):
 
 class Answer(db.Model):
     __tablename__ = 'answers'
+    # Serves the message windows in queries.message_window
+    __table_args__ = (
+        db.Index('ix_answers_conversation_created', 'conversation_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False, index=True)
     question = db.Column(db.Text, nullable=False)
-    answer = db.Column(db.Text, nullable=True)
+    # Raw markdown as returned by the model; `answer` caches its rendered HTML.
+    # Rows written before answer_markdown existed only have the HTML.
+    # Both are deferred and load together (db.undefer_group('body')).
+    answer_markdown = db.deferred(db.Column(db.Text, nullable=True), group='body')
+    answer = db.deferred(db.Column(db.Text, nullable=True), group='body')
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
+    @classmethod
+    def from_markdown(cls, conversation_id, question, text):
+        """Create an answer from model markdown, rendering the HTML cache once"""
+        return cls(
+            conversation_id=conversation_id,
+            question=question,
+            answer_markdown=text,
+            answer=render_markdown(text)
+        )
+    
+    @property
+    def markdown(self):
+        return self.answer_markdown if self.answer_markdown is not None else self.answer
+    
+    @property
+    def html(self):
+        if self.answer is None and self.answer_markdown is not None:
+            self.answer = render_markdown(self.answer_markdown)
+        elif self.answer is not None:
+            CACHE_HITS.inc(cache='answer_html')
+        return self.answer
+    
+    def content(self, fmt='html'):
+        """Answer body in the requested representation ('html' or 'markdown')"""
+        return self.markdown if fmt == 'markdown' else self.html
+    
     def __repr__(self):
         return f'<Answer {self.id} for Conversation {self.conversation_id}>'
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    # A user's documents, by creation (/user/documents) or last edit (/documents)
+    __table_args__ = (
+        db.Index('ix_documents_user_created', 'user_id', 'created_at'),
+        db.Index('ix_documents_user_updated', 'user_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    # Deferred so listings never read the bodies; detail queries use db.undefer(Document.content)
+    content = db.deferred(db.Column(db.Text, nullable=True))
+    # Bumped on every content change; autosave patches are made against it
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
+    def replace_content(self, content):
+        """Overwrite the whole content, as a new version"""
+        # Version first: reading it may refresh the row, which must not flush the new content early
+        self.version = (self.version or 0) + 1
+        self.content = content
+        self.updated_at = datetime.utcnow()
+    
     def __repr__(self):
         return f'<Document {self.id}: {self.name}>'
 
+class SearchEntry(db.Model):
+    """Plain-text copy of a searchable row, indexed for full-text search (see search.py)"""
+    __tablename__ = 'search_entries'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'ref_id', name='uq_search_entries_ref'),
+        db.Index('ix_search_entries_user_kind', 'user_id', 'kind'),
+        # SQLite indexes the entries with an FTS5 table instead
+        db.Index('ix_search_entries_fulltext', 'title', 'body', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    conversation_id = db.Column(db.Integer, nullable=True, index=True)
+    title = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text(16777215), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<SearchEntry {self.kind} {self.ref_id}>'
+
+# On SQLite the entries are indexed by an FTS5 table using them as external content
+event.listen(
+    SearchEntry.__table__, 'after_create',
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+        "title, body, content='search_entries', content_rowid='id', tokenize='porter unicode61')"
+        ).execute_if(dialect='sqlite')
+)
+event.listen(
+    SearchEntry.__table__, 'before_drop',
+    DDL("DROP TABLE IF EXISTS search_fts").execute_if(dialect='sqlite')
+)
+
+class DocumentVersion(db.Model):
+    __tablename__ = 'document_versions'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'version', name='uq_document_versions_version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    # 'snapshot' holds the whole content; 'delta' is relative to the snapshot at base_version
+    kind = db.Column(db.String(10), nullable=False)
+    base_version = db.Column(db.Integer, nullable=True)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary(16 * 1024 * 1024), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    document = db.relationship('Document', backref=db.backref('versions', lazy=True, cascade="all, delete-orphan"))
+    
+    def __repr__(self):
+        return f'<DocumentVersion {self.document_id}@{self.version} ({self.kind})>'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # Refreshed by the worker while the job runs; a stale one means the worker died
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind}: {self.status}>'
+
+class ServerSession(db.Model):
+    __tablename__ = 'sessions'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expiry = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ServerSession {self.id[:8]}>'
+
 # Create indexes for better performance
-def create_indexes(db_instance):
-    """Create additional indexes for better performance"""
-    try:
-        # These will be created automatically due to the index=True parameters above
-        # But we can add custom indexes here if needed
-        pass
-    except Exception as e:
-        print(f"Warning: Could not create additional indexes: {e}")
+def create_indexes(db_instance, connection=None):
+    """Create the indexes declared on the models that are missing from existing tables.
+
+    db.create_all() only creates indexes together with a new table, so tables created
+    before an index was added to __table_args__ need this. Returns the names created.
+    """
+    if connection is None:
+        with db_instance.engine.begin() as connection:
+            return create_indexes(db_instance, connection)
+
+    created = []
+    tables = set(inspect(connection).get_table_names())
+    for table in db_instance.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            try:
+                # Skipped when limited to other dialects with ddl_if
+                index.create(connection)
+            except Exception as e:
+                print(f"Warning: Could not create index {index.name}: {e}")
+        created += sorted({index['name'] for index in inspect(connection).get_indexes(table.name)} - existing)
+    return created
 
 # Validation functions
 def validate_models():
     """Validate that all models are properly defined"""
-    models = [User, Conversation, Answer, Document]
+    models = [User, Conversation, Answer, Document, DocumentVersion, SearchEntry, Job, ServerSession]
     
     for model in models:
         if not hasattr(model, '__tablename__'):
@@ -0,0 +1,241 @@
+"""
+On-demand profiling of live endpoints, for administrators.
+
+Disabled unless PROFILING_ENABLED=1: no hooks or routes are installed, so it
+costs nothing. When enabled, an administrator picks an endpoint and a
+fraction of its requests to profile:
+
+    POST /admin/profiling {"endpoint": "chat", "fraction": 0.1, "mode": "cprofile", "max_profiles": 20}
+
+"cprofile" writes a pstats file per sampled request; "sample" runs a
+statistical sampler on the request thread and writes collapsed stacks
+(flamegraph.pl / speedscope input). Files go to PROFILING_DIR (profiles/).
+GET /admin/profiling/memory reports the top allocators from tracemalloc
+(start the process with PROFILING_TRACEMALLOC=1 to include model and index
+loading) and the estimated size of each loaded model and vectorstore.
+
+Administrators are users listed in ADMIN_USERS (comma-separated usernames)
+or requests carrying the ADMIN_TOKEN in an X-Admin-Token header.
+"""
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import wraps
+
+from flask import Blueprint, current_app, g, jsonify, request, send_from_directory
+from flask_login import current_user
+
+MODES = ('cprofile', 'sample')
+
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/admin/profiling')
+
+
+def _flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def is_admin():
+    token = os.environ.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token')
+    if token and supplied and hmac.compare_digest(token, supplied):
+        return True
+    admins = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+    return current_user.is_authenticated and current_user.username in admins
+
+
+def admin_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({'message': 'Administrator access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval and counts collapsed stacks"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    def __init__(self):
+        self.output_dir = os.environ.get('PROFILING_DIR', 'profiles')
+        self.endpoint = None
+        self.fraction = 0.0
+        self.mode = 'cprofile'
+        self.max_profiles = 20
+        self.written = 0
+        self.memory_report = None
+        # cProfile can only run one profiler at a time on Python 3.12+
+        self._busy = threading.Lock()
+
+    def init_app(self, app, memory_report=None):
+        if not _flag('PROFILING_ENABLED'):
+            return
+        if _flag('PROFILING_TRACEMALLOC') and not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.environ.get('PROFILING_TRACEMALLOC_FRAMES', 1)))
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.memory_report = memory_report
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.register_blueprint(profiling_bp)
+        app.extensions['profiler'] = self
+        app.logger.info("Profiling hooks enabled")
+
+    def configure(self, endpoint, fraction, mode='cprofile', max_profiles=20):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not 0 <= fraction <= 1:
+            raise ValueError("fraction must be between 0 and 1")
+        self.endpoint = endpoint
+        self.fraction = fraction
+        self.mode = mode
+        self.max_profiles = max_profiles
+        self.written = 0
+
+    def _before_request(self):
+        if (self.fraction <= 0 or request.endpoint != self.endpoint or self.written >= self.max_profiles
+                or random.random() >= self.fraction or not self._busy.acquire(blocking=False)):
+            return
+        g.profile_started = time.time()
+        if self.mode == 'cprofile':
+            g.profile = cProfile.Profile()
+            g.profile.enable()
+        else:
+            g.profile = StackSampler(threading.get_ident())
+            g.profile.start()
+
+    def _teardown_request(self, exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            name = f"{self.endpoint}-{int(g.profile_started * 1000)}-{os.getpid()}"
+            if isinstance(profile, cProfile.Profile):
+                profile.disable()
+                profile.dump_stats(os.path.join(self.output_dir, name + '.pstats'))
+            else:
+                profile.stop()
+                profile.write(os.path.join(self.output_dir, name + '.collapsed'))
+            self.written += 1
+        finally:
+            self._busy.release()
+
+    def files(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(f for f in os.listdir(self.output_dir) if f.endswith(('.pstats', '.collapsed')))
+
+    def status(self):
+        return {
+            'endpoint': self.endpoint,
+            'fraction': self.fraction,
+            'mode': self.mode,
+            'max_profiles': self.max_profiles,
+            'written': self.written,
+            'files': self.files(),
+            'tracemalloc': tracemalloc.is_tracing()
+        }
+
+
+def top_allocations(limit=20, group_by='lineno'):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    stats = snapshot.statistics(group_by)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_bytes': current,
+        'peak_bytes': peak,
+        'top': [{'location': str(stat.traceback[0]), 'bytes': stat.size, 'blocks': stat.count}
+                for stat in stats[:limit]]
+    }
+
+
+profiler = Profiler()
+
+
+def _profiler():
+    return current_app.extensions['profiler']
+
+
+@profiling_bp.route('', methods=['GET'])
+@admin_required
+def profiling_status():
+    return jsonify(_profiler().status())
+
+
+@profiling_bp.route('', methods=['POST'])
+@admin_required
+def configure_profiling():
+    data = request.get_json(silent=True) or {}
+    try:
+        _profiler().configure(
+            data.get('endpoint'),
+            float(data.get('fraction', 0)),
+            data.get('mode', 'cprofile'),
+            int(data.get('max_profiles', 20))
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(_profiler().status())
+
+
+@profiling_bp.route('/files/<path:filename>', methods=['GET'])
+@admin_required
+def download_profile(filename):
+    return send_from_directory(os.path.abspath(_profiler().output_dir), filename, as_attachment=True)
+
+
+@profiling_bp.route('/memory', methods=['GET'])
+@admin_required
+def memory_snapshot():
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'message': 'group_by must be lineno, filename or traceback'}), 400
+
+    memory_report = _profiler().memory_report
+    report = {'components': memory_report() if memory_report else {}}
+    if tracemalloc.is_tracing():
+        report['tracemalloc'] = top_allocations(request.args.get('top', 20, type=int), group_by)
+    else:
+        report['tracemalloc'] = None
+        report['message'] = 'Start the process with PROFILING_TRACEMALLOC=1 to see top allocators'
+    return jsonify(report)
@@ -0,0 +1,155 @@
+"""
+Read queries behind the "My content" listings.
+
+Conversations are listed newest first with keyset pagination on
+(created_at, id): the cursor handed to the client encodes the last row of a
+page, and the next page starts strictly after it, so deep pages cost the
+same as the first one and rows created meanwhile never shift the listing.
+Each page is one statement: only the columns the sidebar shows are
+selected, answer counts come from a single grouped subquery and the company
+description is cut in SQL.
+
+Conversation messages are served the same way, as a window: the last
+MESSAGE_WINDOW turns by default, and older turns on request with
+`before_id`, read through the (conversation_id, created_at) index.
+"""
+import base64
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select
+
+from models import db, Conversation, Answer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+DESCRIPTION_PREVIEW_CHARS = 150
+MESSAGE_WINDOW = int(os.environ.get('MESSAGE_WINDOW', 20))
+MAX_MESSAGE_WINDOW = 100
+
+
+def encode_cursor(created_at, conversation_id):
+    raw = json.dumps([created_at.isoformat(), conversation_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, conversation_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _preview(text):
+    if text and len(text) > DESCRIPTION_PREVIEW_CHARS:
+        return text[:DESCRIPTION_PREVIEW_CHARS] + '...'
+    return text
+
+
+def list_conversations(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """One page of a user's conversations, newest first: (items, next_cursor)"""
+    answer_counts = (
+        select(Answer.conversation_id, func.count(Answer.id).label('answer_rows'))
+        .join(Conversation, Conversation.id == Answer.conversation_id)
+        .where(Conversation.user_id == user_id)
+        .group_by(Answer.conversation_id)
+        .subquery()
+    )
+    statement = (
+        select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.nace_sector,
+            Conversation.esrs_sector,
+            Conversation.created_at,
+            # One character more than the preview so we know whether to add an ellipsis
+            func.substr(Conversation.company_description, 1, DESCRIPTION_PREVIEW_CHARS + 1).label('description'),
+            func.coalesce(answer_counts.c.answer_rows, 0).label('answer_rows')
+        )
+        .outerjoin(answer_counts, answer_counts.c.conversation_id == Conversation.id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, conversation_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            Conversation.created_at < created_at,
+            and_(Conversation.created_at == created_at, Conversation.id < conversation_id)
+        ))
+
+    rows = db.session.execute(statement).all()
+    page = rows[:limit]
+    items = [{
+        'id': row.id,
+        'title': row.title,
+        'nace_sector': row.nace_sector,
+        'esrs_sector': row.esrs_sector,
+        'created_at': row.created_at.isoformat(),
+        # Kept as before: the count of stored answer rows, halved
+        'answer_count': row.answer_rows // 2,
+        'company_description': _preview(row.description)
+    } for row in page]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return items, next_cursor
+
+
+def window_args(args):
+    """(limit, before_id, compact) from the query string of a message endpoint"""
+    try:
+        limit = int(args.get('limit', MESSAGE_WINDOW))
+    except (TypeError, ValueError):
+        limit = MESSAGE_WINDOW
+    limit = max(0, min(limit, MAX_MESSAGE_WINDOW))
+    before_id = args.get('before_id', type=int)
+    compact = args.get('compact') in ('1', 'true', 'yes')
+    return limit, before_id, compact
+
+
+def message_window(conversation_id, limit=MESSAGE_WINDOW, before_id=None):
+    """The last `limit` answers of a conversation older than `before_id`, oldest first: (answers, has_more)"""
+    statement = (
+        select(Answer)
+        .options(db.undefer_group('body'))
+        .where(Answer.conversation_id == conversation_id)
+        .order_by(Answer.created_at.desc(), Answer.id.desc())
+        .limit(limit + 1)
+    )
+    if before_id is not None:
+        before = select(Answer.created_at).where(Answer.id == before_id).scalar_subquery()
+        statement = statement.where(or_(
+            Answer.created_at < before,
+            and_(Answer.created_at == before, Answer.id < before_id)
+        ))
+
+    answers = db.session.execute(statement).scalars().all()
+    has_more = len(answers) > limit
+    window = answers[:limit]
+    window.reverse()
+    return window, has_more
+
+
+def window_meta(answers, has_more):
+    """Paging fields returned next to a window: pass `oldest_id` as `before_id` to read further back"""
+    return {'has_more': has_more, 'oldest_id': answers[0].id if answers else None}
+
+
+def compact_turns(answers, fmt='html'):
+    """Compact shape of a window: one {id, q, a} object per question and answer"""
+    return [{'id': answer.id, 'q': answer.question, 'a': answer.content(fmt)} for answer in answers]
@@ -0,0 +1,153 @@
+"""
+Audit of the SQL emitted by each request, for tests and local runs on SQLite.
+
+With QUERY_AUDIT=1 every request records the statements it executes and,
+once the response is built, checks them for:
+
+- N+1 patterns: the same SELECT (parameters aside) executed more than
+  QUERY_AUDIT_REPEAT (3) times in one request;
+- full scans: on SQLite, the EXPLAIN QUERY PLAN of each distinct SELECT
+  scanning a table instead of searching an index, or sorting in a temporary
+  B-tree because no index matches the ORDER BY. Tables listed in
+  QUERY_AUDIT_ALLOW_SCANS (comma separated) are not reported.
+
+Findings are logged; when the app is in testing mode the request fails with
+QueryAuditError instead, so a test client call on an endpoint that regressed
+fails the test. Code outside a request can be audited with capture().
+"""
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT = 3
+
+_local = threading.local()
+
+
+class QueryAuditError(AssertionError):
+    pass
+
+
+class QueryAudit:
+    """Statements executed on this thread while the audit is active"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.statements = []
+
+    def n_plus_one(self, threshold=DEFAULT_REPEAT):
+        """(statement, count) of SELECTs executed more than `threshold` times"""
+        counts = Counter(statement for statement, _ in self.statements if _is_select(statement))
+        return [(statement, count) for statement, count in counts.items() if count > threshold]
+
+    def full_scans(self, connection, allow=()):
+        """(statement, plan detail) of SELECTs that scan a table or sort without an index"""
+        if connection.dialect.name != 'sqlite':
+            return []
+        tables = {name.lower() for name in inspect(connection).get_table_names()} - set(allow)
+        found = []
+        seen = set()
+        for statement, parameters in self.statements:
+            if not _is_select(statement) or statement in seen:
+                continue
+            seen.add(statement)
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            for row in plan:
+                detail = row[-1]
+                scan = re.match(r'SCAN (\w+)', detail)
+                if scan and scan.group(1).lower() in tables:
+                    found.append((statement, detail))
+                elif 'USE TEMP B-TREE FOR ORDER BY' in detail:
+                    found.append((statement, detail))
+        return found
+
+    def problems(self, connection, threshold=DEFAULT_REPEAT, allow=()):
+        problems = [f"N+1: executed {count} times: {statement}"
+                    for statement, count in self.n_plus_one(threshold)]
+        problems += [f"Full scan ({detail}): {statement}"
+                     for statement, detail in self.full_scans(connection, allow)]
+        return problems
+
+    def check(self, connection, threshold=DEFAULT_REPEAT, allow=()):
+        problems = self.problems(connection, threshold, allow)
+        if problems:
+            label = f" in {self.label}" if self.label else ''
+            raise QueryAuditError(f"Query audit failed{label}:\n" + '\n'.join(problems))
+
+
+def _is_select(statement):
+    return statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    audit = getattr(_local, 'audit', None)
+    if audit is not None and not executemany:
+        audit.statements.append((statement, parameters))
+
+
+def _listen():
+    if not event.contains(Engine, 'before_cursor_execute', _record):
+        event.listen(Engine, 'before_cursor_execute', _record)
+
+
+@contextmanager
+def capture(label=None):
+    """Record the statements executed on this thread inside the block"""
+    _listen()
+    previous = getattr(_local, 'audit', None)
+    audit = _local.audit = QueryAudit(label)
+    try:
+        yield audit
+    finally:
+        _local.audit = previous
+
+
+def init_app(app):
+    """Audit every request when QUERY_AUDIT is set"""
+    enabled = str(app.config.get('QUERY_AUDIT', os.environ.get('QUERY_AUDIT', ''))).lower() in ('1', 'true', 'yes')
+    if not enabled:
+        return
+    from flask import g, request
+    from models import db
+
+    threshold = int(app.config.get('QUERY_AUDIT_REPEAT', os.environ.get('QUERY_AUDIT_REPEAT', DEFAULT_REPEAT)))
+    allow = app.config.get('QUERY_AUDIT_ALLOW_SCANS', os.environ.get('QUERY_AUDIT_ALLOW_SCANS', ''))
+    if isinstance(allow, str):
+        allow = [name.strip().lower() for name in allow.split(',') if name.strip()]
+    _listen()
+
+    @app.before_request
+    def start_query_audit():
+        g.query_audit = QueryAudit(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}")
+        g.query_audit_previous = getattr(_local, 'audit', None)
+        _local.audit = g.query_audit
+
+    @app.after_request
+    def check_query_audit(response):
+        audit = g.get('query_audit')
+        if audit is None:
+            return response
+        _local.audit = g.get('query_audit_previous')
+        with db.engine.connect() as connection:
+            problems = audit.problems(connection, threshold, allow)
+        if problems:
+            if app.testing:
+                raise QueryAuditError(f"Query audit failed in {audit.label}:\n" + '\n'.join(problems))
+            for problem in problems:
+                logger.warning(f"Query audit in {audit.label}: {problem}")
+        return response
+
+    @app.teardown_request
+    def stop_query_audit(exc):
+        if g.pop('query_audit', None) is not None:
+            _local.audit = g.pop('query_audit_previous', None)
+
+    app.extensions['query_audit'] = True
@@ -0,0 +1,175 @@
+"""
+Bulk ESRS questionnaire answering.
+
+Answers a list of questions for one conversation in a single pass:
+questions are embedded and searched as one batch, all candidate passages
+are reranked with a single cross-encoder call, and LLM calls run with
+bounded concurrency. Progress is reported as a stream of event dicts.
+"""
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape
+
+from inference import run_inference
+from metrics import EMBEDDING_SECONDS, SEARCH_SECONDS, RERANK_SECONDS
+from models import render_markdown
+
+MAX_QUESTIONS = 200
+
+
+class QuestionnaireError(ValueError):
+    pass
+
+
+def parse_questions(raw, filename=None):
+    """Parse questions from a JSON list/object or a CSV file.
+
+    JSON may be a list of strings, a list of {"question": ...} objects, or an
+    object with a "questions" key holding either. CSV uses the "question"
+    column when present, the first column otherwise.
+    """
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8-sig')
+
+    if isinstance(raw, str):
+        if filename and filename.lower().endswith('.csv'):
+            return _clean(_parse_csv(raw))
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return _clean(_parse_csv(raw))
+
+    if isinstance(raw, dict):
+        raw = raw.get('questions', [])
+    if not isinstance(raw, list):
+        raise QuestionnaireError('Questions must be a list')
+
+    questions = []
+    for item in raw:
+        if isinstance(item, dict):
+            item = item.get('question', '')
+        questions.append(item if isinstance(item, str) else '')
+    return _clean(questions)
+
+
+def _parse_csv(text):
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'question' in header:
+        column = header.index('question')
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column] if len(row) > column else '' for row in rows]
+
+
+def _clean(questions):
+    questions = [q.strip() for q in questions if q and q.strip()]
+    if not questions:
+        raise QuestionnaireError('No questions provided')
+    if len(questions) > MAX_QUESTIONS:
+        raise QuestionnaireError(f'A questionnaire can contain at most {MAX_QUESTIONS} questions')
+    return questions
+
+
+def batch_similarity_search(vectorstore, questions, k):
+    """Embed all questions in one call and search the FAISS index as a batch"""
+    embeddings = getattr(vectorstore, 'embeddings', None) or getattr(vectorstore, 'embedding_function', None)
+    if not hasattr(embeddings, 'embed_documents'):
+        return [vectorstore.similarity_search(q, k=k) for q in questions]
+
+    import faiss
+    import numpy as np
+
+    with EMBEDDING_SECONDS.time(store='questionnaire'):
+        vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+    with SEARCH_SECONDS.time(store='questionnaire'):
+        if getattr(vectorstore, '_normalize_L2', False):
+            faiss.normalize_L2(vectors)
+        _, indices = vectorstore.index.search(vectors, k)
+
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:
+                continue
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            if not isinstance(doc, str):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+def batch_rerank(reranker, questions, candidates, top_n, batch_size=64):
+    """Score every (question, passage) pair in one predict call and keep the top_n per question"""
+    pairs = [(q, doc.page_content) for q, docs in zip(questions, candidates) for doc in docs]
+    with RERANK_SECONDS.time():
+        scores = reranker.predict(pairs, batch_size=batch_size) if pairs else []
+
+    ranked, offset = [], 0
+    for docs in candidates:
+        doc_scores = scores[offset:offset + len(docs)]
+        offset += len(docs)
+        order = sorted(zip(doc_scores, docs), key=lambda pair: pair[0], reverse=True)
+        ranked.append([doc for _, doc in order[:top_n]])
+    return ranked
+
+
+def answer_questionnaire(questions, vectorstore, reranker, answer_fn, concurrency=4, k=10, top_n=5):
+    """Answer every question, yielding progress events as work completes.
+
+    answer_fn(question, context) returns the markdown answer for one question
+    and raises when it cannot. The last event has stage "complete" and carries
+    the answers in the order the questions were given, None for the failed ones.
+    """
+    total = len(questions)
+    yield {'stage': 'retrieval', 'done': 0, 'total': total}
+
+    def retrieve():
+        candidates = batch_similarity_search(vectorstore, questions, k)
+        return batch_rerank(reranker, questions, candidates, top_n)
+
+    # CPU-bound like the chat path's retrieval: bounded by the inference pool
+    ranked = run_inference(retrieve)
+    contexts = ["\n".join(doc.page_content for doc in docs) for docs in ranked]
+
+    yield {'stage': 'retrieval', 'done': total, 'total': total}
+
+    answers = [None] * total
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='questionnaire') as executor:
+        futures = {
+            executor.submit(answer_fn, question, context): index
+            for index, (question, context) in enumerate(zip(questions, contexts))
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                answers[index] = future.result()
+                error = None
+            except Exception as e:
+                answers[index] = None
+                error = str(e)
+            done += 1
+            event = {'stage': 'answer', 'index': index, 'done': done, 'total': total}
+            if error:
+                event['error'] = error
+            yield event
+
+    yield {'stage': 'complete', 'done': total, 'total': total, 'answers': answers}
+
+
+def render_document(questions, answers):
+    """Assemble question/answer pairs into the HTML body of a Document, skipping unanswered questions"""
+    sections = []
+    for question, answer in zip(questions, answers):
+        if answer is None:
+            continue
+        sections.append(f"<h2>{escape(question)}</h2>\n"
+                        f"{render_markdown(answer)}")
+    return "\n".join(sections)
@@ -0,0 +1,224 @@
+"""
+Retrieval and generation pipeline shared by the app and the blueprints.
+
+Importing this module is cheap: models and indexes come from resources.py,
+which loads them on first use (or during warm-up), so blueprints can import
+from here without pulling in app.py and everything it initialises.
+"""
+import logging
+import re
+
+from coalescing import SingleFlight, request_key
+from inference import run_inference
+from llm_backends import create_router, NoBackendAvailable
+from metrics import EMBEDDING_SECONDS, SEARCH_SECONDS, RERANK_SECONDS, CONTEXT_BUILD_SECONDS, SECTOR_REQUESTS
+from models import db, Answer, render_markdown
+from resources import get_reranker, get_nace_vs, get_default_vs, get_sector_vs, get_special_sectors
+from tracing import span
+from write_behind import chat_writer
+
+logger = logging.getLogger(__name__)
+
+try:
+    llm_router = create_router()
+except NoBackendAvailable:
+    logger.error("No LLM backend configured (set NVIDIA_API_KEY or LLM_BACKENDS)")
+    raise ValueError("NVIDIA_API_KEY environment variable or an LLM_BACKENDS configuration is required")
+
+DEFAULT_SYSTEM_PROMPT = ("Be brief."
+    "Only return the most COMPLETE and accurate answer. "
+    "Avoid introductions, and additional context. "
+    "No need to introduce a summary at the end. ")
+
+# Identical requests arriving while one is already running wait for it
+# and share its result instead of paying for their own generation/retrieval.
+llm_flight = SingleFlight('llm')
+retrieval_flight = SingleFlight('retrieval')
+
+def create_completion(task, messages, **params):
+    """Run a chat completion on the task's backends, coalescing identical in-flight requests"""
+    with span('llm', task=task):
+        return llm_flight.do(
+            request_key(task, messages, params),
+            llm_router.complete, task, messages, **params
+        )
+
+def request_llm_response(prompt, task='answer'):
+    """Complete a prompt with the default system prompt, raising when no backend answers"""
+    return create_completion(
+        task,
+        [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+         {"role": "user", "content": prompt}],
+        temperature=0,
+        top_p=0.1,
+        max_tokens=112000,
+        frequency_penalty=0.1,
+        presence_penalty=0
+    )
+
+def get_llm_response(prompt, task='answer'):
+    try:
+        return request_llm_response(prompt, task)
+    except Exception as e:
+        logger.error(f"Error getting LLM response: {str(e)}")
+        return "I'm sorry, I encountered an error processing your request. Please try again later."
+
+def rerank_documents(query, docs, top_n):
+    """Score all (query, doc) pairs in one reranker call and keep the best top_n"""
+    if not docs:
+        return []
+    reranker = get_reranker()
+    with span('reranker.predict', docs=len(docs)), RERANK_SECONDS.time():
+        scores = reranker.predict([(query, doc.page_content) for doc in docs])
+    ranked = sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)
+    return [doc for _, doc in ranked[:top_n]]
+
+def similarity_search(vectorstore, store_name, query, k):
+    """vectorstore.similarity_search, timing the query embedding and the index search separately"""
+    embeddings = getattr(vectorstore, 'embeddings', None)
+    if embeddings is None or not hasattr(vectorstore, 'similarity_search_by_vector'):
+        with span('similarity_search', store=store_name, k=k), SEARCH_SECONDS.time(store=store_name):
+            return vectorstore.similarity_search(query, k=k)
+
+    with span('embed_query', store=store_name), EMBEDDING_SECONDS.time(store=store_name):
+        vector = embeddings.embed_query(query)
+    with span('similarity_search', store=store_name, k=k), SEARCH_SECONDS.time(store=store_name):
+        return vectorstore.similarity_search_by_vector(vector, k=k)
+
+def retrieve_documents(vectorstore, store_name, query, k, top_n):
+    """Similarity search followed by rerank on the inference pool, coalescing identical in-flight requests"""
+    def run():
+        retrieved_docs = similarity_search(vectorstore, store_name, query, k)
+        return rerank_documents(query, retrieved_docs, top_n)
+
+    with span('retrieval', store=store_name):
+        return retrieval_flight.do(request_key(store_name, query, k, top_n), run_inference, run)
+
+def load_chain(vectorstore):
+    """RetrievalQA chain over a vectorstore, answering with the 'nace' backends"""
+    from langchain.chains import RetrievalQA
+    from langchain_core.runnables import Runnable
+
+    class NvidiaLLM(Runnable):
+        def invoke(self, input):
+            return get_llm_response(input["query"], task='nace')
+
+    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+    return RetrievalQA.from_chain_type(
+        llm=NvidiaLLM(),
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True
+    )
+
+def process_company_description(company_desc):
+    with span('classification') as classification_span:
+        result = classify_company(company_desc)
+        if classification_span is not None:
+            classification_span.set(**result)
+    return result
+
+def classify_company(company_desc):
+    ranked_docs = retrieve_documents(get_nace_vs(), 'nace', company_desc, k=3, top_n=3)
+
+    context = "\n".join([doc.page_content for doc in ranked_docs])
+
+    contextual_query = f"""
+    You are a NACE classification assistant.
+    Your job is to identify and return the exact NACE code.
+
+    Instructions:
+    - Analyze the company description.
+    - Use the context provided for reference.
+    - Respond with ONLY the NACE code (e.g., 'A01.1' or 'B05').
+    - Don't forget to include the letter
+
+    Company description:
+    {company_desc}
+
+    Context:
+    {context}
+    """
+
+    nace_result = get_llm_response(contextual_query, task='nace')
+
+    nace_result = re.sub(r'(\b[a-u]\b)', lambda m: m.group(1).upper(), nace_result)
+    nace_result = re.sub(r'\.\s+', '.', nace_result)
+
+    match = re.search(r'([A-U](\d{1,2})(\.\d{1,2}){0,2})', nace_result)
+
+    if match:
+        nace_sector = match.group(1)
+        print(f"Company sector according to NACE: {nace_sector}")
+        esrs_sector = get_special_sectors().get(nace_sector, "Agnostic")
+    else:
+        nace_sector = "Agnostic"
+        print("Could not determine exact NACE code. Using agnostic standards.")
+        esrs_sector = "Agnostic"
+
+    return {
+        'nace_sector': nace_sector,
+        'esrs_sector': esrs_sector
+    }
+
+def select_vectorstore(esrs_sector):
+    """Return the vectorstore to answer questions for a sector and the name it is cached under"""
+    sector_vs = get_sector_vs(esrs_sector)
+
+    if sector_vs is not None:
+        return sector_vs, esrs_sector
+
+    return get_default_vs(), 'default'
+
+def build_answer_prompt(question, context, conversation_history):
+    return f"""
+    Instructions:
+    - Follow the ESRS standards.
+    - Use the context provided for reference.
+    - No need to include summary tables
+    - Answer must be complete and accurate
+    - Explain the answer in detail
+    - Give brief and concise answers
+    - Prioritize information quality over aesthetics
+    - Don't show tables, only plain text
+    - Don't say what was provided in context
+    - Give answer in markdown format
+    - Don't include numeric lists, only bullet points
+    Question: {question}
+    Context:
+    {context}
+    Take into account the previous conversation:
+    {conversation_history}
+    """
+
+def answer_question(question, esrs_sector, conversation_history):
+    """Retrieve context and generate the rendered answer for a question, without touching the session"""
+    SECTOR_REQUESTS.inc(sector=esrs_sector or 'Agnostic')
+    qa_vs, store_name = select_vectorstore(esrs_sector)
+
+    ranked_docs = retrieve_documents(qa_vs, store_name, question, k=10, top_n=5)
+
+    with span('prompt.build'), CONTEXT_BUILD_SECONDS.time():
+        context = "\n".join([doc.page_content for doc in ranked_docs])
+        contextual_query = build_answer_prompt(question, context, conversation_history)
+
+    answer_markdown = get_llm_response(contextual_query)
+
+    return {'markdown': answer_markdown, 'answer': render_markdown(answer_markdown), 'context': context}
+
+def load_conversation_history(conversation_id):
+    """Prompt history for a conversation, read from the Answer table (and the write-behind queue) as raw markdown"""
+    if not conversation_id:
+        return []
+
+    answers = Answer.query.options(db.undefer_group('body')).filter_by(conversation_id=conversation_id).order_by(Answer.created_at).all()
+
+    conversation_history = []
+    for answer in answers:
+        conversation_history.append(f"Q: {answer.question}")
+        conversation_history.append(f"A: {answer.markdown}")
+    # Turns still waiting in the write-behind queue of this process
+    for question, markdown in chat_writer.pending(conversation_id):
+        conversation_history.append(f"Q: {question}")
+        conversation_history.append(f"A: {markdown}")
+    return conversation_history
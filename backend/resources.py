@@ -0,0 +1,141 @@
+"""
+Models and indexes used by the RAG pipeline, loaded through the warm-up registry.
+
+Nothing heavy is imported or loaded when this module is imported: faiss,
+sentence-transformers and the pickled vectorstores are loaded by their
+component on first use, or all in parallel once warmup.start() is called.
+"""
+import json
+import logging
+import os
+import pickle
+
+from inference import limit_torch_threads
+from warmup import Warmup, timed_import
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VECTORSTORE_DIR = os.environ.get('VECTORSTORE_DIR', os.path.join(BASE_DIR, 'vectorstores'))
+SECTOR_CLASSIFICATION_FILE = os.path.join(BASE_DIR, 'sector_classification.json')
+RERANKER_MODEL = os.environ.get('RERANKER_MODEL', 'cross-encoder/ms-marco-MiniLM-L6-v2')
+WARMUP_QUERY = "What are the ESRS disclosure requirements for climate change?"
+
+sector_db_map = {
+    "Oil & Gas Company": "oil_gas_db",
+    "Mining, Quarrying and Coal": "mining_db",
+    "Road Transport": "road_db"
+}
+
+warmup = Warmup()
+
+
+def load_vectorstore(db_folder):
+    db_path = os.path.join(VECTORSTORE_DIR, db_folder)
+
+    if not os.path.exists(db_path):
+        logger.error(f"Vectorstore path not found: {db_path}")
+        raise FileNotFoundError(f"Vectorstore path not found: {db_path}")
+
+    faiss = timed_import('faiss')
+    # Unpickling the store imports langchain and the embedding model
+    timed_import('langchain_community.vectorstores')
+    timed_import('langchain_huggingface')
+
+    index = faiss.read_index(os.path.join(db_path, "index.faiss"))
+
+    with open(os.path.join(db_path, "vectorstore.pkl"), "rb") as f:
+        vectorstore = pickle.load(f)
+
+    vectorstore.index = index
+    # A tiny search pays the one-time embedding and FAISS allocation costs now
+    # instead of on the first real request
+    vectorstore.similarity_search(WARMUP_QUERY, k=1)
+    return vectorstore
+
+
+def load_reranker():
+    limit_torch_threads()
+    sentence_transformers = timed_import('sentence_transformers')
+    reranker = sentence_transformers.CrossEncoder(RERANKER_MODEL)
+    reranker.predict([(WARMUP_QUERY, WARMUP_QUERY)])
+    return reranker
+
+
+def load_embedder():
+    """Embedding model of the default store, checked with a warm-up query"""
+    embeddings = get_default_vs().embeddings
+    embeddings.embed_query(WARMUP_QUERY)
+    return embeddings
+
+
+def load_special_sectors():
+    with open(SECTOR_CLASSIFICATION_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+warmup.register('reranker', load_reranker)
+warmup.register('nace_db', lambda: load_vectorstore('nace_db'))
+warmup.register('default_db', lambda: load_vectorstore('default_db'))
+# Sectors without their own store fall back to the default one (get_sector_vs)
+for _db_name in sector_db_map.values():
+    warmup.register(_db_name, lambda db_name=_db_name: load_vectorstore(db_name), optional=True)
+warmup.register('embedder', load_embedder)
+warmup.register('sector_classification', load_special_sectors)
+
+
+def _estimate_bytes(value):
+    index = getattr(value, 'index', None)
+    if index is not None and hasattr(index, 'ntotal'):
+        # Flat FAISS indexes store one float32 vector per document
+        return {'vectors': index.ntotal, 'dimensions': index.d, 'index_bytes': index.ntotal * index.d * 4,
+                'documents': len(getattr(getattr(value, 'docstore', None), '_dict', {}))}
+    model = getattr(value, 'model', None) or getattr(value, 'client', None)
+    if model is not None and hasattr(model, 'parameters'):
+        return {'parameter_bytes': sum(p.numel() * p.element_size() for p in model.parameters())}
+    return {}
+
+
+def describe_memory():
+    """Estimated size of each loaded component, for the profiling memory report"""
+    report = {}
+    for name, component in warmup.components.items():
+        report[name] = {'status': component.status}
+        if component.status == 'ready':
+            try:
+                report[name].update(_estimate_bytes(component.value))
+            except Exception as e:
+                report[name]['error'] = str(e)
+    return report
+
+
+def get_reranker():
+    return warmup.get('reranker')
+
+
+def get_nace_vs():
+    return warmup.get('nace_db')
+
+
+def get_default_vs():
+    return warmup.get('default_db')
+
+
+def get_sector_vs(esrs_sector):
+    """Vectorstore for a special ESRS sector, or None if the sector has none or it failed to load"""
+    db_name = sector_db_map.get(esrs_sector)
+    if db_name is None:
+        return None
+    try:
+        return warmup.get(db_name)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return None
+
+
+def get_special_sectors():
+    try:
+        return warmup.get('sector_classification')
+    except RuntimeError as e:
+        logger.error(str(e))
+        return {}
@@ -0,0 +1,307 @@
+"""
+Full-text search over a user's conversations, answers and documents.
+
+Every searchable row has a SearchEntry (search_entries) holding its owner,
+kind ('conversation', 'answer' or 'document'), a title and a plain-text body:
+
+- conversation: its title and company description;
+- answer: the question and the answer with the HTML stripped;
+- document: its name and content with the HTML stripped.
+
+On SQLite the entries are indexed by an FTS5 table (search_fts) using them
+as external content, created together with search_entries; results are
+ranked with bm25 (title hits weigh more) and FTS5 builds the snippets. On
+MySQL a FULLTEXT index on (title, body) is used in boolean mode and the
+snippets are cut in Python. Other databases fall back to LIKE.
+
+Entries are kept up to date by flush hooks (track_search) for ORM writes:
+entries of deleted rows are removed before the flush, ahead of the DELETE
+of the user they point at, and new or changed rows are indexed after it.
+Code that writes with Core statements calls reindex_document,
+remove_conversation or remove_user itself. `flask search-reindex` rebuilds everything.
+"""
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, column, delete, event, func, insert, inspect, literal, or_, select, table, text
+from sqlalchemy.orm import undefer, undefer_group
+
+from models import Answer, Conversation, Document, SearchEntry, User, render_markdown
+
+KINDS = ('conversation', 'answer', 'document')
+MAX_QUERY_TERMS = 8
+MAX_OFFSET = 1000
+SNIPPET_TOKENS = 24
+TITLE_WEIGHT = 5.0
+
+# Markers FTS5 puts around hits; the snippet is escaped before they become <mark> tags
+HIT_START, HIT_END = '\x02', '\x03'
+
+TAG_PATTERN = re.compile(r'<[^>]*>')
+SPACE_PATTERN = re.compile(r'\s+')
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# The FTS5 index of search_entries on SQLite (created with it, see models.py)
+search_fts = table('search_fts', column('search_fts'), column('rowid'), column('title'), column('body'))
+
+
+def plain_text(markup):
+    """Text of an HTML fragment, as indexed and shown in snippets"""
+    if not markup:
+        return ''
+    return SPACE_PATTERN.sub(' ', html.unescape(TAG_PATTERN.sub(' ', markup))).strip()
+
+
+def query_terms(query):
+    return TERM_PATTERN.findall(query or '')[:MAX_QUERY_TERMS]
+
+
+def _is_sqlite(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+# Index maintenance
+
+def _delete_entries(connection, condition):
+    if _is_sqlite(connection):
+        # External content: FTS5 needs the old values to take them out of the index
+        connection.execute(insert(search_fts).from_select(
+            ['search_fts', 'rowid', 'title', 'body'],
+            select(literal('delete'), SearchEntry.id, SearchEntry.title, SearchEntry.body).where(condition)))
+    connection.execute(delete(SearchEntry).where(condition))
+
+
+def _put_entries(connection, entries):
+    """Insert entries, replacing existing ones of the same (kind, ref_id)"""
+    if not entries:
+        return
+    for kind in {entry['kind'] for entry in entries}:
+        ref_ids = [entry['ref_id'] for entry in entries if entry['kind'] == kind]
+        _delete_entries(connection, and_(SearchEntry.kind == kind, SearchEntry.ref_id.in_(ref_ids)))
+        connection.execute(insert(SearchEntry), [entry for entry in entries if entry['kind'] == kind])
+        if _is_sqlite(connection):
+            connection.execute(insert(search_fts).from_select(
+                ['rowid', 'title', 'body'],
+                select(SearchEntry.id, SearchEntry.title, SearchEntry.body)
+                .where(SearchEntry.kind == kind, SearchEntry.ref_id.in_(ref_ids))))
+
+
+def _conversation_entry(conversation):
+    return {'user_id': conversation.user_id, 'kind': 'conversation', 'ref_id': conversation.id,
+            'conversation_id': conversation.id, 'title': conversation.title or '',
+            'body': conversation.company_description or '', 'updated_at': conversation.updated_at or datetime.utcnow()}
+
+
+def _answer_entry(answer, user_id):
+    return {'user_id': user_id, 'kind': 'answer', 'ref_id': answer.id, 'conversation_id': answer.conversation_id,
+            'title': answer.question or '',
+            'body': plain_text(answer.answer if answer.answer is not None else render_markdown(answer.answer_markdown)),
+            'updated_at': answer.created_at or datetime.utcnow()}
+
+
+def _document_entry(document):
+    return {'user_id': document.user_id, 'kind': 'document', 'ref_id': document.id, 'conversation_id': None,
+            'title': document.name or '', 'body': plain_text(document.content),
+            'updated_at': document.updated_at or datetime.utcnow()}
+
+
+def reindex_document(session, document_id):
+    """Refresh a document's entry after a write that bypassed the ORM"""
+    connection = session.connection()
+    row = connection.execute(
+        select(Document.id, Document.user_id, Document.name, Document.content, Document.updated_at)
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        _delete_entries(connection, and_(SearchEntry.kind == 'document', SearchEntry.ref_id == document_id))
+    else:
+        _put_entries(connection, [_document_entry(row)])
+
+
+def remove_conversation(session, conversation_id):
+    """Drop the entries of a conversation and its answers"""
+    _delete_entries(session.connection(), SearchEntry.conversation_id == conversation_id)
+
+
+def remove_user(session, user_id):
+    """Drop every entry of a user; must run before the user row is deleted"""
+    _delete_entries(session.connection(), SearchEntry.user_id == user_id)
+
+
+def _changed(obj, *attributes):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+def _index_flushed_changes(session, flush_context):
+    connection = session.connection()
+    entries = []
+    answers = []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Conversation):
+            if obj in session.new or _changed(obj, 'title', 'company_description', 'user_id'):
+                if obj.user_id is not None:
+                    entries.append(_conversation_entry(obj))
+        elif isinstance(obj, Answer):
+            if obj in session.new or _changed(obj, 'question', 'answer', 'answer_markdown'):
+                answers.append(obj)
+        elif isinstance(obj, Document):
+            if obj in session.new or _changed(obj, 'name', 'content'):
+                entries.append(_document_entry(obj))
+
+    if answers:
+        # Answers are owned through their conversation; look the owners up in one query
+        owners = dict(connection.execute(
+            select(Conversation.id, Conversation.user_id)
+            .where(Conversation.id.in_({answer.conversation_id for answer in answers}))
+        ).all())
+        entries += [_answer_entry(answer, owners[answer.conversation_id])
+                    for answer in answers if owners.get(answer.conversation_id) is not None]
+    _put_entries(connection, entries)
+
+
+def _remove_deleted_entries(session, flush_context, instances):
+    # Before the flush, since search_entries.user_id references the users being deleted
+    connection = session.connection()
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            remove_user(session, obj.id)
+        elif isinstance(obj, Conversation):
+            remove_conversation(session, obj.id)
+        elif isinstance(obj, Answer):
+            _delete_entries(connection, and_(SearchEntry.kind == 'answer', SearchEntry.ref_id == obj.id))
+        elif isinstance(obj, Document):
+            _delete_entries(connection, and_(SearchEntry.kind == 'document', SearchEntry.ref_id == obj.id))
+
+
+def track_search(session_class):
+    """Keep search entries in step with ORM writes to conversations, answers and documents"""
+    if not event.contains(session_class, 'before_flush', _remove_deleted_entries):
+        event.listen(session_class, 'before_flush', _remove_deleted_entries)
+    if not event.contains(session_class, 'after_flush', _index_flushed_changes):
+        event.listen(session_class, 'after_flush', _index_flushed_changes)
+
+
+def rebuild(session, batch_size=500):
+    """Recreate every entry from the source tables; returns the number of entries"""
+    connection = session.connection()
+    connection.execute(delete(SearchEntry))
+    if _is_sqlite(connection):
+        connection.execute(text("INSERT INTO search_fts(search_fts) VALUES ('delete-all')"))
+
+    total = 0
+    batch = []
+
+    def put(entry):
+        nonlocal total, batch
+        batch.append(entry)
+        total += 1
+        if len(batch) >= batch_size:
+            _put_entries(connection, batch)
+            batch = []
+
+    for conversation in session.execute(
+            select(Conversation).options(undefer(Conversation.company_description))
+            .where(Conversation.user_id.isnot(None)).execution_options(yield_per=batch_size)
+    ).scalars():
+        put(_conversation_entry(conversation))
+    for answer, user_id in session.execute(
+            select(Answer, Conversation.user_id).options(undefer_group('body'))
+            .join(Conversation, Answer.conversation_id == Conversation.id)
+            .where(Conversation.user_id.isnot(None)).execution_options(yield_per=batch_size)
+    ):
+        put(_answer_entry(answer, user_id))
+    for document in session.execute(
+            select(Document).options(undefer(Document.content)).execution_options(yield_per=batch_size)
+    ).scalars():
+        put(_document_entry(document))
+    _put_entries(connection, batch)
+    return total
+
+
+# Queries
+
+def _mark(snippet):
+    return html.escape(snippet).replace(HIT_START, '<mark>').replace(HIT_END, '</mark>')
+
+
+def make_snippet(value, terms, tokens=SNIPPET_TOKENS):
+    """Window of `tokens` words around the first hit of any term, hits wrapped in markers"""
+    words = value.split()
+    lowered = [term.lower() for term in terms]
+
+    def is_hit(word):
+        word = word.lower()
+        return any(word.startswith(term) for term in lowered)
+
+    first = next((i for i, word in enumerate(words) if is_hit(word)), 0)
+    start = max(0, first - tokens // 4)
+    window = words[start:start + tokens]
+    snippet = ' '.join(f"{HIT_START}{word}{HIT_END}" if is_hit(word) else word for word in window)
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + tokens < len(words) else ''
+    return prefix + snippet + suffix
+
+
+def _fts_query(terms):
+    # Quoted terms are taken literally; the last one also matches as a prefix (search as you type)
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search(session, user_id, query, kind=None, limit=20, offset=0):
+    """Ranked results of a user's entries matching every term of `query`, and the next offset"""
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+    offset = max(0, min(int(offset or 0), MAX_OFFSET))
+    connection = session.connection()
+    dialect = connection.dialect.name
+
+    if dialect == 'sqlite':
+        kind_filter = "AND e.kind = :kind" if kind else ""
+        rows = connection.execute(text(
+            "SELECT e.kind, e.ref_id, e.conversation_id, e.updated_at, "
+            f"snippet(search_fts, 0, :hit_start, :hit_end, '…', {SNIPPET_TOKENS}) AS title, "
+            f"snippet(search_fts, 1, :hit_start, :hit_end, '…', {SNIPPET_TOKENS}) AS snippet "
+            "FROM search_fts JOIN search_entries e ON e.id = search_fts.rowid "
+            f"WHERE search_fts MATCH :query AND e.user_id = :user_id {kind_filter} "
+            f"ORDER BY bm25(search_fts, {TITLE_WEIGHT}, 1.0) LIMIT :limit OFFSET :offset"
+        ), {'query': _fts_query(terms), 'user_id': user_id, 'kind': kind, 'limit': limit + 1,
+            'offset': offset, 'hit_start': HIT_START, 'hit_end': HIT_END}).all()
+    else:
+        columns = [SearchEntry.kind, SearchEntry.ref_id, SearchEntry.conversation_id, SearchEntry.updated_at,
+                   SearchEntry.title, SearchEntry.body]
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import match
+
+            score = match(SearchEntry.title, SearchEntry.body,
+                          against=' '.join(f"+{term}" for term in terms) + '*').in_boolean_mode()
+            statement = select(*columns).where(score > 0).order_by(score.desc())
+        else:
+            statement = select(*columns).where(*[
+                or_(func.lower(SearchEntry.title).contains(term.lower()),
+                    func.lower(SearchEntry.body).contains(term.lower()))
+                for term in terms
+            ]).order_by(SearchEntry.updated_at.desc())
+        statement = statement.where(SearchEntry.user_id == user_id)
+        if kind:
+            statement = statement.where(SearchEntry.kind == kind)
+        rows = [
+            (row.kind, row.ref_id, row.conversation_id, row.updated_at,
+             make_snippet(row.title, terms, tokens=len(row.title.split()) or 1), make_snippet(row.body, terms))
+            for row in connection.execute(statement.limit(limit + 1).offset(offset))
+        ]
+
+    results = [{
+        'kind': row[0],
+        'id': row[1],
+        'conversation_id': row[2],
+        'updated_at': row[3].isoformat() if isinstance(row[3], datetime) else row[3],
+        'title': _mark(row[4] or ''),
+        'snippet': _mark(row[5] or '')
+    } for row in rows[:limit]]
+    next_offset = offset + limit if len(rows) > limit and offset + limit <= MAX_OFFSET else None
+    return results, next_offset
@@ -0,0 +1,143 @@
+"""
+Server-side Flask sessions stored in the `sessions` table.
+
+The cookie only carries a signed random session id; the session data lives
+in the database and is written back only when it changes. Conversation
+history is not kept in the session at all: it is loaded from the Answer
+table when a prompt needs it.
+
+The table is created by init_db.py / migrate_db.py like every other table.
+Requests without a session cookie never touch it, and neither do the ones
+the `skip` predicate matches (the built frontend's static files): they get
+a null session and no cookie is written back.
+"""
+import logging
+import random
+import secrets
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from sqlalchemy import delete, select
+from werkzeug.datastructures import CallbackDict
+
+from models import ServerSession
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expiry=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expiry = expiry
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh session id, e.g. after login, to prevent fixation"""
+        if self.previous_sid is None and not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SqlAlchemySessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    cleanup_probability = 0.01
+
+    def __init__(self, db, skip=None):
+        self.db = db
+        self.skip = skip
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def open_session(self, app, request):
+        with span('session.load'):
+            return self._open_session(app, request)
+
+    def _open_session(self, app, request):
+        if self.skip is not None and self.skip(request):
+            return self.make_null_session(app)
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                with self.db.engine.connect() as connection:
+                    row = connection.execute(
+                        select(ServerSession.data, ServerSession.expiry)
+                        .where(ServerSession.id == sid)
+                    ).first()
+                if row and row.expiry > datetime.utcnow():
+                    try:
+                        return ServerSideSession(self.serializer.loads(row.data), sid=sid, expiry=row.expiry)
+                    except ValueError:
+                        logger.warning("Discarding unreadable server-side session")
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified or session.previous_sid:
+                self._delete(session.sid, session.previous_sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        refresh = not session.modified and not session.new and self._needs_refresh(app, session)
+        if not session.modified and not refresh:
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expiry = datetime.utcnow() + app.permanent_session_lifetime
+        self._write(session.sid, self.serializer.dumps(dict(session)), expiry, session.previous_sid)
+        session.previous_sid = None
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode('utf-8')).decode('utf-8'),
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _needs_refresh(self, app, session):
+        # Extend the expiry of sessions that are being used, without writing on every request
+        if not session.permanent or not app.config.get('SESSION_REFRESH_EACH_REQUEST', True):
+            return False
+        return session.expiry is None or session.expiry - datetime.utcnow() < app.permanent_session_lifetime / 2
+
+    def _write(self, sid, data, expiry, previous_sid=None):
+        table = ServerSession.__table__
+        with self.db.engine.begin() as connection:
+            if previous_sid:
+                connection.execute(delete(table).where(table.c.id == previous_sid))
+            updated = connection.execute(
+                table.update().where(table.c.id == sid).values(data=data, expiry=expiry)
+            ).rowcount
+            if not updated:
+                connection.execute(table.insert().values(id=sid, data=data, expiry=expiry))
+            if random.random() < self.cleanup_probability:
+                connection.execute(delete(table).where(table.c.expiry < datetime.utcnow()))
+
+    def _delete(self, *sids):
+        sids = [sid for sid in sids if sid]
+        if not sids:
+            return
+        table = ServerSession.__table__
+        with self.db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.id.in_(sids)))
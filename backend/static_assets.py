@@ -0,0 +1,151 @@
+"""
+In-memory serving of the built frontend (build/).
+
+The build directory is scanned once at startup into a manifest holding each
+file's bytes, ETag and precompressed variants: `.gz`/`.br` files produced by
+the frontend build are used when present, otherwise gzip (and brotli, when
+the optional `brotli` package is installed) variants are generated here.
+Requests are then answered from memory, including 304s for matching ETags,
+and content-hashed files under assets/ are marked immutable.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+HASHED_NAME = re.compile(r'[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/manifest+json')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+SHORT_LIVED = 'public, max-age=3600'
+
+
+class StaticFile:
+    def __init__(self, path, body, mimetype, cache_control):
+        self.path = path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {'identity': body}
+
+    def add_variant(self, encoding, body):
+        if len(body) < len(self.variants['identity']):
+            self.variants[encoding] = body
+
+
+class StaticAssets:
+    def __init__(self, root, index='index.html', min_compress_size=512, max_file_size=20 * 1024 * 1024):
+        self.root = root
+        self.index = index
+        self.min_compress_size = min_compress_size
+        self.max_file_size = max_file_size
+        self.files = {}
+        self.build_manifest()
+
+    def build_manifest(self):
+        files = {}
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith(('.gz', '.br')):
+                        continue
+                    full_path = os.path.join(dirpath, filename)
+                    rel_path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                    static_file = self._load(full_path, rel_path)
+                    if static_file is not None:
+                        files[rel_path] = static_file
+        self.files = files
+        size = sum(sum(len(v) for v in f.variants.values()) for f in files.values())
+        logger.info(f"Static manifest built: {len(files)} files, {size / 1024:.0f} KiB in memory")
+
+    def _load(self, full_path, rel_path):
+        if os.path.getsize(full_path) > self.max_file_size:
+            return None
+        with open(full_path, 'rb') as f:
+            body = f.read()
+
+        mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        if rel_path == self.index:
+            cache_control = REVALIDATE
+        elif rel_path.startswith('assets/') and HASHED_NAME.search(rel_path):
+            cache_control = IMMUTABLE
+        else:
+            cache_control = SHORT_LIVED
+
+        static_file = StaticFile(rel_path, body, mimetype, cache_control)
+        if len(body) >= self.min_compress_size and mimetype.startswith(COMPRESSIBLE_TYPES):
+            static_file.add_variant('gzip', self._precompressed(full_path + '.gz')
+                                    or gzip.compress(body, compresslevel=9, mtime=0))
+            br = self._precompressed(full_path + '.br')
+            if br is None and brotli is not None:
+                br = brotli.compress(body, quality=11)
+            if br is not None:
+                static_file.add_variant('br', br)
+        return static_file
+
+    @staticmethod
+    def _precompressed(path):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        return None
+
+    def lookup(self, path):
+        return self.files.get(path)
+
+    def index_file(self):
+        return self.files.get(self.index)
+
+    def respond(self, static_file, request):
+        encoding = self._negotiate(static_file, request.headers.get('Accept-Encoding', ''))
+        etag = static_file.etag if encoding == 'identity' else f"{static_file.etag}-{encoding}"
+
+        headers = {'Cache-Control': static_file.cache_control, 'ETag': f'"{etag}"'}
+        if len(static_file.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self._matches(request.headers.get('If-None-Match', ''), static_file.etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(static_file.variants[encoding], mimetype=static_file.mimetype, headers=headers)
+
+    @staticmethod
+    def _negotiate(static_file, accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, _, params = part.strip().partition(';')
+            if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(name.lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in static_file.variants and (encoding in accepted or '*' in accepted):
+                return encoding
+        return 'identity'
+
+    @staticmethod
+    def _matches(if_none_match, etag):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            # Any encoding of the same content is a match
+            if candidate.strip('"').split('-')[0] == etag:
+                return True
+        return False
@@ -0,0 +1,70 @@
+"""
+Tests for account deletion with foreign keys enforced
+"""
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session as OrmSession
+
+from accounts import delete_user
+from document_versions import track_history
+from search import track_search
+from models import db, User, Conversation, Answer, Document, DocumentVersion, Job, SearchEntry
+
+
+def count(model):
+    return db.session.execute(select(func.count()).select_from(model)).scalar()
+
+
+@pytest.fixture
+def app(app):
+    # SQLite only checks foreign keys when asked to, on every connection
+    event.listen(db.engine, 'connect', lambda connection, record: connection.execute('PRAGMA foreign_keys=ON'))
+    db.engine.dispose()
+    track_history(OrmSession)
+    track_search(OrmSession)
+
+    owner = User(username='owner', email='owner@example.com', password='x')
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add_all([owner, other])
+    db.session.flush()
+    for user in (owner, other):
+        conversation = Conversation(user_id=user.id, title='Farm', company_description='A farm')
+        conversation.answers = [Answer.from_markdown(None, 'Which standards?', '- E1')]
+        db.session.add(conversation)
+        document = Document(user_id=user.id, name='Report', content='<p>Draft</p>')
+        db.session.add(document)
+        db.session.flush()
+        document.replace_content('<p>Final</p>')
+        db.session.add(Job(kind='questionnaire', payload='{}', user_id=user.id))
+    db.session.commit()
+    return app
+
+
+def test_deleting_an_account_removes_everything_it_owns(app):
+    owner_id = User.query.filter_by(username='owner').one().id
+    delete_user(db.session, owner_id)
+    db.session.commit()
+
+    assert [user.username for user in User.query] == ['other']
+    assert count(Conversation) == count(Answer) == count(Document) == count(Job) == 1
+    # Both stored versions of the other user's document are kept
+    assert count(DocumentVersion) == 2
+    assert db.session.execute(select(func.count()).select_from(Job).where(Job.user_id == owner_id)).scalar() == 0
+    # The other user's conversation, answer and document stay searchable
+    assert [entry.user_id for entry in SearchEntry.query] == [User.query.one().id] * 3
+
+
+def test_deleting_a_user_through_the_orm_removes_their_search_entries(app):
+    reader = User(username='reader', email='reader@example.com', password='x')
+    reader.conversations = [Conversation(title='Notes', company_description='A shop',
+                                         answers=[Answer.from_markdown(None, 'Scope?', 'E5')])]
+    db.session.add(reader)
+    db.session.commit()
+    reader_id = reader.id
+    assert SearchEntry.query.filter_by(user_id=reader_id).count() == 2
+
+    # The conversation and its answer go with the user by cascade
+    db.session.delete(reader)
+    db.session.commit()
+    assert SearchEntry.query.filter_by(user_id=reader_id).count() == 0
+    assert count(Conversation) == count(Answer) == 2
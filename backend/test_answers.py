@@ -0,0 +1,58 @@
+"""
+Tests for answers stored as markdown with a cached HTML rendering
+"""
+import importlib
+
+import pytest
+
+import models
+from models import db, User, Conversation, Answer
+
+
+@pytest.fixture
+def conversation(app):
+    db.session.add(User(username='writer', email='writer@example.com', password='x'))
+    db.session.flush()
+    conversation = Conversation(user_id=1, title='Farm', company_description='A farm')
+    conversation.answers = [
+        Answer.from_markdown(None, 'Which standards?', '**E1** and *E4*'),
+        # Written before answer_markdown existed
+        Answer(question='Legacy question', answer='<p>Legacy <em>html</em></p>'),
+    ]
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+
+def test_from_markdown_renders_the_html_cache_once(conversation, monkeypatch):
+    answer = conversation.answers[0]
+    assert answer.answer_markdown == '**E1** and *E4*'
+    assert answer.answer == '<p><strong>E1</strong> and <em>E4</em></p>'
+    # Reads are served from the cache
+    monkeypatch.setattr(models, 'render_markdown', lambda text: pytest.fail('rendered again'))
+    assert answer.content() == answer.html == answer.answer
+    assert answer.content('markdown') == answer.markdown == '**E1** and *E4*'
+
+
+def test_missing_html_is_rendered_from_the_markdown(conversation):
+    answer = conversation.answers[0]
+    answer.answer = None
+    assert answer.html == '<p><strong>E1</strong> and <em>E4</em></p>'
+    assert answer.answer == answer.html
+
+
+def test_legacy_rows_fall_back_to_their_html(conversation):
+    answer = conversation.answers[1]
+    assert answer.content('html') == '<p>Legacy <em>html</em></p>'
+    assert answer.content('markdown') == '<p>Legacy <em>html</em></p>'
+
+
+def test_prompt_history_uses_the_markdown(conversation, monkeypatch):
+    # rag builds its LLM router on import; no request is sent
+    monkeypatch.setenv('NVIDIA_API_KEY', 'test')
+    rag = importlib.import_module('rag')
+
+    history = rag.load_conversation_history(conversation.id)
+    assert history == ['Q: Which standards?', 'A: **E1** and *E4*',
+                       'Q: Legacy question', 'A: <p>Legacy <em>html</em></p>']
+    assert rag.load_conversation_history(None) == []
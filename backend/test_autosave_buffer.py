@@ -0,0 +1,162 @@
+"""
+Tests for patch-based autosave and its write coalescing
+"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import event, update
+
+from autosave_buffer import AutosaveBuffer, PatchError, VersionConflict, apply_ops
+from models import db, User, Document
+
+pytestmark = pytest.mark.app_config(AUTOSAVE_FLUSH_SECONDS=60)
+
+
+@pytest.fixture
+def app(app):
+    user = User(username='writer', email='writer@example.com', password='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Document(user_id=user.id, name='Report', content='Hello world'))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def buffer(app):
+    buffer = AutosaveBuffer(app)
+    yield buffer
+    buffer.stop()
+    buffer.flush_all()
+
+
+def stored(document_id):
+    db.session.expire_all()
+    document = db.session.get(Document, document_id)
+    return document.content, document.version
+
+
+def test_apply_ops_uses_javascript_string_positions():
+    assert apply_ops('Hello world', [{'at': 6, 'delete': 5, 'insert': 'ESRS'}]) == 'Hello ESRS'
+    # The emoji is two UTF-16 code units, as in the browser
+    assert apply_ops('a\U0001F600b', [{'at': 3, 'delete': 1, 'insert': 'c'}]) == 'a\U0001F600c'
+    with pytest.raises(PatchError):
+        apply_ops('abc', [{'at': 2, 'delete': 5}])
+    with pytest.raises(PatchError):
+        apply_ops('a\U0001F600b', [{'at': 2, 'delete': 1}])
+
+
+def test_patches_are_coalesced_into_one_write(app, buffer):
+    updates = []
+    listener = lambda conn, cursor, statement, *args: updates.append(statement) if statement.startswith('UPDATE') else None
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        version, content = 1, 'Hello world'
+        for word in (' and', ' good', ' night'):
+            version = buffer.apply(1, 1, version, [{'at': len(content), 'delete': 0, 'insert': word}])
+            content += word
+            buffer.flush_due()
+        assert version == 4
+        assert updates == []
+        assert stored(1) == ('Hello world', 1)
+
+        buffer.flush(1)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len(updates) == 1
+    assert stored(1) == ('Hello world and good night', 4)
+
+
+def test_stale_base_version_is_a_conflict_with_the_current_content(app, buffer):
+    buffer.apply(1, 1, 1, [{'at': 0, 'delete': 5, 'insert': 'Goodbye'}])
+    with pytest.raises(VersionConflict) as conflict:
+        buffer.apply(1, 1, 1, [{'at': 0, 'delete': 0, 'insert': '!'}])
+    assert conflict.value.version == 2
+    assert conflict.value.content == 'Goodbye world'
+
+
+def test_version_ahead_of_this_process_asks_the_client_to_retry(app, buffer):
+    buffer.apply(1, 1, 1, [{'at': 0, 'delete': 0, 'insert': '>'}])
+    with pytest.raises(VersionConflict) as conflict:
+        buffer.apply(1, 1, 5, [])
+    assert conflict.value.retry_after == 60
+    assert conflict.value.content is None
+
+
+def test_full_save_elsewhere_reports_the_unsaved_edits(app, buffer):
+    buffer.apply(1, 1, 1, [{'at': 0, 'delete': 0, 'insert': 'stale '}])
+    document = db.session.get(Document, 1)
+    document.replace_content('Saved in full')
+    db.session.commit()
+
+    assert buffer.flush(1) is False
+    assert stored(1) == ('Saved in full', 2)
+    # The buffered edits are not retried, and the next patch is told what was saved
+    assert buffer.flush_due() == 0
+    with pytest.raises(VersionConflict) as conflict:
+        buffer.apply(1, 1, 2, [{'at': 0, 'delete': 0, 'insert': '> '}])
+    assert (conflict.value.version, conflict.value.content) == (2, 'Saved in full')
+    # The client resyncs and carries on patching from version 2
+    assert buffer.apply(1, 1, 2, [{'at': 0, 'delete': 0, 'insert': '> '}]) == 3
+
+
+def test_concurrent_flushes_are_not_conflicts(app, buffer):
+    buffer.apply(1, 1, 1, [{'at': 11, 'delete': 0, 'insert': '!'}])
+
+    def slow_update(conn, cursor, statement, *args):
+        if statement.startswith('UPDATE documents'):
+            time.sleep(0.1)
+    event.listen(db.engine, 'before_cursor_execute', slow_update)
+
+    def flush():
+        with app.app_context():
+            results.append(buffer.flush(1))
+    results = []
+    threads = [threading.Thread(target=flush) for _ in range(2)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', slow_update)
+
+    assert sorted(results) == [False, True]
+    assert stored(1) == ('Hello world!', 2)
+    assert buffer.apply(1, 1, 2, [{'at': 0, 'delete': 0, 'insert': '> '}]) == 3
+
+
+def test_row_already_at_the_buffered_version_counts_as_saved(app, buffer):
+    buffer.apply(1, 1, 1, [{'at': 11, 'delete': 0, 'insert': '!'}])
+    # Written by a flush that did not get to record it on the entry
+    db.session.execute(update(Document).where(Document.id == 1).values(content='Hello world!', version=2))
+    db.session.commit()
+
+    assert buffer.flush(1) is True
+    assert buffer.apply(1, 1, 2, [{'at': 0, 'delete': 0, 'insert': '> '}]) == 3
+
+
+def test_other_users_documents_are_not_found(app, buffer):
+    assert buffer.apply(1, 2, 1, []) is None
+
+
+def test_zero_interval_writes_through(app):
+    app.config['AUTOSAVE_FLUSH_SECONDS'] = 0
+    buffer = AutosaveBuffer(app)
+    buffer.apply(1, 1, 1, [{'at': 5, 'delete': 6, 'insert': ''}])
+    assert stored(1) == ('Hello', 2)
+
+
+def test_zero_interval_conflict_is_reported_at_once(app):
+    app.config['AUTOSAVE_FLUSH_SECONDS'] = 0
+    buffer = AutosaveBuffer(app)
+    buffer.apply(1, 1, 1, [{'at': 5, 'delete': 6, 'insert': ''}])
+    db.session.get(Document, 1).replace_content('Saved in full')
+    db.session.commit()
+
+    with pytest.raises(VersionConflict) as conflict:
+        buffer.apply(1, 1, 2, [{'at': 0, 'delete': 0, 'insert': '> '}])
+    assert (conflict.value.version, conflict.value.content) == (3, 'Saved in full')
+    assert stored(1) == ('Saved in full', 3)
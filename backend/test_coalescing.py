@@ -0,0 +1,62 @@
+"""
+Tests for single-flight request coalescing
+"""
+import threading
+import time
+
+import pytest
+
+from coalescing import SingleFlight, request_key
+
+
+def test_request_key_is_stable():
+    assert request_key('m', [{'role': 'user', 'content': 'x'}], {'a': 1, 'b': 2}) == \
+        request_key('m', [{'role': 'user', 'content': 'x'}], {'b': 2, 'a': 1})
+    assert request_key('m', 'x') != request_key('m', 'y')
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight('test-share')
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'answer'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    leader.start()
+    started.wait(5)
+
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    while flight.stats()['coalesced'] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert results == ['answer'] * 5
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert stats['executed'] == 1
+    assert stats['coalesced'] == 4
+    assert stats['in_flight'] == 0
+
+
+def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight('test-errors')
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        flight.do('k', fail)
+    assert flight.do('k', lambda: 'ok') == 'ok'
+    assert flight.stats()['errors'] == 1
+    assert flight.stats()['executed'] == 2
@@ -0,0 +1,101 @@
+"""
+Tests for compressed document version history
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session as OrmSession
+
+import document_versions
+from autosave_buffer import AutosaveBuffer
+from document_versions import apply_delta, get_content, list_versions, make_delta, prune, track_history
+from models import db, User, Document, DocumentVersion
+
+
+def report(sections):
+    return ''.join(f"<h2>Section {i}</h2><p>{text}</p>" for i, text in enumerate(sections))
+
+pytestmark = pytest.mark.app_config(AUTOSAVE_FLUSH_SECONDS=0)
+
+
+@pytest.fixture
+def app(app):
+    track_history(OrmSession)
+    db.session.add(User(username='writer', email='writer@example.com', password='x'))
+    db.session.commit()
+    return app
+
+
+def edit_many(document, sections, edits):
+    history = []
+    for i in range(edits):
+        sections[i % len(sections)] = f"Revision {i} of this disclosure, " + 'with more narrative text. ' * 20
+        document.replace_content(report(sections))
+        db.session.commit()
+        history.append((document.version, document.content))
+    return history
+
+
+def test_delta_round_trip():
+    base = report(['a' * 50, 'b' * 50, 'c' * 50])
+    content = report(['a' * 50, 'changed', 'c' * 50]) + '<p>new'
+    assert apply_delta(base, make_delta(base, content)) == content
+
+
+def test_every_version_is_rebuilt_from_compact_rows(app):
+    sections = ['Baseline text of the disclosure. ' * 30 for _ in range(30)]
+    document = Document(user_id=1, name='Report', content=report(sections))
+    db.session.add(document)
+    db.session.commit()
+    history = [(1, document.content)] + edit_many(document, sections, 25)
+
+    for version, content in history:
+        assert get_content(db.session, document.id, version) == content
+
+    rows = DocumentVersion.query.filter_by(document_id=document.id).all()
+    kinds = [row.kind for row in sorted(rows, key=lambda row: row.version)]
+    assert kinds[0] == 'snapshot' and kinds.count('delta') > 3 * kinds.count('snapshot')
+    stored = sum(len(row.data) for row in rows)
+    assert stored < sum(len(content) for _, content in history) / 20
+
+
+def test_renames_do_not_add_versions(app):
+    document = Document(user_id=1, name='Report', content='<p>x</p>')
+    db.session.add(document)
+    db.session.commit()
+    document.name = 'Renamed'
+    db.session.commit()
+    assert [v['version'] for v in list_versions(db.session, document.id)] == [1]
+
+
+def test_autosave_flushes_are_recorded(app):
+    document = Document(user_id=1, name='Report', content='<p>Hello</p>')
+    db.session.add(document)
+    db.session.commit()
+
+    AutosaveBuffer(app).apply(document.id, 1, 1, [{'at': 8, 'delete': 0, 'insert': ' world'}])
+    assert get_content(db.session, document.id, 2) == '<p>Hello world</p>'
+
+
+def test_retention_thins_old_versions_and_drops_expired_groups(app, monkeypatch):
+    monkeypatch.setattr(document_versions, 'KEEP_VERSIONS', 5)
+    monkeypatch.setattr(document_versions, 'SNAPSHOT_EVERY', 4)
+    sections = ['Baseline text. ' * 30 for _ in range(10)]
+    document = Document(user_id=1, name='Report', content=report(sections))
+    db.session.add(document)
+    db.session.commit()
+    history = [(1, document.content)] + edit_many(document, sections, 11)
+
+    prune(db.session, document.id)
+    db.session.commit()
+    rows = {row.version: row.kind for row in DocumentVersion.query.filter_by(document_id=document.id)}
+    assert set(range(8, 13)) <= set(rows)
+    assert all(kind == 'snapshot' for version, kind in rows.items() if version < 8)
+    for version in rows:
+        assert get_content(db.session, document.id, version) == dict(history)[version]
+
+    prune(db.session, document.id, now=datetime.utcnow() + timedelta(days=365))
+    db.session.commit()
+    remaining = {row.version for row in DocumentVersion.query.filter_by(document_id=document.id)}
+    assert document.version in remaining
+    assert min(remaining) >= 8 - 4
@@ -0,0 +1,121 @@
+"""
+Tests for the streaming export of conversations and documents
+"""
+import io
+import json
+import tracemalloc
+import zipfile
+
+import pytest
+from flask import Response, stream_with_context
+from sqlalchemy import event, insert
+
+from export import export_chunks, iter_conversations, ndjson_lines, zip_chunks
+from models import db, User, Conversation, Answer, Document
+
+
+@pytest.fixture
+def app(app):
+    @app.route('/export/<int:user_id>/<fmt>')
+    def export_route(user_id, fmt):
+        return Response(stream_with_context(export_chunks(db.session, user_id, fmt)))
+
+    owner = User(username='owner', email='owner@example.com', password='x')
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add_all([owner, other])
+    db.session.flush()
+    for i in range(5):
+        conversation = Conversation(user_id=owner.id, title=f'Report {i}: Climate/Water',
+                                    company_description='A brewery', nace_sector='C11')
+        conversation.answers = [Answer.from_markdown(None, f'Question {j}', f'**Answer** {i}.{j}')
+                                for j in range(i)]
+        db.session.add(conversation)
+    db.session.add(Answer(conversation=Conversation(user_id=owner.id, title='Legacy'),
+                          question='Old', answer='<p>Only html</p>'))
+    db.session.add(Conversation(user_id=other.id, title='Not mine'))
+    db.session.add(Document(user_id=owner.id, name='Annual report', content='<h1>Report</h1>'))
+    db.session.add(Document(user_id=other.id, name='Not mine', content='<p>secret</p>'))
+    db.session.commit()
+    return app
+
+
+def owner_id():
+    return User.query.filter_by(username='owner').one().id
+
+
+def test_ndjson_lists_conversations_with_their_answers_then_documents(app):
+    with app.app_context():
+        records = [json.loads(line) for line in ndjson_lines(db.session, owner_id(), batch_size=2)]
+
+    types = [record['type'] for record in records]
+    assert types.count('conversation') == 6 and types.count('answer') == 11 and types.count('document') == 1
+    assert types[-1] == 'document' and records[-1]['content'] == '<h1>Report</h1>'
+    current = None
+    for record in records:
+        if record['type'] == 'conversation':
+            current = record['id']
+        elif record['type'] == 'answer':
+            assert record['conversation_id'] == current
+    assert not any(record.get('title') == 'Not mine' or record.get('name') == 'Not mine' for record in records)
+    legacy = next(record for record in records if record.get('question') == 'Old')
+    assert legacy['markdown'] == '<p>Only html</p>'
+
+
+def test_unread_answers_are_skipped(app):
+    with app.app_context():
+        read = {}
+        for i, (conversation, answers) in enumerate(iter_conversations(db.session, owner_id(), batch_size=4)):
+            if i % 2:
+                read[conversation.title] = [answer.question for answer in answers]
+        assert read == {'Report 1: Climate/Water': ['Question 0'],
+                        'Report 3: Climate/Water': ['Question 0', 'Question 1', 'Question 2'],
+                        'Legacy': ['Old']}
+
+
+def test_zip_has_a_markdown_file_per_conversation_and_html_per_document(app):
+    with app.app_context():
+        data = b''.join(zip_chunks(db.session, owner_id()))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    assert len([name for name in names if name.startswith('conversations/')]) == 6
+    transcript = next(name for name in names if 'Report-4-Climate-Water' in name)
+    text = archive.read(transcript).decode('utf-8')
+    assert text.startswith('# Report 4: Climate/Water') and '## Question 3\n\n**Answer** 4.3' in text
+    document = next(name for name in names if name.startswith('documents/'))
+    assert archive.read(document) == b'<h1>Report</h1>'
+
+
+def test_response_is_streamed_and_memory_stays_flat(app):
+    with app.app_context():
+        user_id = owner_id()
+        body = '<p>' + 'Disclosure narrative. ' * 2500 + '</p>'
+        db.session.execute(insert(Document), [
+            {'user_id': user_id, 'name': f'Document {i}', 'content': body} for i in range(400)
+        ])
+        db.session.commit()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = app.test_client().get(f'/export/{user_id}/ndjson', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        # The first line is sent before the documents have been queried
+        assert not any('FROM documents' in statement for statement in statements)
+
+        tracemalloc.start()
+        total = sum(len(chunk) for chunk in chunks)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        response.close()
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert total > 400 * 55000
+    # 400 documents of 55 KB (22 MB) in total
+    assert peak < 8 * 1024 * 1024
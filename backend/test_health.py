@@ -0,0 +1,67 @@
+"""
+Tests for the readiness report
+"""
+from health import readiness_report
+from llm_backends import LLMBackend, LLMRouter
+from models import db
+from warmup import Warmup
+
+
+def make_router():
+    return LLMRouter({'local': LLMBackend('local', 'http://localhost:11434/v1', 'llama3.2:1b')})
+
+
+def test_ready_when_everything_is_loaded(app):
+    warmup = Warmup()
+    warmup.register('reranker', lambda: 'reranker')
+    warmup.start(wait=True)
+
+    with app.app_context():
+        report, ready = readiness_report(warmup, db, make_router())
+
+    assert ready
+    assert report['checks']['reranker']['status'] == 'ready'
+    assert report['checks']['database']['status'] == 'ready'
+    assert report['checks']['llm']['backends'] == {'local': True}
+
+
+def test_not_ready_while_components_are_pending(app):
+    warmup = Warmup()
+    warmup.register('default_db', lambda: 'index')
+
+    with app.app_context():
+        _, ready = readiness_report(warmup, db, make_router())
+        _, lazy_ready = readiness_report(warmup, db, make_router(), lazy=True)
+
+    assert not ready
+    assert lazy_ready
+
+
+def test_failed_component_and_ejected_backend_are_reported(app):
+    warmup = Warmup()
+    warmup.register('nace_db', lambda: open('/nonexistent/index.faiss'))
+    warmup.start(wait=True)
+    router = make_router()
+    router.backends['local']._ejected_until = float('inf')
+
+    with app.app_context():
+        report, ready = readiness_report(warmup, db, router, lazy=True)
+
+    assert not ready
+    assert report['checks']['nace_db']['status'] == 'failed'
+    assert report['checks']['llm']['status'] == 'failed'
+
+
+def test_failed_optional_component_degrades_without_blocking(app):
+    warmup = Warmup()
+    warmup.register('default_db', lambda: 'index')
+    warmup.register('energy_db', lambda: open('/nonexistent/index.faiss'), optional=True)
+    warmup.start(wait=True)
+
+    with app.app_context():
+        report, ready = readiness_report(warmup, db, make_router())
+
+    assert ready
+    assert report['status'] == 'degraded'
+    assert report['checks']['energy_db']['status'] == 'failed'
+    assert report['checks']['energy_db']['optional'] is True
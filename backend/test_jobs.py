@@ -0,0 +1,96 @@
+"""
+Tests for the persistent background job queue
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Job
+from jobs import JobQueue, job_to_dict
+
+pytestmark = pytest.mark.app_config(JOB_WORKERS=2, JOB_POLL_INTERVAL=0.05)
+
+
+def test_enqueued_job_runs_in_background(app):
+    queue = JobQueue(app)
+
+    @queue.handler('double')
+    def double(payload, report_progress):
+        report_progress({'done': 1, 'total': 1})
+        return {'value': payload['value'] * 2}
+
+    with app.app_context():
+        job = queue.enqueue('double', {'value': 21})
+        job = queue.wait(job.id, timeout=5)
+        data = job_to_dict(job)
+
+    queue.stop(timeout=5)
+    assert data['status'] == 'done'
+    assert data['result'] == {'value': 42}
+    assert data['progress'] == {'done': 1, 'total': 1}
+
+
+def test_failing_job_records_error(app):
+    queue = JobQueue(app)
+
+    @queue.handler('broken')
+    def broken(payload, report_progress):
+        raise RuntimeError('model unavailable')
+
+    with app.app_context():
+        job = queue.enqueue('broken', {})
+        job = queue.wait(job.id, timeout=5)
+        status, error, attempts = job.status, job.error, job.attempts
+
+    queue.stop(timeout=5)
+    assert status == 'failed'
+    assert error == 'model unavailable'
+    assert attempts == 1
+
+
+def test_job_is_claimed_once(app):
+    queue = JobQueue(app)
+    queue.handler('noop')(lambda payload, report_progress: None)
+
+    with app.app_context():
+        db.session.add(Job(kind='noop', payload='{}'))
+        db.session.commit()
+        first = queue._claim()
+        assert first is not None and first.status == 'running'
+        assert queue._claim() is None
+
+
+def test_only_jobs_with_a_stale_heartbeat_are_requeued(app):
+    queue = JobQueue(app)
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    slow = Job(kind='noop', status='running', attempts=1, started_at=long_ago, heartbeat_at=datetime.utcnow())
+    dead = Job(kind='noop', status='running', attempts=1, started_at=long_ago, heartbeat_at=long_ago)
+    crashing = Job(kind='noop', status='running', attempts=3, started_at=long_ago, heartbeat_at=long_ago)
+    db.session.add_all([slow, dead, crashing])
+    db.session.commit()
+
+    queue._requeue_stale()
+    db.session.expire_all()
+    assert slow.status == 'running'
+    assert dead.status == 'queued'
+    assert crashing.status == 'failed' and 'stopped responding' in crashing.error
+    assert crashing.finished_at is not None
+
+
+@pytest.mark.app_config(JOB_HEARTBEAT_SECONDS=0.05)
+def test_running_jobs_keep_their_heartbeat_fresh(app):
+    queue = JobQueue(app)
+    release = threading.Event()
+    queue.handler('slow')(lambda payload, report_progress: release.wait(5))
+
+    job = queue.enqueue('slow', {})
+    claimed_at = queue.wait(job.id, timeout=0.2).heartbeat_at
+    time.sleep(0.3)
+    db.session.rollback()
+    heartbeat = db.session.get(Job, job.id).heartbeat_at
+    release.set()
+    queue.wait(job.id, timeout=5)
+    queue.stop(timeout=5)
+    assert heartbeat > claimed_at
@@ -0,0 +1,161 @@
+"""
+Tests for LLM backend routing, ejection and hedging
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from llm_backends import BackendBusy, LLMBackend, LLMRouter, LlamaCppBackend, NoBackendAvailable, create_router
+
+
+class FakeBackend(LLMBackend):
+    def __init__(self, name, delay=0.0, fail=False, **kwargs):
+        super().__init__(name, base_url='http://fake', model=name, **kwargs)
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def complete(self, messages, **params):
+        start = time.monotonic()
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            self._record_failure()
+            raise RuntimeError(f'{self.name} failed')
+        self._record_success(time.monotonic() - start)
+        return self.name
+
+
+def test_task_routes_only_to_its_backends():
+    a, b = FakeBackend('a'), FakeBackend('b')
+    router = LLMRouter({'a': a, 'b': b}, tasks={'title': {'backends': ['b']}})
+    assert {router.complete('title', []) for _ in range(10)} == {'b'}
+    assert a.calls == 0
+
+
+def test_failing_backend_is_ejected_and_traffic_falls_back():
+    bad = FakeBackend('bad', fail=True, max_failures=2, ejection_seconds=60)
+    good = FakeBackend('good', weight=0.0001)
+    router = LLMRouter({'bad': bad, 'good': good})
+
+    for _ in range(10):
+        assert router.complete('answer', []) == 'good'
+    assert not bad.is_healthy()
+    assert bad.calls <= 2
+
+
+def test_slow_primary_is_hedged_to_second_backend():
+    slow = FakeBackend('slow', delay=0.5)
+    fast = FakeBackend('fast', weight=0.0001)
+    for _ in range(5):
+        slow._record_success(0.01)
+    router = LLMRouter({'slow': slow, 'fast': fast}, hedge_percentile=95, hedge_min_samples=5)
+    router.choose = lambda task, exclude=(): fast if 'slow' in exclude else slow
+
+    start = time.monotonic()
+    assert router.complete('answer', []) == 'fast'
+    assert time.monotonic() - start < 0.4
+    assert router.hedges_sent == 1
+    assert router.hedges_won == 1
+
+
+def test_create_router_requires_a_backend(monkeypatch):
+    monkeypatch.delenv('NVIDIA_API_KEY', raising=False)
+    monkeypatch.delenv('LLM_BACKENDS', raising=False)
+    monkeypatch.delenv('LLM_BACKENDS_FILE', raising=False)
+    with pytest.raises(NoBackendAvailable):
+        create_router()
+
+
+def test_kind_selects_the_backend_class():
+    router = create_router({'backends': {
+        'server': {'base_url': 'http://localhost:8080', 'model': 'tiny', 'kind': 'llamacpp'},
+        'ollama': {'base_url': 'http://localhost:11434/v1', 'model': 'llama3.2:1b'}
+    }})
+    assert isinstance(router.backends['server'], LlamaCppBackend)
+    assert router.backends['ollama'].kind == 'openai'
+    with pytest.raises(ValueError):
+        create_router({'backends': {'x': {'base_url': 'http://x', 'model': 'm', 'kind': 'unknown'}}})
+
+
+class SlowRequestBackend(LLMBackend):
+    def __init__(self, **kwargs):
+        super().__init__('local', base_url='http://fake', model='tiny', **kwargs)
+        self.active = 0
+        self.peak = 0
+
+    def _request(self, messages, **params):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return 'ok', 1
+
+
+def test_concurrency_governor_limits_in_flight_requests():
+    backend = SlowRequestBackend(max_concurrency=2)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda _: backend.complete([]), range(6)))
+    assert results == ['ok'] * 6
+    assert backend.peak == 2
+
+
+def test_concurrency_governor_rejects_when_queue_is_full():
+    backend = SlowRequestBackend(max_concurrency=1, max_queue=0)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(backend.complete, []) for _ in range(3)]
+        outcomes = [type(f.exception()) if f.exception() else 'ok' for f in futures]
+    assert outcomes.count('ok') >= 1
+    assert BackendBusy in outcomes
+    assert backend.failures == 0
+
+
+class RecordingClient:
+    """Stands in for the OpenAI client, recording the arguments of each request"""
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if not kwargs['stream']:
+            message = SimpleNamespace(content='four words of text')
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content='two words'))],
+                                     usage=None)])
+
+
+def recording_backend(**kwargs):
+    backend = LLMBackend('local', base_url='http://fake', model='tiny', **kwargs)
+    backend._client = RecordingClient()
+    return backend
+
+
+def test_streaming_is_opt_in(monkeypatch):
+    monkeypatch.delenv('LLM_STREAM', raising=False)
+    backend = recording_backend()
+    assert backend.generate([{'role': 'user', 'content': 'hi'}]) == ('four words of text', 4)
+    assert backend.client.requests[0]['stream'] is False
+
+    monkeypatch.setenv('LLM_STREAM', '1')
+    assert recording_backend().stream
+    assert not recording_backend(stream=False).stream
+
+
+def test_stream_options_are_sent_only_to_backends_that_support_them():
+    plain = recording_backend(stream=True)
+    assert plain.generate([{'role': 'user', 'content': 'hi'}]) == ('two words', 2)
+    assert 'stream_options' not in plain.client.requests[0]
+
+    with_usage = recording_backend(stream=True, stream_usage=True)
+    with_usage.generate([{'role': 'user', 'content': 'hi'}])
+    assert with_usage.client.requests[0]['stream_options'] == {'include_usage': True}
+
+    # Only meaningful when streaming
+    non_streaming = recording_backend(stream=False, stream_usage=True)
+    non_streaming.generate([{'role': 'user', 'content': 'hi'}])
+    assert 'stream_options' not in non_streaming.client.requests[0]
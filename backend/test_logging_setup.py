@@ -0,0 +1,84 @@
+"""
+Tests for queued, structured and redacted logging
+"""
+import json
+import logging
+import queue
+from logging.handlers import QueueListener
+
+from logging_setup import redact, ContextFilter, JsonFormatter, NonBlockingQueueHandler
+from tracing import trace
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_redacts_sensitive_values_and_emails():
+    assert redact("Failed login attempt for email: jane@example.com") == "Failed login attempt for email: [redacted]"
+    assert redact("Password reset link sent to: jane@example.com") == "Password reset link sent to: [email]"
+    assert redact("Invalid password reset attempt with token: abc123") == \
+        "Invalid password reset attempt with token: [redacted]"
+    assert redact("Session: {'company_desc': 'Acme', 'nace_sector': 'B05'}") == "Session: [redacted]"
+    assert redact("CSRF token validation failed: 10.0.0.1") == "CSRF token validation failed: 10.0.0.1"
+
+
+def test_records_are_written_by_the_background_listener_as_json():
+    log_queue = queue.Queue()
+    target = ListHandler()
+    target.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, target)
+    listener.start()
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    logger = make_logger('test.json', handler)
+
+    with trace('request', exported=False) as root:
+        logger.info("User %s logged in", 'jane', extra={'email': 'jane@example.com', 'user_id': 7})
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.exception("Chat failed")
+    listener.stop()
+
+    first, second = [json.loads(line) for line in target.lines]
+    assert first['message'] == 'User jane logged in'
+    assert first['trace_id'] == root.trace_id
+    assert first['email'] == '[redacted]'
+    assert first['user_id'] == 7
+    assert second['level'] == 'ERROR'
+    assert 'ValueError: boom' in second['exception']
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    logger = make_logger('test.full', handler)
+    for i in range(5):
+        logger.info("message %d", i)
+    assert handler.dropped == 4
+
+
+def test_debug_records_are_sampled():
+    log_queue = queue.Queue()
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(debug_sample_rate=0.0))
+    logger = make_logger('test.sampled', handler)
+
+    logger.debug("noisy")
+    logger.info("kept")
+    assert [log_queue.get_nowait().getMessage()] == ['kept']
+    assert log_queue.empty()
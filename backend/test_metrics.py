@@ -0,0 +1,57 @@
+"""
+Tests for the Prometheus metrics registry
+"""
+import pytest
+
+from metrics import Registry, track_commits
+from models import db, User
+
+
+def test_counter_renders_with_labels():
+    registry = Registry()
+    hits = registry.counter('hits_total', 'Cache hits', ['cache'])
+    hits.inc(cache='llm')
+    hits.inc(2, cache='llm')
+    hits.inc(cache='retrieval "a"')
+
+    text = registry.render()
+    assert '# TYPE hits_total counter' in text
+    assert 'hits_total{cache="llm"} 3' in text
+    assert 'hits_total{cache="retrieval \\"a\\""} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'latency_seconds_count 4' in lines
+    assert 'latency_seconds_sum 3.65' in lines
+
+
+def test_labels_must_match():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors', ['backend'])
+    with pytest.raises(ValueError):
+        errors.inc(task='answer')
+    with pytest.raises(ValueError):
+        registry.counter('errors_total', 'Errors again')
+
+
+def test_commits_are_timed(app):
+    from sqlalchemy.orm import Session
+    from metrics import DB_COMMIT_SECONDS
+
+    track_commits(Session)
+
+    before = DB_COMMIT_SECONDS.count()
+    user = User(username='metrics', email='metrics@example.com')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    assert DB_COMMIT_SECONDS.count() == before + 1
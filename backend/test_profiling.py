@@ -0,0 +1,94 @@
+"""
+Tests for on-demand profiling
+"""
+import os
+import pstats
+
+import pytest
+from flask import Flask
+from flask_login import LoginManager
+
+from profiling import Profiler
+
+
+@pytest.fixture
+def app(app, tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', '1')
+    monkeypatch.setenv('PROFILING_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setenv('ADMIN_TOKEN', 'admin-secret')
+
+    LoginManager(app).user_loader(lambda user_id: None)
+
+    @app.route('/chat')
+    def chat():
+        return str(sum(i * i for i in range(20000)))
+
+    @app.route('/other')
+    def other():
+        return 'ok'
+
+    profiler = Profiler()
+    profiler.init_app(app, memory_report=lambda: {'reranker': {'status': 'pending'}})
+    return app
+
+
+ADMIN = {'X-Admin-Token': 'admin-secret'}
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv('PROFILING_ENABLED', raising=False)
+    app = Flask(__name__)
+    Profiler().init_app(app)
+    assert 'profiler' not in app.extensions
+    assert not app.before_request_funcs
+
+
+def test_requires_admin(app):
+    client = app.test_client()
+    assert client.get('/admin/profiling').status_code == 403
+    assert client.get('/admin/profiling', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/admin/profiling', headers=ADMIN).status_code == 200
+
+
+def test_profiles_only_the_chosen_endpoint(app):
+    client = app.test_client()
+    response = client.post('/admin/profiling', headers=ADMIN,
+                           json={'endpoint': 'chat', 'fraction': 1, 'max_profiles': 2})
+    assert response.status_code == 200
+
+    for _ in range(3):
+        client.get('/chat')
+    client.get('/other')
+
+    status = client.get('/admin/profiling', headers=ADMIN).get_json()
+    assert status['written'] == 2
+    assert len(status['files']) == 2 and all(f.startswith('chat-') for f in status['files'])
+
+    path = os.path.join(app.extensions['profiler'].output_dir, status['files'][0])
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_sampling_mode_writes_collapsed_stacks(app):
+    client = app.test_client()
+    client.post('/admin/profiling', headers=ADMIN, json={'endpoint': 'chat', 'fraction': 1, 'mode': 'sample'})
+    client.get('/chat')
+    files = client.get('/admin/profiling', headers=ADMIN).get_json()['files']
+    assert files and files[0].endswith('.collapsed')
+
+
+def test_invalid_configuration_is_rejected(app):
+    client = app.test_client()
+    response = client.post('/admin/profiling', headers=ADMIN, json={'endpoint': 'chat', 'fraction': 2})
+    assert response.status_code == 400
+
+
+def test_memory_report(app):
+    import tracemalloc
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        report = client.get('/admin/profiling/memory?top=5', headers=ADMIN).get_json()
+    finally:
+        tracemalloc.stop()
+    assert report['components'] == {'reranker': {'status': 'pending'}}
+    assert len(report['tracemalloc']['top']) <= 5
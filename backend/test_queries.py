@@ -0,0 +1,153 @@
+"""
+Tests for the paginated conversation listing and message windows
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from models import db, User, Conversation, Answer, Document
+from queries import list_conversations, decode_cursor, message_window, window_meta, compact_turns
+
+
+@pytest.fixture
+def app(app):
+    owner = User(username='owner', email='owner@example.com', password='x')
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add_all([owner, other])
+    db.session.flush()
+
+    started = datetime(2025, 1, 1)
+    for i in range(5):
+        conversation = Conversation(user_id=owner.id, title=f'c{i}', company_description='d' * (100 + i * 20),
+                                    created_at=started + timedelta(hours=i))
+        db.session.add(conversation)
+        db.session.flush()
+        for j in range(i * 2):
+            db.session.add(Answer(conversation_id=conversation.id, question=f'q{j}', answer='a'))
+    # Same timestamp as the newest conversation: the id breaks the tie
+    db.session.add(Conversation(user_id=owner.id, title='tie', created_at=started + timedelta(hours=4)))
+    db.session.add(Conversation(user_id=other.id, title='not mine', created_at=started))
+    db.session.commit()
+    return app
+
+
+def owner_id():
+    return User.query.filter_by(username='owner').one().id
+
+
+def select_statements(run):
+    """Result of `run()` and the SELECT statements it executed"""
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        result = run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return result, [statement for statement in statements if statement.lstrip().startswith('SELECT')]
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(app):
+    with app.app_context():
+        user_id = owner_id()
+        titles, cursor, pages = [], None, 0
+        while True:
+            items, cursor = list_conversations(user_id, limit=2, cursor=cursor)
+            titles.extend(item['title'] for item in items)
+            pages += 1
+            if cursor is None:
+                break
+
+        assert titles == ['tie', 'c4', 'c3', 'c2', 'c1', 'c0']
+        assert pages == 3
+
+
+def test_counts_and_preview_come_from_one_statement(app):
+    with app.app_context():
+        user_id = owner_id()
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            items, cursor = list_conversations(user_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert len(statements) == 1
+        assert 'substr(conversations.company_description' in statements[0]
+        assert 'updated_at' not in statements[0]
+        assert cursor is None
+
+        by_title = {item['title']: item for item in items}
+        assert by_title['c4']['answer_count'] == 4
+        assert by_title['c0']['answer_count'] == 0
+        assert by_title['c4']['company_description'] == 'd' * 150 + '...'
+        assert by_title['c1']['company_description'] == 'd' * 120
+        assert by_title['tie']['company_description'] is None
+
+
+def test_malformed_cursor_is_rejected(app):
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+
+
+def test_message_window_pages_back_from_the_latest_answers(app):
+    with app.app_context():
+        conversation = Conversation.query.filter_by(title='c4').one()
+        answers, has_more = message_window(conversation.id, limit=3)
+        assert [a.question for a in answers] == ['q5', 'q6', 'q7']
+        assert has_more
+
+        older, has_more = message_window(conversation.id, limit=3, before_id=window_meta(answers, True)['oldest_id'])
+        assert [a.question for a in older] == ['q2', 'q3', 'q4']
+        assert has_more
+
+        oldest, has_more = message_window(conversation.id, limit=3, before_id=older[0].id)
+        assert [a.question for a in oldest] == ['q0', 'q1']
+        assert not has_more
+        assert compact_turns(oldest) == [{'id': oldest[0].id, 'q': 'q0', 'a': 'a'},
+                                         {'id': oldest[1].id, 'q': 'q1', 'a': 'a'}]
+
+
+def test_message_window_uses_the_composite_index(app):
+    with app.app_context():
+        conversation = Conversation.query.filter_by(title='c4').one()
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM answers WHERE conversation_id = :id ORDER BY created_at DESC LIMIT 3"
+        ), {'id': conversation.id}).all()
+        assert 'ix_answers_conversation_created' in ' '.join(row[-1] for row in plan)
+
+
+def test_listings_leave_large_columns_unread(app):
+    with app.app_context():
+        user_id = owner_id()
+        db.session.add(Document(user_id=user_id, name='Report', content='<p>' + 'x' * 10000 + '</p>'))
+        db.session.commit()
+        db.session.expunge_all()
+
+        documents, statements = select_statements(
+            lambda: [(d.id, d.name, d.created_at) for d in
+                     Document.query.filter_by(user_id=user_id).order_by(Document.created_at.desc()).all()])
+        assert len(statements) == 1 and 'documents.content' not in statements[0]
+        conversations, statements = select_statements(
+            lambda: [(c.id, c.title) for c in Conversation.query.filter_by(user_id=user_id).all()])
+        assert len(statements) == 1 and 'company_description' not in statements[0]
+
+        # Detail reads load them in the same statement
+        document, statements = select_statements(
+            lambda: Document.query.options(db.undefer(Document.content)).filter_by(id=documents[0][0]).one().content)
+        assert len(statements) == 1 and 'documents.content' in statements[0]
+        assert len(document) == 10007
+
+
+def test_message_window_loads_answer_bodies_with_the_rows(app):
+    with app.app_context():
+        conversation_id = Conversation.query.filter_by(title='c4').one().id
+        db.session.expunge_all()
+
+        turns, statements = select_statements(
+            lambda: compact_turns(message_window(conversation_id, limit=3)[0], 'markdown'))
+        assert [turn['a'] for turn in turns] == ['a', 'a', 'a']
+        assert len(statements) == 1
+        assert 'answers.answer_markdown' in statements[0] and 'answers.answer,' in statements[0]
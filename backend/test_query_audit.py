@@ -0,0 +1,82 @@
+"""
+Tests for the composite indexes of the hot queries, checked with the query audit
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import session
+from sqlalchemy import text
+
+import query_audit
+from document_routes import documents
+from models import db, User, Conversation, Answer, Document, create_indexes
+from queries import list_conversations, message_window
+from query_audit import QueryAuditError, capture
+
+pytestmark = pytest.mark.app_config(TESTING=True, QUERY_AUDIT='1')
+
+
+@pytest.fixture
+def app(app):
+    query_audit.init_app(app)
+    app.register_blueprint(documents)
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        return ''
+
+    user = User(username='owner', email='owner@example.com', password='x')
+    db.session.add(user)
+    db.session.flush()
+    started = datetime(2025, 1, 1)
+    for i in range(20):
+        conversation = Conversation(user_id=user.id, title=f'c{i}', created_at=started + timedelta(hours=i),
+                                    updated_at=started + timedelta(hours=i))
+        db.session.add(conversation)
+        db.session.flush()
+        db.session.add_all([Answer(conversation_id=conversation.id, question='q', answer='a') for _ in range(3)])
+        db.session.add(Document(user_id=user.id, name=f'd{i}', content='<p>x</p>'))
+    db.session.commit()
+    return app
+
+
+def test_document_endpoints_pass_the_audit(app):
+    client = app.test_client()
+    client.get('/login/1')
+    assert client.get('/documents').status_code == 200
+    assert client.get('/documents/1').status_code == 200
+    assert client.put('/documents/1', json={'name': 'Renamed'}).status_code == 200
+
+
+def test_hot_queries_use_the_composite_indexes(app):
+    with app.app_context():
+        with capture('listing') as audit:
+            list_conversations(1, limit=5, cursor=None)
+            message_window(3, limit=2, before_id=None)
+            Conversation.query.filter_by(user_id=1).order_by(Conversation.updated_at.desc()).all()
+            Document.query.filter_by(user_id=1).order_by(Document.created_at.desc()).all()
+        with db.engine.connect() as connection:
+            audit.check(connection)
+
+
+def test_audit_reports_n_plus_one_and_full_scans(app):
+    with app.app_context():
+        with capture('bad') as audit:
+            for conversation in Conversation.query.filter_by(user_id=1).all():
+                Answer.query.filter_by(conversation_id=conversation.id).count()
+            Document.query.filter_by(name='d3').all()
+        with db.engine.connect() as connection:
+            assert len(audit.n_plus_one()) == 1
+            assert [detail for _, detail in audit.full_scans(connection)] == ['SCAN documents']
+            with pytest.raises(QueryAuditError):
+                audit.check(connection)
+            assert audit.full_scans(connection, allow=['documents']) == []
+
+
+def test_create_indexes_adds_missing_indexes_once(app):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_documents_user_updated'))
+        assert create_indexes(db) == ['ix_documents_user_updated']
+        assert create_indexes(db) == []
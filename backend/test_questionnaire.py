@@ -0,0 +1,82 @@
+"""
+Tests for bulk questionnaire parsing and answering
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from questionnaire import parse_questions, batch_rerank, answer_questionnaire, render_document, QuestionnaireError
+
+
+def test_parse_questions_accepts_json_and_csv():
+    assert parse_questions('["E1-1 targets?", " ", "S1-6 workforce?"]') == ['E1-1 targets?', 'S1-6 workforce?']
+    assert parse_questions({'questions': [{'question': 'A?'}, {'question': 'B?'}]}) == ['A?', 'B?']
+    assert parse_questions(b'id,question\n1,A?\n2,B?\n', 'questions.csv') == ['A?', 'B?']
+    with pytest.raises(QuestionnaireError):
+        parse_questions('[]')
+
+
+class FakeReranker:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        self.thread = threading.current_thread().name
+        return [len(passage) for _, passage in pairs]
+
+
+class FakeVectorstore:
+    def similarity_search(self, query, k):
+        return [SimpleNamespace(page_content=query + 'x' * i) for i in range(k)]
+
+
+def test_batch_rerank_uses_one_predict_call():
+    reranker = FakeReranker()
+    docs = [[SimpleNamespace(page_content=t) for t in ('a', 'aaa', 'aa')],
+            [SimpleNamespace(page_content=t) for t in ('bb', 'b')]]
+    ranked = batch_rerank(reranker, ['q1', 'q2'], docs, top_n=2)
+    assert reranker.calls == 1
+    assert [[d.page_content for d in r] for r in ranked] == [['aaa', 'aa'], ['bb', 'b']]
+
+
+def test_answers_keep_question_order():
+    questions = ['slow', 'fast', 'medium']
+    delays = {'slow': 0.2, 'fast': 0.0, 'medium': 0.1}
+
+    def answer_fn(question, context):
+        time.sleep(delays[question])
+        return question.upper()
+
+    events = list(answer_questionnaire(questions, FakeVectorstore(), FakeReranker(), answer_fn,
+                                       concurrency=3, k=3, top_n=2))
+    assert events[-1]['stage'] == 'complete'
+    assert events[-1]['answers'] == ['SLOW', 'FAST', 'MEDIUM']
+    assert [e['done'] for e in events if e['stage'] == 'answer'] == [1, 2, 3]
+
+
+def test_retrieval_runs_on_the_inference_pool():
+    reranker = FakeReranker()
+    events = list(answer_questionnaire(['q'], FakeVectorstore(), reranker, lambda question, context: '', k=2))
+    assert events[-1]['stage'] == 'complete'
+    assert reranker.thread.startswith('inference')
+
+
+def test_failed_answers_are_reported_and_left_out_of_the_document():
+    def answer_fn(question, context):
+        if question == 'broken':
+            raise RuntimeError('No LLM backend available')
+        return question.upper()
+
+    questions = ['first', 'broken', 'last']
+    events = list(answer_questionnaire(questions, FakeVectorstore(), FakeReranker(), answer_fn, k=2))
+    errors = [e for e in events if e.get('error')]
+    assert [(e['index'], e['error']) for e in errors] == [(1, 'No LLM backend available')]
+    answers = events[-1]['answers']
+    assert answers == ['FIRST', None, 'LAST']
+
+    document = render_document(questions, answers)
+    assert '<h2>first</h2>' in document and '<h2>last</h2>' in document
+    assert 'broken' not in document
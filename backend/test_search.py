@@ -0,0 +1,142 @@
+"""
+Tests for full-text search over conversations, answers and documents
+"""
+import time
+
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session as OrmSession
+
+from autosave_buffer import AutosaveBuffer
+from models import db, User, Conversation, Answer, Document, SearchEntry
+from search import rebuild, search, track_search
+
+pytestmark = pytest.mark.app_config(AUTOSAVE_FLUSH_SECONDS=0)
+
+
+@pytest.fixture
+def app(app):
+    track_search(OrmSession)
+    owner = User(username='owner', email='owner@example.com', password='x')
+    other = User(username='other', email='other@example.com', password='x')
+    db.session.add_all([owner, other])
+    db.session.flush()
+
+    conversation = Conversation(user_id=owner.id, title='Farm reporting',
+                                company_description='An organic dairy farm in Normandy')
+    conversation.answers = [
+        Answer.from_markdown(None, 'Which climate disclosures apply?',
+                             '- **E1** covers greenhouse gas emissions and transition plans'),
+        Answer.from_markdown(None, 'What about water?', 'E3 asks for water consumption'),
+    ]
+    db.session.add(conversation)
+    db.session.add(Conversation(user_id=other.id, title='Other', company_description='Emissions of a refinery'))
+    db.session.add(Document(user_id=owner.id, name='Annual report',
+                            content='<h2>Climate</h2><p>Our emissions fell by 12%.</p>'))
+    db.session.commit()
+    return app
+
+
+def owner_id():
+    return User.query.filter_by(username='owner').one().id
+
+
+def kinds(results):
+    return sorted((result['kind'], result['id']) for result in results)
+
+
+def test_matches_are_ranked_highlighted_and_scoped_to_the_user(app):
+    with app.app_context():
+        results, next_offset = search(db.session, owner_id(), 'emissions')
+        assert next_offset is None
+        assert sorted(result['kind'] for result in results) == ['answer', 'document']
+        answer = next(result for result in results if result['kind'] == 'answer')
+        assert '<mark>emissions</mark>' in answer['snippet']
+        assert '<strong>' not in answer['snippet']
+        assert answer['conversation_id'] is not None
+
+        # Title hits rank first; the last term matches as a prefix
+        results, _ = search(db.session, owner_id(), 'climat')
+        assert results[0]['title'].startswith('Which <mark>climate</mark>')
+
+        results, _ = search(db.session, owner_id(), 'normandy dairy')
+        assert [result['kind'] for result in results] == ['conversation']
+
+
+def test_markup_in_content_is_escaped(app):
+    with app.app_context():
+        document = Document.query.filter_by(name='Annual report').one()
+        document.replace_content('<p>Paste of &lt;script&gt;alert(1)&lt;/script&gt; in the report</p>')
+        db.session.commit()
+        results, _ = search(db.session, owner_id(), 'paste')
+        assert '&lt;script&gt;' in results[0]['snippet'] and '<script>' not in results[0]['snippet']
+
+
+def test_kind_filter_and_pagination(app):
+    with app.app_context():
+        conversation = Conversation.query.filter_by(title='Farm reporting').one()
+        for i in range(5):
+            db.session.add(Answer.from_markdown(conversation.id, f'Follow-up {i} on biodiversity', 'E4 applies'))
+        db.session.commit()
+
+        seen, offset = [], 0
+        while offset is not None:
+            results, offset = search(db.session, owner_id(), 'biodiversity', kind='answer', limit=2, offset=offset)
+            seen += results
+        assert len(seen) == 5 and len({result['id'] for result in seen}) == 5
+        assert search(db.session, owner_id(), 'biodiversity', kind='document')[0] == []
+        assert search(db.session, owner_id(), '  ?! ')[0] == []
+
+
+def test_index_follows_updates_and_deletes(app):
+    with app.app_context():
+        user_id = owner_id()
+        document = Document.query.filter_by(name='Annual report').one()
+        document.replace_content('<p>Scope 3 supply chain data</p>')
+        db.session.commit()
+        assert kinds(search(db.session, user_id, 'supply')[0]) == [('document', document.id)]
+        assert search(db.session, user_id, 'fell')[0] == []
+
+        AutosaveBuffer(app).apply(document.id, user_id, document.version,
+                                  [{'at': 3, 'delete': 0, 'insert': 'Audited '}])
+        assert kinds(search(db.session, user_id, 'audited')[0]) == [('document', document.id)]
+
+        conversation = Conversation.query.filter_by(title='Farm reporting').one()
+        Answer.query.filter_by(conversation_id=conversation.id).delete()
+        db.session.delete(conversation)
+        db.session.commit()
+        assert search(db.session, user_id, 'emissions')[0] == []
+        assert SearchEntry.query.filter_by(user_id=user_id).count() == 1
+
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        assert SearchEntry.query.filter_by(user_id=user_id).count() == 0
+        db.session.execute(text("INSERT INTO search_fts(search_fts) VALUES ('integrity-check')"))
+
+
+def test_rebuild_recreates_the_same_index(app):
+    with app.app_context():
+        before = search(db.session, owner_id(), 'emissions')[0]
+        assert rebuild(db.session) == 5
+        db.session.commit()
+        # Raises if the index and its external content disagree
+        db.session.execute(text("INSERT INTO search_fts(search_fts) VALUES ('integrity-check')"))
+        assert kinds(search(db.session, owner_id(), 'emissions')[0]) == kinds(before)
+
+
+def test_search_stays_fast_with_many_answers(app):
+    with app.app_context():
+        conversation = Conversation.query.filter_by(title='Farm reporting').one()
+        db.session.execute(insert(Answer), [
+            {'conversation_id': conversation.id, 'question': f'Question {i} about social topics',
+             'answer': f'<p>S1 own workforce, item {i}, with narrative text on working conditions.</p>'}
+            for i in range(20000)
+        ])
+        assert rebuild(db.session) > 20000
+        db.session.commit()
+
+        started = time.perf_counter()
+        results, next_offset = search(db.session, owner_id(), 'workforce conditions', limit=20)
+        elapsed = time.perf_counter() - started
+        assert len(results) == 20 and next_offset == 20
+        assert elapsed < 1.0
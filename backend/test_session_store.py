@@ -0,0 +1,118 @@
+"""
+Tests for the server-side session store
+"""
+import pytest
+from flask import session, jsonify
+from sqlalchemy import event
+
+from models import db, ServerSession
+from session_store import SqlAlchemySessionInterface
+
+
+@pytest.fixture
+def app(app):
+    app.session_interface = SqlAlchemySessionInterface(
+        db, skip=lambda request: request.path.startswith('/assets/'))
+
+    @app.route('/assets/<path:path>')
+    def static_file(path):
+        return 'body { }'
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['company_desc'] = value * 1000
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return jsonify({'company_desc': session.get('company_desc')})
+
+    @app.route('/login')
+    def login():
+        session.regenerate()
+        session['user_id'] = 1
+        return 'ok'
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def session_cookie(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def session_queries(app, run):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'sessions' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def test_cookie_holds_only_the_session_id(app):
+    client = app.test_client()
+    client.get('/set/abc')
+
+    cookie = session_cookie(client)
+    assert cookie is not None and len(cookie) < 100
+    assert client.get('/get').get_json() == {'company_desc': 'abc' * 1000}
+
+    with app.app_context():
+        assert ServerSession.query.count() == 1
+
+
+def test_unmodified_session_is_not_rewritten(app):
+    client = app.test_client()
+    client.get('/set/x')
+    response = client.get('/get')
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_regenerate_moves_data_to_a_new_id(app):
+    client = app.test_client()
+    client.get('/set/x')
+    before = session_cookie(client)
+    client.get('/login')
+    after = session_cookie(client)
+
+    assert before != after
+    assert client.get('/get').get_json() == {'company_desc': 'x' * 1000}
+    with app.app_context():
+        assert ServerSession.query.count() == 1
+
+
+def test_clearing_the_session_deletes_the_row(app):
+    client = app.test_client()
+    client.get('/set/x')
+    client.get('/clear')
+    with app.app_context():
+        assert ServerSession.query.count() == 0
+
+
+def test_requests_without_a_cookie_do_not_query_the_table(app):
+    client = app.test_client()
+    assert session_queries(app, lambda: client.get('/get')) == []
+
+
+def test_static_requests_skip_the_session(app):
+    client = app.test_client()
+    client.get('/set/x')
+    response = None
+
+    def fetch():
+        nonlocal response
+        response = client.get('/assets/main.css')
+    assert session_queries(app, fetch) == []
+    assert response.status_code == 200 and 'Set-Cookie' not in response.headers
+    assert client.get('/get').get_json() == {'company_desc': 'x' * 1000}
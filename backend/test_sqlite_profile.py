@@ -0,0 +1,73 @@
+"""
+Tests for the SQLite engine profile
+"""
+import threading
+
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+import sqlite_profile
+from models import db, User
+
+
+def make_app(uri, **config):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config)
+    sqlite_profile.init_app(app)
+    db.init_app(app)
+    return app
+
+
+def pragma(name):
+    return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_file_database_connections_use_wal_and_tuned_pragmas(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'profile.db'}")
+    with app.app_context():
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1
+        assert pragma('busy_timeout') == sqlite_profile.BUSY_TIMEOUT_MS
+        assert pragma('cache_size') == -sqlite_profile.CACHE_KIB
+        assert pragma('temp_store') == 2
+        assert db.engine.pool.size() == sqlite_profile.POOL_SIZE
+
+
+def test_pooled_connections_are_shared_between_threads(tmp_path):
+    app = make_app(f"sqlite:///{tmp_path / 'threads.db'}")
+    with app.app_context():
+        db.create_all()
+
+    def add_user(i):
+        with app.app_context():
+            db.session.add(User(username=f'user{i}', email=f'user{i}@example.com', password='x'))
+            db.session.commit()
+
+    threads = [threading.Thread(target=add_user, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        assert User.query.count() == 8
+
+
+def test_memory_database_uses_one_static_connection():
+    app = make_app('sqlite:///:memory:')
+    with app.app_context():
+        assert isinstance(db.engine.pool, StaticPool)
+        assert pragma('journal_mode') == 'memory'
+
+
+def test_explicit_engine_options_win_and_profile_can_be_disabled(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'options.db'}"
+    app = make_app(uri, SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2})
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 2
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['factory'] is sqlite_profile.ProfiledConnection
+
+    app = make_app(uri, SQLITE_PROFILE='0')
+    assert 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config or not app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert not sqlite_profile.is_sqlite('mysql+pymysql://user@localhost/esrs')
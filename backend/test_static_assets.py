@@ -0,0 +1,72 @@
+"""
+Tests for in-memory static asset serving
+"""
+import gzip
+
+import pytest
+from flask import Flask, request
+
+from static_assets import StaticAssets, IMMUTABLE, REVALIDATE
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'index.html').write_text('<html>' + 'x' * 1000 + '</html>')
+    (tmp_path / 'assets' / 'index-CFftaNVL.js').write_text('console.log(1);' * 200)
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG' + b'\x00' * 2000)
+    return StaticAssets(str(tmp_path))
+
+
+@pytest.fixture
+def client(assets):
+    app = Flask(__name__)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_file = assets.lookup(path) if path else None
+        return assets.respond(static_file or assets.index_file(), request)
+
+    return app.test_client()
+
+
+def test_manifest_is_built_at_startup(assets):
+    assert set(assets.files) == {'index.html', 'assets/index-CFftaNVL.js', 'logo.png'}
+    assert 'gzip' in assets.lookup('assets/index-CFftaNVL.js').variants
+    assert 'gzip' not in assets.lookup('logo.png').variants
+
+
+def test_hashed_assets_are_immutable_and_compressed(client):
+    response = client.get('/assets/index-CFftaNVL.js', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.data) == b'console.log(1);' * 200
+
+
+def test_identity_when_client_does_not_accept_gzip(client):
+    response = client.get('/assets/index-CFftaNVL.js', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == b'console.log(1);' * 200
+
+
+def test_index_is_revalidated_with_etag(client):
+    first = client.get('/conversations/12')
+    assert first.headers['Cache-Control'] == REVALIDATE
+    assert first.data.startswith(b'<html>')
+
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.data == b''
+
+
+def test_precompressed_files_from_the_build_are_used(tmp_path):
+    (tmp_path / 'app.js').write_text('a' * 1000)
+    (tmp_path / 'app.js.gz').write_bytes(gzip.compress(b'a' * 1000))
+    assets = StaticAssets(str(tmp_path))
+
+    assert set(assets.files) == {'app.js'}
+    assert gzip.decompress(assets.lookup('app.js').variants['gzip']) == b'a' * 1000
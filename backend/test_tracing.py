@@ -0,0 +1,107 @@
+"""
+Tests for request tracing
+"""
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+import tracing
+from inference import run_inference
+from tracing import TracingMiddleware, span, trace, OtlpFileExporter
+
+
+class CaptureExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, finished):
+        self.spans.append(finished)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    capture = CaptureExporter()
+    monkeypatch.setattr(tracing, 'exporter', capture)
+    return capture.spans
+
+
+def test_spans_nest_under_the_trace(exported):
+    with trace('request') as root:
+        with span('retrieval'):
+            with span('similarity_search', k=10):
+                pass
+        with span('llm', task='answer'):
+            pass
+
+    by_name = {s.name: s for s in exported}
+    assert set(by_name) == {'request', 'retrieval', 'similarity_search', 'llm'}
+    assert by_name['similarity_search'].parent_id == by_name['retrieval'].span_id
+    assert by_name['llm'].parent_id == root.span_id
+    assert {s.trace_id for s in exported} == {root.trace_id}
+
+
+def test_span_outside_a_trace_is_a_no_op(exported):
+    with span('orphan') as orphan:
+        assert orphan is None
+    assert exported == []
+
+
+def test_inference_pool_keeps_the_current_span(exported):
+    def work():
+        with span('reranker.predict'):
+            return tracing.current_trace_id()
+
+    with trace('request') as root:
+        assert run_inference(work) == root.trace_id
+
+    rerank = next(s for s in exported if s.name == 'reranker.predict')
+    assert rerank.parent_id == root.span_id
+
+
+def test_failed_span_records_the_error(exported):
+    with pytest.raises(ValueError):
+        with trace('request'):
+            with span('llm'):
+                raise ValueError('backend down')
+    assert all('backend down' in s.error for s in exported)
+
+
+def test_middleware_returns_trace_id(exported):
+    app = Flask(__name__)
+    app.wsgi_app = TracingMiddleware(app.wsgi_app)
+
+    @app.route('/chat')
+    def chat():
+        with span('prompt.build'):
+            pass
+        return jsonify({'trace_id': tracing.current_trace_id()})
+
+    client = app.test_client()
+    response = client.get('/chat')
+    response.close()
+    trace_id = response.headers['X-Trace-Id']
+    assert response.get_json() == {'trace_id': trace_id}
+    assert [s.name for s in exported] == ['prompt.build', 'GET /chat']
+    assert exported[-1].attributes['status'] == 200
+
+    incoming = 'a' * 32
+    response = client.get('/chat', headers={'X-Trace-Id': incoming})
+    response.close()
+    assert response.headers['X-Trace-Id'] == incoming
+    assert tracing.current_span() is None
+
+
+def test_otlp_file_exporter_writes_one_document_per_span(tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'exporter', OtlpFileExporter(str(path)))
+
+    with trace('request'):
+        with span('db.commit', rows=1):
+            pass
+
+    documents = [json.loads(line) for line in path.read_text().splitlines()]
+    spans = [d['resourceSpans'][0]['scopeSpans'][0]['spans'][0] for d in documents]
+    assert [s['name'] for s in spans] == ['db.commit', 'request']
+    assert spans[0]['parentSpanId'] == spans[1]['spanId']
+    assert spans[0]['attributes'] == [{'key': 'rows', 'value': {'intValue': '1'}}]
@@ -0,0 +1,118 @@
+"""
+Tests for deferred, parallel component loading
+"""
+import sys
+import threading
+import time
+
+import pytest
+
+from warmup import Component, Warmup, timed_import, import_profile
+
+
+def test_components_load_in_parallel():
+    warmup = Warmup(max_workers=3)
+    barrier = threading.Barrier(3, timeout=5)
+
+    def loader(value):
+        def load():
+            barrier.wait()
+            return value
+        return load
+
+    for name in ('a', 'b', 'c'):
+        warmup.register(name, loader(name.upper()))
+
+    warmup.start(wait=True)
+
+    assert warmup.is_ready()
+    assert [warmup.get(name) for name in ('a', 'b', 'c')] == ['A', 'B', 'C']
+
+
+def test_component_is_loaded_lazily_and_once():
+    warmup = Warmup()
+    calls = []
+    warmup.register('model', lambda: calls.append(1) or 'model')
+
+    assert warmup.progress()['components']['model']['status'] == 'pending'
+    assert warmup.get('model') == 'model'
+    assert warmup.get('model') == 'model'
+    assert calls == [1]
+
+
+def test_concurrent_first_use_waits_for_a_single_load():
+    warmup = Warmup()
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'index'
+
+    warmup.register('index', load)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(warmup.get('index'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['index'] * 5
+    assert calls == [1]
+
+
+def test_failed_component_is_reported_and_retried_after_a_backoff():
+    warmup = Warmup(retry_seconds=0.2)
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FileNotFoundError('index.faiss')
+        return 'ok'
+
+    warmup.register('broken', load)
+    warmup.start(wait=True)
+
+    progress = warmup.progress()
+    assert progress['complete'] is False
+    assert progress['components']['broken']['status'] == 'failed'
+    assert 'index.faiss' in progress['components']['broken']['error']
+
+    # The failure is cached instead of reloading on every use
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match='index.faiss'):
+            warmup.get('broken')
+    assert len(attempts) == 1
+
+    time.sleep(0.25)
+    assert warmup.get('broken') == 'ok'
+    assert warmup.is_ready()
+
+
+def test_retry_backoff_doubles_after_each_failure():
+    component = Component('broken', lambda: 1 / 0, retry_seconds=10)
+    for failures, backoff in ((1, 10), (2, 20), (3, 40)):
+        component.retry_at = 0.0
+        start = time.monotonic()
+        with pytest.raises(RuntimeError):
+            component.get()
+        assert component.failures == failures
+        assert component.retry_at - start == pytest.approx(backoff, abs=1)
+
+
+def test_timed_import_records_new_imports_only():
+    sys.modules.pop('colorsys', None)
+    before = len(import_profile)
+    timed_import('colorsys')
+    timed_import('colorsys')
+    assert [name for name, _ in import_profile[before:]] == ['colorsys']
+
+
+def test_resources_import_without_loading_models():
+    import resources
+
+    assert not any(c.status == 'ready' for c in resources.warmup.components.values())
+    assert resources.get_sector_vs('Agnostic') is None
+    with pytest.raises(KeyError):
+        resources.warmup.get('unknown')
@@ -0,0 +1,117 @@
+"""
+Tests for single-commit chat turns and the write-behind queue
+"""
+import pytest
+from sqlalchemy import event
+
+from models import db, User, Conversation, Answer
+from write_behind import ChatWriter
+
+
+@pytest.fixture
+def app(app):
+    db.session.add(User(username='writer', email='writer@example.com', password='x'))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def commits():
+    from sqlalchemy.orm import Session as OrmSession
+
+    count = []
+    listener = lambda session: count.append(1)
+    event.listen(OrmSession, 'after_commit', listener)
+    yield count
+    event.remove(OrmSession, 'after_commit', listener)
+
+
+def test_first_turn_creates_conversation_and_answer_in_one_commit(app, commits):
+    writer = ChatWriter(app)
+    commits.clear()
+    conversation = Conversation(user_id=1, title='Farm', nace_sector='A01', esrs_sector='Agnostic',
+                                company_description='A farm')
+    answer = writer.save_turn(None, 'A farm', 'Welcome', conversation=conversation)
+    assert len(commits) == 1
+    assert answer.conversation_id == conversation.id
+    assert answer.answer == '<p>Welcome</p>'
+
+    before = conversation.updated_at
+    writer.save_turn(conversation.id, 'Which standards?', '- E1')
+    assert len(commits) == 2
+    db.session.expire_all()
+    assert Answer.query.filter_by(conversation_id=conversation.id).count() == 2
+    assert db.session.get(Conversation, conversation.id).updated_at >= before
+
+
+@pytest.mark.app_config(CHAT_WRITE_BEHIND='1', CHAT_WRITE_BEHIND_INTERVAL=60, CHAT_WRITE_BEHIND_BATCH=2)
+def test_queued_turns_are_written_in_batches(app, commits):
+    writer = ChatWriter(app)
+    conversation = Conversation(user_id=1, title='Farm', company_description='A farm')
+    db.session.add(conversation)
+    db.session.commit()
+    conversation_id = conversation.id
+    commits.clear()
+
+    for i in range(5):
+        assert writer.save_turn(conversation_id, f"Question {i}", f"Answer {i}") is None
+    assert Answer.query.count() == 0
+    assert writer.pending(conversation_id)[0] == ('Question 0', 'Answer 0')
+    assert writer.pending(conversation_id + 1) == []
+
+    assert writer.flush() == 5
+    assert len(commits) == 3
+    assert writer.pending(conversation_id) == []
+    questions = [a.question for a in Answer.query.order_by(Answer.id)]
+    assert questions == [f"Question {i}" for i in range(5)]
+    writer.shutdown()
+
+
+@pytest.mark.app_config(CHAT_WRITE_BEHIND='1', CHAT_WRITE_BEHIND_INTERVAL=60)
+def test_shutdown_drains_the_queue(app):
+    writer = ChatWriter(app)
+    conversation = Conversation(user_id=1, title='Farm', company_description='A farm')
+    db.session.add(conversation)
+    db.session.commit()
+    conversation_id = conversation.id
+
+    writer.save_turn(conversation_id, 'Question', 'Answer')
+    writer.shutdown()
+    assert writer.pending(conversation_id) == []
+    assert Answer.query.filter_by(conversation_id=conversation_id).one().markdown == 'Answer'
+
+
+@pytest.mark.app_config(CHAT_WRITE_BEHIND='1', CHAT_WRITE_BEHIND_INTERVAL=60)
+def test_turn_of_a_deleted_conversation_does_not_block_later_turns(app):
+    event.listen(db.engine, 'connect', lambda connection, record: connection.execute('PRAGMA foreign_keys=ON'))
+    db.engine.dispose()
+    writer = ChatWriter(app)
+    deleted = Conversation(user_id=1, title='Gone', company_description='A farm')
+    kept = Conversation(user_id=1, title='Farm', company_description='A farm')
+    db.session.add_all([deleted, kept])
+    db.session.commit()
+    deleted_id, kept_id = deleted.id, kept.id
+
+    writer.save_turn(deleted_id, 'Lost question', 'Lost answer')
+    writer.save_turn(kept_id, 'Question 1', 'Answer 1')
+    # Deleted by another process, so the queued turn is still here
+    Conversation.query.filter_by(id=deleted_id).delete()
+    db.session.commit()
+
+    assert writer.flush() == 1
+    writer.save_turn(kept_id, 'Question 2', 'Answer 2')
+    assert writer.flush() == 1
+    assert writer.pending(deleted_id) == writer.pending(kept_id) == []
+    assert [a.question for a in Answer.query.order_by(Answer.id)] == ['Question 1', 'Question 2']
+    writer.shutdown()
+
+
+@pytest.mark.app_config(CHAT_WRITE_BEHIND='1', CHAT_WRITE_BEHIND_INTERVAL=60)
+def test_discard_drops_the_queued_turns_of_a_conversation(app):
+    writer = ChatWriter(app)
+    writer.save_turn(1, 'Question', 'Answer')
+    writer.save_turn(2, 'Question', 'Answer')
+    writer.discard(1)
+    assert writer.pending(1) == []
+    assert writer.pending(2) == [('Question', 'Answer')]
+    writer.shutdown()
@@ -0,0 +1,291 @@
+"""
+Per-request traces made of nested, timed spans.
+
+TracingMiddleware gives every HTTP request a trace id (taken from an
+incoming X-Trace-Id or W3C traceparent header when present) and returns it
+in the X-Trace-Id response header. Code opens child spans with
+`with span('name', key=value):`; the current trace and span are kept in
+context variables, so spans nest naturally; the inference pool and LLM
+hedging run their work in a copy of the caller's context to keep nesting.
+
+Finished spans are exported according to TRACE_EXPORTER:
+  log   one log record per span on the "tracing" logger, with the span
+        as a structured field (default)
+  file  OpenTelemetry (OTLP/JSON) lines appended to TRACE_FILE
+  none  ids and headers only
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('tracing')
+
+TRACE_HEADER = 'X-Trace-Id'
+TRACE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error', 'exported')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, exported=True):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+        self.exported = exported
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 2),
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class LogExporter:
+    def export(self, span):
+        logger.info(f"span {span.name} {span.duration * 1000:.1f}ms", extra={'span': span.to_dict()})
+
+
+class OtlpFileExporter:
+    """Appends spans as OTLP/JSON `resourceSpans` documents, one per line"""
+
+    def __init__(self, path, service_name='esgenerator'):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        document = {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', self.service_name)]},
+            'scopeSpans': [{
+                'scope': {'name': 'esgenerator.tracing'},
+                'spans': [{
+                    'traceId': span.trace_id,
+                    'spanId': span.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'kind': 1,
+                    'startTimeUnixNano': str(int(span.start * 1e9)),
+                    'endTimeUnixNano': str(int(span.end * 1e9)),
+                    'attributes': [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                    'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+                }]
+            }]
+        }]}
+        line = json.dumps(document, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+class NullExporter:
+    def export(self, span):
+        pass
+
+
+def create_exporter(name=None):
+    name = name or os.environ.get('TRACE_EXPORTER', 'log')
+    if name == 'file':
+        return OtlpFileExporter(os.environ.get('TRACE_FILE', os.path.join('logs', 'traces.jsonl')))
+    if name == 'none':
+        return NullExporter()
+    return LogExporter()
+
+
+exporter = create_exporter()
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+
+
+def new_trace_id():
+    return secrets.token_hex(16)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_trace_id():
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+
+@contextmanager
+def trace(name, trace_id=None, exported=None, **attributes):
+    """Start a new trace whose root span covers the block"""
+    if exported is None:
+        exported = random.random() < SAMPLE_RATE
+    root = Span(name, trace_id or new_trace_id(), attributes=attributes, exported=exported)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(root)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a child of the current span; does nothing outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, attributes, parent.exported)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(child)
+
+
+def record_span(name, start, end, **attributes):
+    """Record a span that has already happened, e.g. measured by an event hook"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    child = Span(name, parent.trace_id, parent.span_id, attributes, parent.exported)
+    child.start = start
+    _finish(child, end)
+
+
+def _finish(finished, end=None):
+    finished.end = end or time.time()
+    if not finished.exported:
+        return
+    try:
+        exporter.export(finished)
+    except Exception as e:
+        logger.warning(f"Could not export span {finished.name}: {str(e)}")
+
+
+def _before_commit(session):
+    session.info['trace_commit_started'] = time.time()
+
+
+def _after_commit(session):
+    started = session.info.pop('trace_commit_started', None)
+    if started is not None:
+        record_span('db.commit', started, time.time())
+
+
+def _after_rollback(session):
+    session.info.pop('trace_commit_started', None)
+
+
+def trace_commits(session_class):
+    """Record a db.commit span for every commit made inside a trace"""
+    from sqlalchemy import event
+
+    for name, listener in (('before_commit', _before_commit), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
+
+
+def _incoming_trace_id(environ):
+    trace_id = environ.get('HTTP_X_TRACE_ID', '').lower()
+    if TRACE_ID_PATTERN.match(trace_id):
+        return trace_id
+    match = TRACEPARENT_PATTERN.match(environ.get('HTTP_TRACEPARENT', '').lower())
+    return match.group(1) if match else None
+
+
+class TracingMiddleware:
+    """WSGI middleware wrapping each request, including session loading, in a trace"""
+
+    def __init__(self, wsgi_app, skip_prefixes=('/assets/', '/health', '/metrics', '/warmup/')):
+        self.wsgi_app = wsgi_app
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        # Static files and probes still get a trace id, but their spans are not exported
+        exported = False if path.startswith(self.skip_prefixes) else None
+        context = trace(f"{environ.get('REQUEST_METHOD', 'GET')} {path}",
+                        trace_id=_incoming_trace_id(environ), exported=exported, path=path)
+        root = context.__enter__()
+        status_holder = {}
+
+        def traced_start_response(status, headers, exc_info=None):
+            status_holder['status'] = status
+            headers = [h for h in headers if h[0].lower() != TRACE_HEADER.lower()]
+            headers.append((TRACE_HEADER, root.trace_id))
+            return start_response(status, headers, exc_info)
+
+        try:
+            iterable = self.wsgi_app(environ, traced_start_response)
+        except BaseException as e:
+            context.__exit__(type(e), e, e.__traceback__)
+            raise
+        return _TracedResponse(iterable, context, root, status_holder)
+
+
+class _TracedResponse:
+    """Response body that ends the request's trace once the server has sent it"""
+
+    def __init__(self, iterable, context, root, status_holder):
+        self.iterable = iterable
+        self.context = context
+        self.root = root
+        self.status_holder = status_holder
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            status = self.status_holder.get('status', '')
+            self.root.set(status=int(status.split(' ')[0]) if status else None)
+            self.context.__exit__(None, None, None)
@@ -0,0 +1,182 @@
+"""
+Deferred, parallel loading of heavy components (models, vectorstores).
+
+Components are registered with a loader and loaded either on first use or
+all at once on a thread pool by Warmup.start(). Each component records its
+status and load time so progress can be reported while the process is
+already serving requests. A component that failed to load raises its cached
+error until WARMUP_RETRY_SECONDS (30) have passed, doubling after every
+further failure up to ten minutes, so a broken vectorstore is not reloaded
+on every request that touches it. Heavy imports made through timed_import() are
+recorded in an import-time profile.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+import_profile = []
+
+
+def timed_import(module_name):
+    """Import a module, recording how long it took when it was not already loaded"""
+    import sys
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_profile.append((module_name, time.perf_counter() - start))
+    return module
+
+
+def log_import_profile(log=None, title='Import-time profile'):
+    log = log or logger
+    if not import_profile:
+        return
+    lines = [f"  {name:<40} {seconds:7.2f}s" for name, seconds in sorted(import_profile, key=lambda x: -x[1])]
+    log.info(f"{title}:\n" + "\n".join(lines))
+
+
+class Component:
+    max_retry_seconds = 600
+
+    def __init__(self, name, loader, retry_seconds=30, optional=False):
+        self.name = name
+        self.loader = loader
+        self.retry_seconds = retry_seconds
+        # Optional components degrade a feature when they fail, they do not block readiness
+        self.optional = optional
+        self._reset()
+
+    def _reset(self):
+        self.status = 'pending'
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _due(self):
+        return self.status != 'ready' and (self.status != 'failed' or time.monotonic() >= self.retry_at)
+
+    def get(self):
+        if self.status == 'ready':
+            return self.value
+        if self._due():
+            with self._lock:
+                if self._due():
+                    self._load()
+        if self.status == 'failed':
+            raise RuntimeError(f"Component '{self.name}' failed to load: {self.error}")
+        return self.value
+
+    def _load(self):
+        self.status = 'loading'
+        start = time.perf_counter()
+        try:
+            self.value = self.loader()
+            self.status = 'ready'
+            self.error = None
+            self.failures = 0
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            self.failures += 1
+            backoff = min(self.retry_seconds * 2 ** (self.failures - 1), self.max_retry_seconds)
+            self.retry_at = time.monotonic() + backoff
+            logger.error(f"Error loading {self.name}, retrying in {backoff:.0f}s: {str(e)}")
+        self.load_seconds = time.perf_counter() - start
+
+    def describe(self):
+        return {
+            'status': self.status,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            'error': self.error,
+            'optional': self.optional
+        }
+
+
+class Warmup:
+    def __init__(self, max_workers=None, retry_seconds=None):
+        self.components = {}
+        self.max_workers = max_workers or int(os.environ.get('WARMUP_THREADS', 4))
+        self.retry_seconds = (retry_seconds if retry_seconds is not None
+                              else float(os.environ.get('WARMUP_RETRY_SECONDS', 30)))
+        self.started_at = None
+        self.finished_at = None
+        self._started_pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name, loader, optional=False):
+        self.components[name] = Component(name, loader, self.retry_seconds, optional)
+        return self.components[name]
+
+    def get(self, name):
+        return self.components[name].get()
+
+    def start(self, wait=False):
+        """Load every component in parallel; returns at once unless wait is True"""
+        with self._lock:
+            if self._started_pid != os.getpid():
+                self._started_pid = os.getpid()
+                self.started_at = time.perf_counter()
+                self.finished_at = None
+                self._thread = threading.Thread(target=self._load_all, name='warmup', daemon=True)
+                self._thread.start()
+        if wait:
+            self._thread.join()
+
+    def _load_all(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='warmup') as executor:
+            for component in self.components.values():
+                executor.submit(self._load_quietly, component)
+        self.finished_at = time.perf_counter()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s: " +
+                    ", ".join(f"{c.name}={c.status} ({c.load_seconds or 0:.2f}s)" for c in self.components.values()))
+        log_import_profile()
+
+    @staticmethod
+    def _load_quietly(component):
+        try:
+            component.get()
+        except Exception:
+            pass
+
+    def _after_fork(self):
+        # Loads that were in progress in the parent cannot finish in the child
+        # (their threads do not survive the fork): reset them and start over.
+        started_in_parent = self._started_pid is not None
+        self._lock = threading.Lock()
+        for component in self.components.values():
+            if component.status != 'ready':
+                component._reset()
+            else:
+                component._lock = threading.Lock()
+        if started_in_parent:
+            self._started_pid = None
+            self.start()
+
+    def is_ready(self):
+        return all(c.status == 'ready' for c in self.components.values())
+
+    def progress(self):
+        ready = sum(1 for c in self.components.values() if c.status == 'ready')
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            'ready': ready,
+            'total': len(self.components),
+            'complete': self.is_ready(),
+            'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+            'components': {name: c.describe() for name, c in self.components.items()},
+            'import_profile': [{'module': name, 'seconds': round(s, 3)} for name, s in import_profile]
+        }
@@ -0,0 +1,210 @@
+"""
+Persistence of chat turns.
+
+Every turn is saved as one unit of work: the Answer row, the bump of its
+conversation's updated_at and, for the first message, the Conversation
+itself go out in a single commit. Callers release their database connection
+(release_connection) before the slow retrieval and LLM calls, so a pooled
+connection is never held while a model is generating.
+
+With CHAT_WRITE_BEHIND=1 turns of existing conversations are not written on
+the request thread at all: they are queued in memory and a background thread
+inserts them in batches of up to CHAT_WRITE_BEHIND_BATCH (100) every
+CHAT_WRITE_BEHIND_INTERVAL seconds (0.5). A batch that fails is written again
+turn by turn: a turn the database rejects for good (an IntegrityError, e.g.
+its conversation was deleted while it was queued) is logged and dropped, so
+it cannot hold up the turns behind it, while other errors (the database is
+unreachable) leave the rest queued to be retried. Deleting a conversation
+discards its queued turns. The queue is drained at interpreter exit
+(gunicorn workers exit normally on SIGTERM). While a turn is queued it is visible to the prompt
+history of its conversation in this process, but not yet to other processes
+or to the message listing. First messages are always written inline, since
+the conversation id they create is needed by the session.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import db, Conversation, Answer, render_markdown
+
+logger = logging.getLogger(__name__)
+
+
+def release_connection():
+    """Return the request's pooled connection before a slow call; loaded objects stay readable"""
+    db.session.close()
+
+
+class ChatWriter:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.interval = 0.5
+        self.batch_size = 100
+        self.max_pending = 10000
+        self.written = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = str(app.config.get('CHAT_WRITE_BEHIND', os.environ.get('CHAT_WRITE_BEHIND', ''))).lower() in (
+            '1', 'true', 'yes')
+        self.interval = float(app.config.get('CHAT_WRITE_BEHIND_INTERVAL',
+                                             os.environ.get('CHAT_WRITE_BEHIND_INTERVAL', 0.5)))
+        self.batch_size = int(app.config.get('CHAT_WRITE_BEHIND_BATCH', os.environ.get('CHAT_WRITE_BEHIND_BATCH', 100)))
+        app.extensions['chat_writer'] = self
+        atexit.register(self.shutdown)
+
+    def save_turn(self, conversation_id, question, markdown, html=None, conversation=None):
+        """Persist a question and its answer; `conversation` is a new Conversation saved in the same commit.
+
+        Returns the Answer when written inline, None when it was queued.
+        """
+        turn = {
+            'conversation_id': conversation_id,
+            'question': question,
+            'answer_markdown': markdown,
+            'answer': html if html is not None else render_markdown(markdown),
+            'created_at': datetime.utcnow()
+        }
+        if conversation is None and self.enabled:
+            with self._cond:
+                if len(self._pending) < self.max_pending:
+                    self.ensure_started()
+                    self._pending.append(turn)
+                    self._cond.notify()
+                    return None
+            logger.warning("Chat write-behind queue is full; writing inline")
+
+        answer = Answer(**turn)
+        if conversation is not None:
+            db.session.add(conversation)
+            answer.conversation = conversation
+        else:
+            Conversation.query.filter_by(id=conversation_id).update(
+                {'updated_at': turn['created_at']}, synchronize_session=False)
+        db.session.add(answer)
+        db.session.commit()
+        return answer
+
+    def pending(self, conversation_id):
+        """Queued (question, markdown) pairs of a conversation, oldest first"""
+        with self._cond:
+            return [(t['question'], t['answer_markdown']) for t in self._pending
+                    if t['conversation_id'] == conversation_id]
+
+    def discard(self, *conversation_ids):
+        """Drop the queued turns of deleted conversations"""
+        ids = set(conversation_ids)
+        with self._cond:
+            self._pending = [t for t in self._pending if t['conversation_id'] not in ids]
+
+    def ensure_started(self):
+        """Start the writer thread in this process (once per process, so it is fork-safe)"""
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            # Turns copied from the parent process are the parent's to write
+            self._pending = []
+        self._pid = os.getpid()
+        self._stop.clear()
+        threading.Thread(target=self._run, name='chat-write-behind', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop.is_set():
+                    self._cond.wait()
+                if self._stop.is_set():
+                    return
+            # Let a batch accumulate
+            self._stop.wait(self.interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Chat write-behind failed, will retry: {str(e)}")
+                self._stop.wait(max(self.interval, 1.0))
+
+    def flush(self):
+        """Write every queued turn; must run inside an app context"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.batch_size]
+                if not batch:
+                    return total
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.warning(f"Chat write-behind batch of {len(batch)} failed, writing turn by turn: {str(e)}")
+                    written = self._write_each(batch)
+                else:
+                    written = len(batch)
+                total += written
+                self.written += written
+
+    def _write(self, batch):
+        try:
+            db.session.add_all([Answer(**turn) for turn in batch])
+            latest = {}
+            for turn in batch:
+                latest[turn['conversation_id']] = turn['created_at']
+            for conversation_id, updated_at in latest.items():
+                Conversation.query.filter_by(id=conversation_id).update(
+                    {'updated_at': updated_at}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        self._done(batch)
+
+    def _write_each(self, batch):
+        """Write the turns of a failed batch one at a time, dropping the ones the database rejects"""
+        written = 0
+        for turn in batch:
+            try:
+                self._write([turn])
+                written += 1
+            except (IntegrityError, DataError) as e:
+                logger.error(f"Dropping chat turn for conversation {turn['conversation_id']} "
+                             f"({turn['question'][:80]!r}): {str(e)}")
+                self._done([turn])
+        return written
+
+    def _done(self, turns):
+        # Compared by identity: discard may have removed turns in the meantime
+        done = {id(turn) for turn in turns}
+        with self._cond:
+            self._pending = [t for t in self._pending if id(t) not in done]
+
+    def shutdown(self):
+        """Stop the writer thread and write whatever is still queued"""
+        with self._cond:
+            self._stop.set()
+            self._cond.notify_all()
+            remaining = len(self._pending)
+        if not remaining or self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+            logger.info(f"Wrote {remaining} queued chat turns at shutdown")
+        except Exception as e:
+            logger.error(f"Could not write {remaining} queued chat turns at shutdown: {str(e)}")
+
+
+chat_writer = ChatWriter()
@@ -3,18 +3,24 @@
 import React, { useState, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
-import { faComments, faFile, faTrash, faEye, faSpinner, faEdit } from '@fortawesome/free-solid-svg-icons';
+import { faComments, faFile, faTrash, faEye, faSpinner, faEdit, faSearch, faTimes, faDownload } from '@fortawesome/free-solid-svg-icons';
 import Header from './Header';
 import '../styles/MyContentPage.css';
 
 const MyContentPage = () => {
   const [activeTab, setActiveTab] = useState('conversations');
   const [conversations, setConversations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [documents, setDocuments] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   const [deleteItem, setDeleteItem] = useState(null);
   const [isDeleting, setIsDeleting] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchOffset, setSearchOffset] = useState(null);
+  const [isSearching, setIsSearching] = useState(false);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -59,9 +65,12 @@ const MyContentPage = () => {
     }
   };
 
-  const fetchConversations = async () => {
+  const fetchConversations = async (cursor = null) => {
     try {
-      const response = await fetch('/api/user/conversations', {
+      const url = cursor
+        ? `/api/user/conversations?cursor=${encodeURIComponent(cursor)}`
+        : '/api/user/conversations';
+      const response = await fetch(url, {
         credentials: 'include'
       });
       
@@ -71,9 +80,7 @@ const MyContentPage = () => {
       
       const data = await response.json();
       
-      const processedData = [];
-      
-      for (const conversation of data) {
+      const processedData = data.conversations.map(conversation => {
         const createdDate = new Date(conversation.created_at);
         const day = String(createdDate.getDate()).padStart(2, '0');
         const month = String(createdDate.getMonth() + 1).padStart(2, '0');
@@ -81,32 +88,32 @@ const MyContentPage = () => {
         const hours = String(createdDate.getHours()).padStart(2, '0');
         const minutes = String(createdDate.getMinutes()).padStart(2, '0');
         
-        conversation.displayTitle = conversation.title || `Conversation ${day}-${month}-${year} ${hours}:${minutes}`;
-        
-        try {
-          const detailsResponse = await fetch(`/api/user/conversation/${conversation.id}`, {
-            credentials: 'include'
-          });
-          
-          if (detailsResponse.ok) {
-            const details = await detailsResponse.json();
-            conversation.answerCount = details.answers ? Math.floor(details.answers.length / 2) : 0;
-          }
-        } catch (error) {
-          console.error(`Error fetching details for conversation ${conversation.id}:`, error);
-          conversation.answerCount = 0;
-        }
-        
-        processedData.push(conversation);
-      }
+        return {
+          ...conversation,
+          displayTitle: conversation.title || `Conversation ${day}-${month}-${year} ${hours}:${minutes}`,
+          answerCount: conversation.answer_count
+        };
+      });
       
-      setConversations(processedData);
+      setConversations(previous => cursor ? [...previous, ...processedData] : processedData);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error('Error fetching conversations:', error);
       throw error;
     }
   };
 
+  const loadMoreConversations = async () => {
+    setIsLoadingMore(true);
+    try {
+      await fetchConversations(nextCursor);
+    } catch (error) {
+      setError('Failed to load more conversations. Please try again.');
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const fetchDocuments = async () => {
     try {
       const response = await fetch('/api/user/documents', {
@@ -142,7 +149,8 @@ const MyContentPage = () => {
 
   const handleLoadConversation = async (id) => {
     try {
-      const response = await fetch(`/api/chat/load_conversation/${id}`, {
+      // The chat view fetches the messages itself
+      const response = await fetch(`/api/chat/load_conversation/${id}?limit=0`, {
         method: 'POST',
         credentials: 'include'
       });
@@ -162,6 +170,60 @@ const MyContentPage = () => {
     navigate(`/editor?document=${id}`);
   };
 
+  const runSearch = async (offset = 0) => {
+    const query = searchQuery.trim();
+    if (!query) {
+      clearSearch();
+      return;
+    }
+    
+    setIsSearching(true);
+    setError(null);
+    try {
+      const response = await fetch(`/api/user/search?q=${encodeURIComponent(query)}&offset=${offset}`, {
+        credentials: 'include'
+      });
+      
+      if (!response.ok) {
+        throw new Error('Failed to search');
+      }
+      
+      const data = await response.json();
+      setSearchResults(previous => offset && previous ? [...previous, ...data.results] : data.results);
+      setSearchOffset(data.next_offset);
+    } catch (error) {
+      console.error('Error searching:', error);
+      setError('Search failed. Please try again.');
+    } finally {
+      setIsSearching(false);
+    }
+  };
+
+  const handleSearchSubmit = (event) => {
+    event.preventDefault();
+    runSearch(0);
+  };
+
+  const clearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+    setSearchOffset(null);
+  };
+
+  const openSearchResult = (result) => {
+    if (result.kind === 'document') {
+      handleLoadDocument(result.id);
+    } else {
+      handleLoadConversation(result.conversation_id);
+    }
+  };
+
+  const searchKindLabels = {
+    conversation: 'Conversation',
+    answer: 'Answer',
+    document: 'Document'
+  };
+
   const confirmDelete = (type, id) => {
     setDeleteItem({ type, id });
   };
@@ -258,6 +320,27 @@ const MyContentPage = () => {
                   <FontAwesomeIcon icon={faFile} /> Documents
                 </button>
               </div>
+              <form className="search-form" onSubmit={handleSearchSubmit}>
+                <input
+                  type="search"
+                  value={searchQuery}
+                  onChange={(e) => setSearchQuery(e.target.value)}
+                  placeholder="Search conversations, answers and documents"
+                />
+                <button type="submit" title="Search" disabled={isSearching}>
+                  <FontAwesomeIcon icon={isSearching ? faSpinner : faSearch} spin={isSearching} />
+                </button>
+                {searchResults !== null && (
+                  <button type="button" title="Clear search" onClick={clearSearch}>
+                    <FontAwesomeIcon icon={faTimes} />
+                  </button>
+                )}
+              </form>
+              <div className="export-links">
+                <FontAwesomeIcon icon={faDownload} /> Export:
+                <a href="/api/user/export?format=zip">ZIP</a>
+                <a href="/api/user/export?format=ndjson">NDJSON</a>
+              </div>
             </div>
             
             {error && (
@@ -272,6 +355,45 @@ const MyContentPage = () => {
                   <FontAwesomeIcon icon={faSpinner} spin />
                   <span>Loading...</span>
                 </div>
+              ) : searchResults !== null ? (
+                <div className="items-container">
+                  {searchResults.length > 0 ? (
+                    <div className="items-list">
+                      {searchResults.map(result => (
+                        <div key={`${result.kind}-${result.id}`} className="item-card search-result">
+                          <div className="item-info">
+                            <span className="search-result-kind">{searchKindLabels[result.kind]}</span>
+                            {/* Snippets are escaped by the server; only the <mark> highlights are markup */}
+                            <h3 dangerouslySetInnerHTML={{ __html: result.title }} />
+                            <p className="search-snippet" dangerouslySetInnerHTML={{ __html: result.snippet }} />
+                          </div>
+                          <div className="item-actions">
+                            <button
+                              className="action-button view-button"
+                              onClick={() => openSearchResult(result)}
+                              title={result.kind === 'document' ? 'Edit document' : 'Continue conversation'}
+                            >
+                              <FontAwesomeIcon icon={result.kind === 'document' ? faEdit : faEye} />
+                            </button>
+                          </div>
+                        </div>
+                      ))}
+                      {searchOffset !== null && (
+                        <button
+                          className="load-more-button"
+                          onClick={() => runSearch(searchOffset)}
+                          disabled={isSearching}
+                        >
+                          {isSearching ? <FontAwesomeIcon icon={faSpinner} spin /> : 'More results'}
+                        </button>
+                      )}
+                    </div>
+                  ) : (
+                    <div className="empty-state">
+                      <p>No results for "{searchQuery}".</p>
+                    </div>
+                  )}
+                </div>
               ) : (
                 <div className="items-container">
                   {activeTab === 'conversations' && (
@@ -310,6 +432,15 @@ const MyContentPage = () => {
                             </div>
                           </div>
                         ))}
+                        {nextCursor && (
+                          <button
+                            className="load-more-button"
+                            onClick={loadMoreConversations}
+                            disabled={isLoadingMore}
+                          >
+                            {isLoadingMore ? <FontAwesomeIcon icon={faSpinner} spin /> : 'Load more'}
+                          </button>
+                        )}
                       </div>
                     ) : (
                       <div className="empty-state">
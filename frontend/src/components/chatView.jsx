@@ -24,11 +24,14 @@ const ChatView = () => {
     esrsSector: 'Not determined yet'
   });
   const [isLoggedIn, setIsLoggedIn] = useState(false);
+  const [olderMessages, setOlderMessages] = useState({ hasMore: false, oldestId: null });
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
 
   const chatContainerRef = useRef(null);
   const textareaRef = useRef(null);
   const navigate = useNavigate();
   const isLoadingRef = useRef(false);
+  const scrollAnchorRef = useRef(null);
 
   const [placeholderText, setPlaceholder] = useState("Enter your company description...");
   const [companyDesc, setCompanyDesc] = useState('');
@@ -57,8 +60,15 @@ const ChatView = () => {
   };
 
   useEffect(() => {
-    if (chatContainerRef.current) {
-      chatContainerRef.current.scrollTop = chatContainerRef.current.scrollHeight;
+    const container = chatContainerRef.current;
+    if (!container) return;
+    
+    if (scrollAnchorRef.current !== null) {
+      // Older messages were prepended: keep the view where it was
+      container.scrollTop = container.scrollHeight - scrollAnchorRef.current;
+      scrollAnchorRef.current = null;
+    } else {
+      container.scrollTop = container.scrollHeight;
     }
   }, [messages]);
 
@@ -69,7 +79,7 @@ const ChatView = () => {
   try {
     if (conversationIdParam) {
       // Load specific conversation into session
-      const loadResponse = await fetch(`/api/chat/load_conversation/${conversationIdParam}`, {
+      const loadResponse = await fetch(`/api/chat/load_conversation/${conversationIdParam}?limit=0`, {
         method: 'POST',
         credentials: 'include'
       });
@@ -101,6 +111,7 @@ const ChatView = () => {
         if (data.messages && data.messages.length > 0) {
           setMessages(data.messages);
         }
+        setOlderMessages({ hasMore: data.has_more, oldestId: data.oldest_id });
         
         if (data.conversation_id) {
           setConversationId(data.conversation_id);
@@ -118,6 +129,32 @@ const ChatView = () => {
     fetchConversation();
   }, []);
 
+  const loadOlderMessages = async () => {
+    if (isLoadingOlder || !olderMessages.oldestId) return;
+    setIsLoadingOlder(true);
+    
+    try {
+      const response = await fetch(`/api/chat/get_conversation?before_id=${olderMessages.oldestId}`, {
+        method: 'GET',
+        credentials: 'include'
+      });
+      
+      if (response.ok) {
+        const data = await response.json();
+        if (chatContainerRef.current) {
+          const container = chatContainerRef.current;
+          scrollAnchorRef.current = container.scrollHeight - container.scrollTop;
+        }
+        setMessages(previous => [...data.messages, ...previous]);
+        setOlderMessages({ hasMore: data.has_more, oldestId: data.oldest_id });
+      }
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!inputValue.trim() || isLoading) return;
   
@@ -179,6 +216,7 @@ const ChatView = () => {
             isWelcome: true
           }
         ]);
+        setOlderMessages({ hasMore: false, oldestId: null });
         setInputValue('');
         setCompanyInfo({
           initialized: false,
@@ -243,6 +281,15 @@ const ChatView = () => {
           )}
           
           <div className="chat-container" ref={chatContainerRef}>
+            {olderMessages.hasMore && (
+              <button 
+                className="older-messages-button"
+                onClick={loadOlderMessages}
+                disabled={isLoadingOlder}
+              >
+                <FontAwesomeIcon icon={faHistory} /> {isLoadingOlder ? 'Loading...' : 'Show earlier messages'}
+              </button>
+            )}
             {messages.map((message, index) => (
               <div 
                 key={index} 
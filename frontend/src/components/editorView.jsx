@@ -10,6 +10,29 @@ import { faEdit, faCheck, faTimes, faHistory } from '@fortawesome/free-solid-svg
 import Header from './Header';
 import '../styles/editorView.css';
 
+// Single splice turning `previous` into `next`: common prefix and suffix are kept.
+// Never cuts a surrogate pair, so the server can apply it to UTF-16 positions.
+const spliceDiff = (previous, next) => {
+  const isHigh = (code) => code >= 0xd800 && code <= 0xdbff;
+  const isLow = (code) => code >= 0xdc00 && code <= 0xdfff;
+  const limit = Math.min(previous.length, next.length);
+  
+  let start = 0;
+  while (start < limit && previous.charCodeAt(start) === next.charCodeAt(start)) start++;
+  if (start > 0 && isHigh(previous.charCodeAt(start - 1))) start--;
+  
+  let end = 0;
+  while (end < limit - start &&
+         previous.charCodeAt(previous.length - 1 - end) === next.charCodeAt(next.length - 1 - end)) end++;
+  if (end > 0 && isLow(previous.charCodeAt(previous.length - end))) end--;
+  
+  return {
+    at: start,
+    delete: previous.length - start - end,
+    insert: next.slice(start, next.length - end)
+  };
+};
+
 const EditorView = () => {
   const [content, setContent] = useState('');
   const [isDownloading, setIsDownloading] = useState(false);
@@ -24,10 +47,13 @@ const EditorView = () => {
   const [tempName, setTempName] = useState('');
   const [showHistory, setShowHistory] = useState(false);
   const [documentHistory, setDocumentHistory] = useState([]);
+  const [documentVersions, setDocumentVersions] = useState([]);
   
   const quillRef = useRef(null);
   const nameInputRef = useRef(null);
   const saveTimeoutRef = useRef(null);
+  // Content and version the server last acknowledged; autosave sends patches against them
+  const savedRef = useRef({ content: null, version: null });
   const navigate = useNavigate();
 
   const modules = {
@@ -116,6 +142,48 @@ const EditorView = () => {
     }
   };
 
+  // Load the stored versions of the current document
+  const loadDocumentVersions = async (documentId) => {
+    try {
+      const response = await fetch(`/api/user/document/${documentId}/versions?limit=20`, {
+        method: 'GET',
+        credentials: 'include'
+      });
+      
+      if (response.ok) {
+        const data = await response.json();
+        setDocumentVersions(data.versions);
+      }
+    } catch (error) {
+      console.error('Error loading document versions:', error);
+    }
+  };
+
+  const restoreVersion = async (version) => {
+    if (!currentDocument?.id) return;
+    
+    try {
+      const response = await fetch(`/api/user/document/${currentDocument.id}/versions/${version}/restore`, {
+        method: 'POST',
+        credentials: 'include'
+      });
+      
+      if (response.ok) {
+        const data = await response.json();
+        if (saveTimeoutRef.current) {
+          clearTimeout(saveTimeoutRef.current);
+        }
+        savedRef.current = { content: data.content, version: data.version };
+        setContent(data.content);
+        setSaveStatus('saved');
+        setLastSaved(new Date());
+        loadDocumentVersions(currentDocument.id);
+      }
+    } catch (error) {
+      console.error('Error restoring version:', error);
+    }
+  };
+
   // Load specific document
   const loadDocument = async (documentId) => {
     try {
@@ -126,9 +194,11 @@ const EditorView = () => {
       
       if (response.ok) {
         const docData = await response.json();
+        savedRef.current = { content: docData.content || '', version: docData.version ?? null };
         setContent(docData.content || '');
         setDocumentName(docData.name);
         setCurrentDocument(docData);
+        setDocumentVersions([]);
         setLastSaved(new Date(docData.updated_at || docData.created_at));
         setSaveStatus('saved');
       }
@@ -137,45 +207,96 @@ const EditorView = () => {
     }
   };
 
+  // Send only what changed since the last acknowledged version
+  const patchSave = async (documentId, contentToSave) => {
+    const saved = savedRef.current;
+    const response = await fetch(`/api/user/document/${documentId}`, {
+      method: 'PATCH',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({
+        base_version: saved.version,
+        ops: [spliceDiff(saved.content, contentToSave)],
+        length: contentToSave.length
+      }),
+      credentials: 'include'
+    });
+    
+    const data = await response.json();
+    if (response.status === 409 && data.status === 'retry') {
+      // Another server process still holds newer edits; try again once it has written them
+      return { retryAfter: data.retry_after };
+    }
+    if (response.status === 409) {
+      // The document changed elsewhere: fall back to saving the whole content, as before
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error(data.message || 'Error saving content');
+    }
+    return data;
+  };
+
+  const fullSave = async (contentToSave) => {
+    const formData = new FormData();
+    formData.append('content', contentToSave);
+    
+    if (currentDocument?.id) {
+      formData.append('document_id', currentDocument.id);
+    }
+
+    const response = await fetch('/api/user/documents/autosave', {
+      method: 'POST',
+      body: formData,
+      credentials: 'include'
+    });
+    
+    if (!response.ok) {
+      throw new Error('Error saving content');
+    }
+    return response.json();
+  };
+
   // Auto-save function
   const autoSave = useCallback(async (contentToSave) => {
     if (!isAuthenticated || !contentToSave.trim()) {
       return;
     }
 
+    if (savedRef.current.content === contentToSave) {
+      setSaveStatus('saved');
+      return;
+    }
+
     setSaveStatus('saving');
     
     try {
-      const formData = new FormData();
-      formData.append('content', contentToSave);
-      
-      if (currentDocument?.id) {
-        formData.append('document_id', currentDocument.id);
-      }
-
-      const response = await fetch('/api/user/documents/autosave', {
-        method: 'POST',
-        body: formData,
-        credentials: 'include'
-      });
-
-      if (response.ok) {
-        const data = await response.json();
-        setSaveStatus('saved');
-        setLastSaved(new Date(data.last_saved));
-        
-        // Update current document if this was a new document
-        if (data.document_id && !currentDocument?.id) {
-          setCurrentDocument({
-            id: data.document_id,
-            name: documentName,
-            content: contentToSave
-          });
-          loadDocumentHistory(); // Refresh history
+      let data = null;
+      if (currentDocument?.id && savedRef.current.version !== null) {
+        data = await patchSave(currentDocument.id, contentToSave);
+        if (data?.retryAfter !== undefined) {
+          setSaveStatus('unsaved');
+          saveTimeoutRef.current = setTimeout(() => autoSave(contentToSave), data.retryAfter * 1000);
+          return;
         }
-      } else {
-        setSaveStatus('error');
-        console.error('Error saving content');
+      }
+      if (!data) {
+        data = await fullSave(contentToSave);
+      }
+      
+      savedRef.current = { content: contentToSave, version: data.version ?? null };
+      setSaveStatus('saved');
+      setLastSaved(new Date(data.last_saved));
+      
+      // Update current document if this was a new document
+      if (data.document_id && !currentDocument?.id) {
+        setCurrentDocument({
+          id: data.document_id,
+          name: documentName,
+          content: contentToSave
+        });
+        loadDocumentHistory(); // Refresh history
       }
     } catch (error) {
       console.error('Error auto-saving:', error);
@@ -266,6 +387,8 @@ const EditorView = () => {
 
   // New document
   const createNewDocument = () => {
+    savedRef.current = { content: null, version: null };
+    setDocumentVersions([]);
     setContent('');
     setCurrentDocument(null);
     setDocumentName('Untitled Document');
@@ -544,6 +667,31 @@ const EditorView = () => {
                     ))
                   )}
                 </div>
+                {currentDocument?.id && (
+                  <div className="versions-section">
+                    <div className="history-header">
+                      <h3>Versions</h3>
+                      <button className="new-doc-btn" onClick={() => loadDocumentVersions(currentDocument.id)}>
+                        <FontAwesomeIcon icon={faHistory} /> Show
+                      </button>
+                    </div>
+                    <div className="history-list">
+                      {documentVersions.map(item => (
+                        <div key={item.version} className="history-item version-item">
+                          <div>
+                            <div className="doc-name">Version {item.version}</div>
+                            <div className="doc-date">{formatDate(item.created_at)}</div>
+                          </div>
+                          {item.version !== savedRef.current.version && (
+                            <button className="restore-btn" onClick={() => restoreVersion(item.version)}>
+                              Restore
+                            </button>
+                          )}
+                        </div>
+                      ))}
+                    </div>
+                  </div>
+                )}
               </div>
             )}
             
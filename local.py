@@ -1,21 +1,38 @@
 import os
+import sys
 import json
 import re
 import warnings
+import argparse
 import faiss
 import pickle
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_huggingface import HuggingFaceEmbeddings
 from sentence_transformers import CrossEncoder
-from langchain_community.llms import Ollama
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from llm_backends import create_router, load_backend_config, benchmark_backends, print_benchmark, LOCAL_BACKENDS
 
 warnings.filterwarnings("ignore")
 
+# Los backends se configuran igual que en el servidor (LLM_BACKENDS / LLM_BACKENDS_FILE).
+# Sin configuración se usa el Ollama local, para poder trabajar sin conexión.
+parser = argparse.ArgumentParser(description="ESGenerator command line client")
+parser.add_argument("--benchmark", action="store_true", help="Compare tokens/sec and latency of the configured backends")
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--concurrency", type=int, default=1)
+args = parser.parse_args()
+
+router = create_router(load_backend_config(LOCAL_BACKENDS))
+
+if args.benchmark:
+    print_benchmark(benchmark_backends(router, runs=args.runs, concurrency=args.concurrency))
+    sys.exit(0)
+
 # Cargar FAISS desde archivo
 def load_vectorstore(db_folder):
     """Carga el vectorstore desde su carpeta correspondiente."""
-    db_path = os.path.join("vectorstores", db_folder)
+    db_path = os.path.join(BACKEND_DIR, "vectorstores", db_folder)
 
     index = faiss.read_index(os.path.join(db_path, "index.faiss"))
 
@@ -28,16 +45,16 @@ def load_vectorstore(db_folder):
 
 reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L6-v2")
 
-llm = Ollama(model="llama3.2:1b", temperature=0.2, num_ctx=2048)
+def retrieve(vectorstore, query, k, top_n):
+    docs = vectorstore.similarity_search(query, k=k)
+    if not docs:
+        return ""
+    scores = reranker.predict([(query, doc.page_content) for doc in docs])
+    ranked = sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)[:top_n]
+    return "\n".join(doc.page_content for _, doc in ranked)
 
-def load_chain(llm, vectorstore):
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})  # Búsqueda híbrida
-    return RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True
-    )
+def ask(task, prompt):
+    return router.complete(task, [{"role": "user", "content": prompt}], temperature=0.2)
 
 print("Welcome to ESGenerator")
 print("Loading vectorstores...")
@@ -47,12 +64,12 @@ default_vs = load_vectorstore("default_db")
 
 company_desc = input("Describe your company so I can know which sector it belongs: ")
 
-nace_chain = load_chain(llm, nace_vs)
+nace_context = retrieve(nace_vs, company_desc, k=10, top_n=3)
 nace_sector = None
 
 for _ in range(2):
-    result = nace_chain({"query": f"According to NACE, which sector CODE does this company belong to: {company_desc}? Only the code."})
-    match = re.search(r'([A-U](\d{1,2})(\.\d{1,2}){0,2})', result['result'].strip())
+    result = ask("nace", f"According to NACE, which sector CODE does this company belong to: {company_desc}? Only the code.\n\nContext:\n{nace_context}")
+    match = re.search(r'([A-U](\d{1,2})(\.\d{1,2}){0,2})', result.strip())
     
     if match:
         nace_sector = match.group(1)
@@ -63,7 +80,7 @@ if not nace_sector:
     nace_sector = "agnostic"
     print("Could not determine exact NACE code. Using agnostic standards.")
 
-with open("sector_classification.json", "r", encoding="utf-8") as f:
+with open(os.path.join(BACKEND_DIR, "sector_classification.json"), "r", encoding="utf-8") as f:
     special_sectors = json.load(f)
 
 esrs_sector = special_sectors.get(nace_sector, "nothing else")
@@ -84,8 +101,6 @@ if esrs_sector in sector_db_map:
     else:
         print(f"Warning: Could not merge {esrs_sector}. Using default database.")
 
-qa_chain = load_chain(llm, qa_vs)
-
 conversation_history = [
     f"Company description: {company_desc}",
     f"NACE sector code: {nace_sector}",
@@ -96,15 +111,7 @@ print("Ask your questions:")
 while True:
     question = input("\nQ: ")
     
-    retrieved_docs = qa_vs.similarity_search(question, k=10)
-
-    ranked_docs = sorted(
-        retrieved_docs, 
-        key=lambda doc: reranker.predict([(question, doc.page_content)]), 
-        reverse=True
-    )[:5]
-
-    context = "\n".join([doc.page_content for doc in ranked_docs])
+    context = retrieve(qa_vs, question, k=10, top_n=5)
     print(context)
     contextual_query = f"""
     Answer based on previous conversation and company information.
@@ -113,10 +120,12 @@ while True:
     {context}
     
     Question: {question}
+
+    Previous conversation:
+    {conversation_history}
     """
 
-    result = qa_chain({"query": contextual_query})
-    answer = result.get('result', '').strip()
+    answer = ask("answer", contextual_query)
 
     
     print(f"\nA: {answer}\n")
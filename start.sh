@@ -121,19 +121,9 @@ fi
 
 echo "✅ All tests passed - starting server..."
 
-# Start with memory-optimized Gunicorn settings
-exec gunicorn \
-    --bind 0.0.0.0:$PORT \
-    --workers 1 \
-    --worker-class sync \
-    --worker-connections 100 \
-    --timeout 300 \
-    --keepalive 5 \
-    --max-requests 500 \
-    --max-requests-jitter 50 \
-    --preload \
-    --access-logfile - \
-    --error-logfile - \
-    --log-level warning \
-    --capture-output \
-    app:app
\ No newline at end of file
+# Start with memory-optimized Gunicorn settings: a single process whose
+# threads share the loaded models (see gunicorn.conf.py)
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+export GUNICORN_MAX_REQUESTS=${GUNICORN_MAX_REQUESTS:-500}
+export GUNICORN_LOG_LEVEL=${GUNICORN_LOG_LEVEL:-warning}
+exec gunicorn -c gunicorn.conf.py --capture-output app:app
\ No newline at end of file